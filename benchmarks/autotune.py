@@ -0,0 +1,164 @@
+"""
+Sweeps the runner worker layouts of the `serving` config section and
+writes out the one with the best throughput per core.
+
+Every combination of runner workers, intra-op threads per worker and
+pinning that fits the runner cores is laid out by
+`src.api.topology.worker_layout`, exactly as the service would, and run
+as that many processes. Each process pins itself and sets its threads like
+a runner worker, then scores the benchmark corpus in batches of
+`batching.max_batch_size` for `--duration` seconds. The throughput of all
+processes together, divided by the number of runner cores, ranks the
+combinations, so a layout that leaves cores idle pays for them. With a
+long-query runner configured, every layout has two runners, both fed
+with the whole corpus. The HTTP server, preprocessing and the API workers
+are not part of the measurement.
+
+Usage:
+    python -m benchmarks.autotune --fast-tables data/fast_preprocessing.json \
+        --output results/serving_autotune.yaml
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+import yaml
+from benchmarks.utils import load_sequences
+
+SERVICE_CONFIG = Path('src/api/service_config.yaml')
+
+
+def run_worker(cores: Optional[List[int]], threads: int, model_tag: str,
+               sequences: List[List[int]], pad_idx: int, batch_size: int,
+               boundaries: List[int], duration: float, barrier,
+               results) -> None:
+    """
+    Scores `sequences` in a loop for `duration` seconds like a runner
+    worker with the given cores and threads, and reports the throughput.
+    """
+    import torch
+    from benchmarks.utils import load_classifier
+    from src.models.batching import batched_logits
+
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    model = load_classifier(model_tag)
+    batches = itertools.cycle([sequences[i:i + batch_size]
+                               for i in range(0, len(sequences), batch_size)])
+
+    def forward(x, lengths):
+        return model(x, lengths=lengths)
+
+    with torch.no_grad():
+        batched_logits(forward, next(batches), pad_idx, boundaries)
+        barrier.wait()
+        scored, start = 0, time.perf_counter()
+        while time.perf_counter() - start < duration:
+            batch = next(batches)
+            batched_logits(forward, batch, pad_idx, boundaries)
+            scored += len(batch)
+    results.put(scored / (time.perf_counter() - start))
+
+
+def measure(serving: dict, runners: int, args, sequences, pad_idx: int,
+            batching: dict) -> float:
+    """
+    Returns the queries per second of all runner workers of a layout.
+    """
+    from src.api.topology import worker_layout
+
+    context = multiprocessing.get_context('spawn')
+    layout = worker_layout(serving, runners)
+    barrier = context.Barrier(len(layout))
+    results = context.Queue()
+    workers = [context.Process(target=run_worker, args=(
+        cores, threads, args.model_tag, sequences, pad_idx,
+        batching['max_batch_size'], batching['bucket_boundaries'],
+        args.duration, barrier, results)) for threads, cores in layout]
+    for worker in workers:
+        worker.start()
+    throughput = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    return throughput
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--fast-tables', type=Path, default=None)
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--config', type=Path, default=SERVICE_CONFIG)
+    parser.add_argument('--runner-cores', type=int, nargs='+', default=None,
+                        help='Cores of the runners; defaults to '
+                             'serving.runner_cores or all cores')
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='Runner workers per runner to try; defaults '
+                             'to the powers of two that fit the cores')
+    parser.add_argument('--threads', type=int, nargs='+', default=None,
+                        help='Threads per worker to try; defaults to the '
+                             'powers of two that fit the cores')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='Seconds every layout is measured for')
+    parser.add_argument('--output', type=Path,
+                        default=Path('results/serving_autotune.yaml'))
+    args = parser.parse_args()
+
+    from src.api.topology import runner_cores
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    runners = 1 if config['batching']['long_queries']['threshold'] is None \
+        else 2
+    serving = dict(config['serving'])
+    if args.runner_cores:
+        serving['runner_cores'] = args.runner_cores
+    cores = runner_cores(serving)
+    powers = [2 ** i for i in range(len(cores).bit_length())]
+    sequences, vocab = load_sequences(args.corpus, args.size,
+                                      fast_tables=args.fast_tables)
+    print(f"{len(sequences)} queries, {len(cores)} runner cores, "
+          f"{runners} runner(s)")
+
+    records = []
+    for workers, threads, pin in itertools.product(
+            args.workers or powers, args.threads or powers, (False, True)):
+        # One single-threaded worker per runner is the smallest layout.
+        if (workers * runners * threads > len(cores)
+                and (workers, threads) != (1, 1)):
+            continue
+        layout = dict(serving, runner_workers=workers, torch_threads=threads,
+                      pin_workers=pin)
+        throughput = measure(layout, runners, args, sequences,
+                             vocab['<PAD>'], config['batching'])
+        records.append({'serving': layout, 'throughput': throughput,
+                        'per_core': throughput / len(cores)})
+        print(f"{workers:3d} workers x {threads:3d} threads  "
+              f"pinned {str(pin):5s}  {throughput:9.0f} queries/s  "
+              f"{throughput / len(cores):8.0f} per core")
+    if not records:
+        raise SystemExit("No layout fits the runner cores.")
+
+    best = max(records, key=lambda row: row['per_core'])
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(f"# Written by benchmarks/autotune.py on "
+                f"{datetime.now(timezone.utc).isoformat()}: "
+                f"{best['throughput']:.0f} queries/s on {len(cores)} runner "
+                f"cores. Copy into src/api/service_config.yaml.\n")
+        yaml.safe_dump({'serving': best['serving']}, f, sort_keys=False)
+    print(f"Best layout written to {args.output}:")
+    print(json.dumps(best['serving']))
+
+
+if __name__ == '__main__':
+    main()
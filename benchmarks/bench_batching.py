@@ -0,0 +1,72 @@
+"""
+Throughput benchmark of batch-1 inference against adaptive micro-batching
+on the CPU.
+
+The batch-1 mode runs one forward pass per query, as the service did before
+the batchable runner. The adaptive mode replays the corpus in bursts of
+`--max-batch-size` queries through `batched_logits`, which is what the
+runner does with a full batching window.
+
+Usage:
+    python -m benchmarks.bench_batching --corpus queries.jsonl
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+import torch
+from benchmarks.utils import load_classifier, load_corpus
+from src.data_preprocessing.text_processing import clean_text, lemmatizer
+from src.data_preprocessing.text_processing import numericalize
+from src.models.batching import batched_logits
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--bucket-boundaries', type=int, nargs='+',
+                        default=[16, 32, 64])
+    args = parser.parse_args()
+
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    model = load_classifier(args.model_tag)
+    sequences = []
+    for text in load_corpus(args.corpus, args.size):
+        cleaned = clean_text(text)
+        if cleaned:
+            sequences.append(numericalize(vocab, lemmatizer(cleaned))[0])
+
+    def forward(x, lengths):
+        return model(x, lengths=lengths)
+
+    with torch.no_grad():
+        start = time.perf_counter()
+        single = torch.cat([model(torch.tensor([seq])) for seq in sequences])
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = torch.cat([
+            batched_logits(forward, sequences[i:i + args.max_batch_size],
+                           vocab['<PAD>'], args.bucket_boundaries)
+            for i in range(0, len(sequences), args.max_batch_size)
+        ])
+        batched_time = time.perf_counter() - start
+
+    print(f"queries: {len(sequences)}, torch threads: "
+          f"{torch.get_num_threads()}")
+    print(f"batch 1:            {len(sequences) / single_time:10.1f} req/s")
+    print(f"adaptive (<= {args.max_batch_size:3d}): "
+          f"{len(sequences) / batched_time:10.1f} req/s")
+    print(f"speed-up:           {single_time / batched_time:10.2f}x")
+    print(f"max |logit diff|:   "
+          f"{(single - batched).abs().max().item():10.2e}")
+
+
+if __name__ == '__main__':
+    main()
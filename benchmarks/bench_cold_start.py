@@ -0,0 +1,137 @@
+"""
+Cold-start time of the service, from process start to the first response.
+
+In the default 'stages' mode every run starts a fresh Python process that
+imports the preprocessing modules, preprocesses one query and runs one
+forward pass, and reports the time of each stage. In 'serve' mode every run
+starts `bentoml serve` and measures the time until the first /inference
+request succeeds, which includes the optional warm-up.
+
+Usage:
+    python -m benchmarks.bench_cold_start --runs 5
+    python -m benchmarks.bench_cold_start --mode serve --runs 3
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+QUERY = 'I am still waiting on my card'
+
+
+def run_stages(model_tag: str, fast_tables: str) -> None:
+    """
+    Runs the stages of a cold start in this process and prints their
+    cumulative times in milliseconds as JSON.
+    """
+    start = time.perf_counter()
+    times = {}
+
+    from src.data_preprocessing import text_processing
+    from src.data_preprocessing.fast_text_processing import \
+        load_fast_preprocessor
+    times['import'] = time.perf_counter() - start
+
+    with open('data/vocab.json', 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    if fast_tables:
+        tokens = load_fast_preprocessor(fast_tables).process(QUERY)
+    else:
+        tokens = text_processing.lemmatizer(text_processing.clean_text(QUERY))
+    sequence = text_processing.numericalize(vocab, tokens)
+    times['preprocess'] = time.perf_counter() - start
+
+    import torch
+    from benchmarks.utils import load_classifier
+    model = load_classifier(model_tag)
+    times['load_model'] = time.perf_counter() - start
+
+    with torch.no_grad():
+        model(torch.tensor(sequence))
+    times['first_response'] = time.perf_counter() - start
+
+    print(json.dumps({k: v * 1000 for k, v in times.items()}))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_serve(timeout: float) -> float:
+    """
+    Starts `bentoml serve` and returns the milliseconds until the first
+    successful /inference response.
+    """
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        ['bentoml', 'serve', 'src.api.service:svc', '--port', str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{port}/inference', data=QUERY.encode('utf-8'),
+        headers={'Content-Type': 'text/plain'})
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError('bentoml serve exited during startup')
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as r:
+                    r.read()
+                return (time.perf_counter() - start) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        raise TimeoutError(f'No response within {timeout} seconds')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--mode', choices=['stages', 'serve'],
+                        default='stages')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--fast-tables', default='',
+                        help='Use the fast preprocessing tables at this path')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--child', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_stages(args.model_tag, args.fast_tables)
+        return
+
+    if args.mode == 'serve':
+        times = [time_serve(args.timeout) for _ in range(args.runs)]
+        print(f"first response  median {statistics.median(times):9.1f} ms  "
+              f"min {min(times):9.1f} ms")
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_cold_start', '--child',
+             '--model-tag', args.model_tag,
+             '--fast-tables', args.fast_tables],
+            check=True, capture_output=True, text=True, env=os.environ)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    for stage in runs[0]:
+        times = [run[stage] for run in runs]
+        print(f"{stage:15s} median {statistics.median(times):9.1f} ms  "
+              f"min {min(times):9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Load test of the /inference and /submit_feedback APIs at increasing numbers
+of in-flight requests.
+
+The service runs as `bentoml serve` against the local PostgREST stand-in of
+`bench_supabase_pool.py` (see `benchmarks.suite.serve_stand_in`). At every
+concurrency level, that many closed-loop clients send requests back to back
+until the corpus is exhausted, and the throughput, the latency percentiles
+and the speedup over a single in-flight request are reported. Feedback
+requests reference the query ids returned by /inference. Requests the
+runner rejects with 503 because they would exceed
+`batching.max_latency_ms` are counted separately and left out of the
+latencies. With synchronous APIs, the requests of a worker queue behind
+each other and the throughput stays flat as the concurrency grows.
+
+Usage:
+    python -m benchmarks.bench_concurrency --concurrency 1 8 32 128 \
+        --size 2000
+"""
+
+import argparse
+import json
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from benchmarks.suite import post, serve_stand_in
+from benchmarks.utils import load_corpus, summarize
+
+
+def load(func, items: list, concurrency: int) -> dict:
+    """
+    Calls `func` on every item from `concurrency` threads.
+    """
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            result = func(item)
+        except urllib.error.HTTPError as e:
+            if e.code != 503:
+                raise
+            return None, None
+        return (time.perf_counter() - start) * 1000, result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = [row for row in pool.map(timed, items)
+                   if row[0] is not None]
+    summary = summarize([latency for latency, _ in results], len(results),
+                        time.perf_counter() - start)
+    summary['rejected'] = len(items) - len(results)
+    summary['results'] = [result for _, result in results]
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 8, 32, 128])
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--port', type=int, default=3999)
+    parser.add_argument('--startup-timeout', type=float, default=180.0)
+    parser.add_argument('--output', type=Path, default=None,
+                        help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.size)
+    records = []
+    with serve_stand_in(args.port, args.startup_timeout) as (base, _):
+        def infer(text):
+            body = post(f'{base}/inference', text.encode('utf-8'),
+                        'text/plain')
+            return json.loads(body)['query_id']
+
+        def feedback(query_id):
+            post(f'{base}/submit_feedback', json.dumps(
+                {'query_id': query_id, 'is_correct': True}).encode('utf-8'),
+                'application/json')
+
+        load(infer, texts[:50], 8)
+        for concurrency in args.concurrency:
+            summary = load(infer, texts, concurrency)
+            query_ids = summary.pop('results')
+            records.append({'name': 'inference', 'concurrency': concurrency,
+                            **summary})
+            summary = load(feedback, query_ids, concurrency)
+            summary.pop('results')
+            records.append({'name': 'submit_feedback',
+                            'concurrency': concurrency, **summary})
+
+    baseline = {row['name']: row['throughput'] for row in records
+                if row['concurrency'] == args.concurrency[0]}
+    for row in records:
+        row['speedup'] = row['throughput'] / baseline[row['name']]
+        print(f"{row['name']:16s} in-flight {row['concurrency']:4d} "
+              f"{row['throughput']:8.1f} req/s  x{row['speedup']:5.2f}  "
+              f"p50 {row['p50_ms']:8.2f}  p95 {row['p95_ms']:8.2f}  "
+              f"p99 {row['p99_ms']:8.2f} ms  {row['rejected']} rejected")
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Throughput of the bulk /submit_feedback_batch API against one
+/submit_feedback request per feedback item.
+
+The service runs as `bentoml serve` against the local PostgREST stand-in of
+`bench_supabase_pool.py` (see `benchmarks.suite.serve_stand_in`). Both APIs
+receive the same feedback items, a tenth of them repeating a query id and a
+quarter of them correcting the predicted intent, from the same number of
+closed-loop clients. The bulk API sends them in batches of `--batch-size`.
+Throughput is reported in feedback items per second. The per-request costs
+(HTTP, validation, one local buffer transaction) are paid once per batch
+instead of once per item.
+
+Usage:
+    python -m benchmarks.bench_feedback --items 5000 --batch-size 1 10 100 \
+        --concurrency 8
+"""
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from benchmarks.bench_concurrency import load
+from benchmarks.suite import post, serve_stand_in
+from src.utils.label_mapping import label_mapping
+
+
+def feedback_items(count: int, seed: int = 0) -> list:
+    """
+    Returns `count` feedback items, a tenth of them on a repeated query id.
+    """
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        query_id = (rng.randrange(1, i + 1) if i and rng.random() < 0.1
+                    else 10 ** 12 + i)
+        item = {'query_id': query_id, 'is_correct': rng.random() >= 0.25}
+        if not item['is_correct']:
+            item['corrected_intent'] = label_mapping[
+                rng.randrange(len(label_mapping))]
+        items.append(item)
+    return items
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, nargs='+',
+                        default=[1, 10, 100])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--port', type=int, default=3999)
+    parser.add_argument('--startup-timeout', type=float, default=180.0)
+    parser.add_argument('--output', type=Path, default=None,
+                        help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    items = feedback_items(args.items)
+    records = []
+    with serve_stand_in(args.port, args.startup_timeout) as (base, _):
+        def single(item):
+            post(f'{base}/submit_feedback', json.dumps(item).encode('utf-8'),
+                 'application/json')
+
+        def bulk(batch):
+            post(f'{base}/submit_feedback_batch',
+                 json.dumps(batch).encode('utf-8'), 'application/json')
+
+        load(single, items[:100], args.concurrency)
+        runs = [('submit_feedback', 1, single, items)]
+        runs += [('submit_feedback_batch', size, bulk,
+                  [items[i:i + size] for i in range(0, len(items), size)])
+                 for size in args.batch_size]
+        for name, size, func, requests in runs:
+            start = time.perf_counter()
+            summary = load(func, requests, args.concurrency)
+            elapsed = time.perf_counter() - start
+            summary.pop('results')
+            records.append({'name': name, 'batch_size': size,
+                            'concurrency': args.concurrency,
+                            'requests': len(requests), **summary,
+                            'items_per_s': len(items) / elapsed})
+
+    baseline = records[0]['items_per_s']
+    for row in records:
+        row['speedup'] = row['items_per_s'] / baseline
+        print(f"{row['name']:22s} batch {row['batch_size']:4d} "
+              f"{row['items_per_s']:9.0f} items/s  x{row['speedup']:6.2f}  "
+              f"p50 {row['p50_ms']:8.2f}  p99 {row['p99_ms']:8.2f} ms/request")
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
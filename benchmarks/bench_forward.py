@@ -0,0 +1,105 @@
+"""
+Time and memory allocated per forward pass of the IntentClassifier before
+and after skipping the zero-state allocation and the post-processing of the
+full LSTM output.
+
+The 'legacy' forward replays the previous implementation: explicit zero
+`h0`/`c0` tensors, GELU and dropout over the whole (batch, seq, 2*hidden)
+output and, for padded batches, unpacking the full output before selecting
+the last valid token. Allocations are summed from the PyTorch profiler.
+
+Usage:
+    python -m benchmarks.bench_forward --batch-sizes 1 16 64 --length 12
+"""
+
+import argparse
+import random
+import time
+import torch
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+from torch.profiler import ProfilerActivity, profile
+from benchmarks.utils import load_classifier
+from src.models.batching import pad_batch
+
+
+def legacy_forward(model, x, lengths):
+    """
+    The forward pass of the IntentClassifier before the optimization.
+    """
+    shape = (model.config['num_layers'] * 2, x.size(0),
+             model.config['hidden_size'])
+    h0, c0 = torch.zeros(shape), torch.zeros(shape)
+    x = model.embedding(x)
+    lengths = lengths.cpu()
+    packed = pack_padded_sequence(x, lengths, batch_first=True,
+                                  enforce_sorted=False)
+    x, _ = model.bi_lstm(packed, (h0, c0))
+    x, _ = pad_packed_sequence(x, batch_first=True)
+    x = model.act1(model.dropout_bilstm(x))
+    x = x[torch.arange(x.size(0)), lengths - 1]
+    x = model.act_lin1(model.dropout_linear1(model.norm1(model.linear1(x))))
+    x = model.act_lin2(model.dropout_linear2(model.norm2(model.linear2(x))))
+    return model.output(x)
+
+
+def allocated_bytes(forward, x, lengths) -> int:
+    with profile(activities=[ProfilerActivity.CPU],
+                 profile_memory=True) as prof:
+        forward(x, lengths)
+    return sum(event.self_cpu_memory_usage
+               for event in prof.key_averages()
+               if event.self_cpu_memory_usage > 0)
+
+
+def time_ms(forwards, x, lengths, repeats: int, rounds: int = 5) -> dict:
+    """
+    Returns the best per-call time of every forward over interleaved
+    rounds, so that load changes on the machine affect all of them alike.
+    """
+    best = {name: float('inf') for name in forwards}
+    for _ in range(rounds):
+        for name, forward in forwards.items():
+            for _ in range(10):
+                forward(x, lengths)
+            start = time.perf_counter()
+            for _ in range(repeats // rounds):
+                forward(x, lengths)
+            best[name] = min(best[name], (time.perf_counter() - start)
+                             / (repeats // rounds) * 1000)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[1, 16, 64])
+    parser.add_argument('--length', type=int, default=12,
+                        help='Mean number of tokens per query')
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    model = load_classifier(args.model_tag)
+    forwards = {
+        'legacy': lambda x, lengths: legacy_forward(model, x, lengths),
+        'optimized': lambda x, lengths: model(x, lengths=lengths),
+    }
+    rng = random.Random(0)
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            sequences = [[rng.randrange(2, 3000) for _ in range(
+                max(1, int(rng.gauss(args.length, args.length / 3))))]
+                for _ in range(batch_size)]
+            x, lengths = pad_batch(sequences, 1)
+            diff = (forwards['legacy'](x, lengths)
+                    - forwards['optimized'](x, lengths)).abs().max().item()
+            times = time_ms(forwards, x, lengths, args.repeats)
+            for name, forward in forwards.items():
+                print(f"batch {batch_size:3d} {name:9s} {times[name]:7.3f} ms"
+                      f"  {allocated_bytes(forward, x, lengths) / 1024:9.1f}"
+                      f" KiB allocated")
+            print(f"batch {batch_size:3d} max |logit diff| {diff:.2e}")
+
+
+if __name__ == '__main__':
+    main()
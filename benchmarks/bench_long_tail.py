@@ -0,0 +1,113 @@
+"""
+Latency distribution of the /inference API on a corpus with long-tail
+query lengths.
+
+Most queries of the corpus are ordinary Banking77-style questions, while
+`--long-share` of them are pasted emails or statements whose word counts
+follow a Pareto distribution, capped at `--max-words`. The service runs as
+`bentoml serve` against the local PostgREST stand-in of
+`bench_supabase_pool.py` (see `benchmarks.suite.serve_stand_in`) with the
+settings of `src/api/service_config.yaml`, so the effect of
+`preprocessing.max_tokens` and `batching.long_queries` is measured by
+running the benchmark once per setting. The long queries are all distinct,
+so they always reach the runners. The latency percentiles are reported for
+all queries and separately for the short and the long ones.
+
+Usage:
+    python -m benchmarks.bench_long_tail --size 3000 --concurrency 16 \
+        --label truncated --output results/long_tail_truncated.json
+"""
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import List
+from benchmarks.bench_concurrency import load
+from benchmarks.suite import post, serve_stand_in
+from benchmarks.utils import load_corpus, percentile
+
+
+def long_tail_corpus(texts: List[str], long_share: float, max_words: int,
+                     seed: int = 0) -> List[dict]:
+    """
+    Replaces `long_share` of the texts by long ones built from the corpus.
+    Args:
+        texts (List[str]): Ordinary query texts.
+        long_share (float): Share of the queries that are long.
+        max_words (int): Upper bound of the words of a long query.
+        seed (int): Seed of the corpus.
+    Returns:
+        List[dict]: One {'text', 'long'} row per input text.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for index, text in enumerate(texts):
+        if rng.random() >= long_share:
+            rows.append({'text': text, 'long': False})
+            continue
+        words = min(max_words, int(50 * rng.paretovariate(1.2)))
+        parts = [f'reference {index}']
+        while sum(len(part.split()) for part in parts) < words:
+            parts.append(rng.choice(texts))
+        rows.append({'text': '. '.join(parts), 'long': True})
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=3000)
+    parser.add_argument('--long-share', type=float, default=0.05)
+    parser.add_argument('--max-words', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--label', default='configured',
+                        help='Name of the service settings under test')
+    parser.add_argument('--port', type=int, default=3999)
+    parser.add_argument('--startup-timeout', type=float, default=180.0)
+    parser.add_argument('--output', type=Path, default=None,
+                        help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    rows = long_tail_corpus(load_corpus(args.corpus, args.size),
+                            args.long_share, args.max_words)
+    with serve_stand_in(args.port, args.startup_timeout) as (base, _):
+        def infer(row):
+            start = time.perf_counter()
+            post(f'{base}/inference', row['text'].encode('utf-8'),
+                 'text/plain')
+            return row['long'], (time.perf_counter() - start) * 1000
+
+        load(infer, rows[:100], args.concurrency)
+        summary = load(infer, rows, args.concurrency)
+
+    results = summary.pop('results')
+    records = []
+    for name in ('all', 'short', 'long'):
+        latencies = [ms for long, ms in results
+                     if name == 'all' or long == (name == 'long')]
+        if not latencies:
+            continue
+        records.append({
+            'label': args.label, 'queries': name,
+            'concurrency': args.concurrency, 'count': len(latencies),
+            **{f'p{q}_ms': percentile(latencies, q) for q in (50, 95, 99)},
+            'max_ms': max(latencies),
+        })
+    records[0]['throughput'] = summary['throughput']
+    records[0]['rejected'] = summary['rejected']
+
+    for row in records:
+        print(f"{row['label']:12s} {row['queries']:5s} n={row['count']:5d}  "
+              f"p50 {row['p50_ms']:8.2f}  p95 {row['p95_ms']:8.2f}  "
+              f"p99 {row['p99_ms']:8.2f}  max {row['max_ms']:8.2f} ms")
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Time to numericalize token lists with the vocabulary dictionary against the
+memory-mapped `VocabIndex`.
+
+Per query, `numericalize` with the `vocab.json` dictionary is compared with
+per-token `VocabIndex.get` calls and with one vectorized
+`VocabIndex.lookup`. Per batch, numericalizing every query with the
+dictionary and padding the lists with `pad_batch` is compared with
+`VocabIndex.numericalize_batch` writing into a preallocated buffer. The
+batch paths of the service and of `PreprocessingPool` pass lists on, so
+the lists `text_processing.numericalize_batch` returns for a batch are
+also compared with numericalizing every query on its own. The
+token lists are drawn from the vocabulary with a share of unknown tokens,
+so the benchmark runs without the NLTK data.
+
+Usage:
+    python -m benchmarks.bench_numericalize --batch-sizes 1 16 64
+"""
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+import numpy as np
+import torch
+from src.data_preprocessing.text_processing import numericalize
+from src.data_preprocessing.text_processing import numericalize_batch
+from src.data_preprocessing.vocab_index import load_vocab_index
+from src.models.batching import pad_batch
+
+
+def time_us(funcs: dict, items: list, rounds: int = 5) -> dict:
+    """
+    Returns the best time per item of every function over interleaved
+    rounds, so that load changes on the machine affect all of them alike.
+    """
+    best = {name: float('inf') for name in funcs}
+    for _ in range(rounds):
+        for name, func in funcs.items():
+            start = time.perf_counter()
+            for item in items:
+                func(item)
+            best[name] = min(best[name], (time.perf_counter() - start)
+                             / len(items) * 1e6)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--vocab-index', type=Path,
+                        default=Path('data/vocab_index'))
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[1, 16, 64])
+    parser.add_argument('--length', type=int, default=12,
+                        help='Mean number of tokens per query')
+    parser.add_argument('--unknown', type=float, default=0.1,
+                        help='Share of tokens missing from the vocabulary')
+    parser.add_argument('--queries', type=int, default=2048)
+    args = parser.parse_args()
+
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    index = load_vocab_index(args.vocab_index)
+    words = [token for token in vocab if not token.startswith('<')]
+    rng = random.Random(0)
+    queries = [[rng.choice(words) if rng.random() > args.unknown
+                else f'oov{rng.randrange(10 ** 6)}'
+                for _ in range(max(1, int(rng.gauss(args.length,
+                                                    args.length / 3))))]
+               for _ in range(args.queries)]
+
+    for query in queries[:100]:
+        assert numericalize(index, query) == numericalize(vocab, query)
+
+    times = time_us({
+        'dict numericalize': lambda q: numericalize(vocab, q),
+        'index get': lambda q: [index.get(t, index.unk_id) for t in q],
+        'index numericalize': lambda q: numericalize(index, q),
+    }, queries)
+    print(f"per query, {args.length} tokens on average")
+    for name, us in times.items():
+        print(f"  {name:20s} {us:8.2f} us")
+
+    pad_idx = vocab['<PAD>']
+    max_length = max(map(len, queries))
+    buffer = np.empty((max(args.batch_sizes), max_length), dtype=np.int64)
+    for batch_size in args.batch_sizes:
+        batches = [queries[i:i + batch_size]
+                   for i in range(0, len(queries), batch_size)]
+        reference, _ = pad_batch(
+            [numericalize(vocab, q)[0] for q in batches[0]], pad_idx)
+        padded, _ = index.numericalize_batch(batches[0], out=buffer)
+        assert torch.equal(reference, torch.from_numpy(padded))
+        assert numericalize_batch(index, batches[0]) \
+            == [numericalize(vocab, q)[0] for q in batches[0]]
+
+        times = time_us({
+            'dict + pad_batch': lambda batch: pad_batch(
+                [numericalize(vocab, q)[0] for q in batch], pad_idx),
+            'index batch': lambda batch: index.numericalize_batch(
+                batch, out=buffer),
+            'dict lists': lambda batch: [numericalize(vocab, q)[0]
+                                         for q in batch],
+            'index lookup lists': lambda batch: [numericalize(index, q)[0]
+                                                 for q in batch],
+            'index batch lists': lambda batch: numericalize_batch(index,
+                                                                  batch),
+        }, batches)
+        print(f"batch {batch_size:3d}")
+        for name, us in times.items():
+            print(f"  {name:20s} {us:8.2f} us/batch "
+                  f"{us / batch_size:8.2f} us/query")
+
+
+if __name__ == '__main__':
+    main()
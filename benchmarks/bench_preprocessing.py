@@ -0,0 +1,64 @@
+"""
+Per-stage latency of the NLTK preprocessing pipeline against the fast path.
+
+NLTK stages: `clean_text` (tokenize, lowercase, isalpha, stopwords) and
+`lemmatizer` (tokenize, POS tag, WordNet lemmatize). Fast stages: regex
+tokenization, stopword filtering and lemma lookup, plus the whole fast
+pipeline on one batch.
+
+Usage:
+    python -m benchmarks.bench_preprocessing --corpus queries.jsonl
+"""
+
+import argparse
+import time
+from pathlib import Path
+from benchmarks.utils import load_corpus
+from src.data_preprocessing.fast_text_processing import DEFAULT_TABLES_PATH
+from src.data_preprocessing.fast_text_processing import load_fast_preprocessor
+from src.data_preprocessing.text_processing import clean_text, lemmatizer
+
+
+def timed(func, items) -> tuple:
+    start = time.perf_counter()
+    results = [func(item) for item in items]
+    return results, (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--tables', type=Path, default=DEFAULT_TABLES_PATH)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.size)
+    fast = load_fast_preprocessor(args.tables)
+
+    cleaned, clean_us = timed(clean_text, texts)
+    _, lemmatize_us = timed(lambda c: lemmatizer(c) if c else [], cleaned)
+
+    tokens, tokenize_us = timed(fast.tokenize, texts)
+    kept, stopword_us = timed(
+        lambda ts: [t for t in ts if t not in fast.stop_words], tokens)
+    _, lookup_us = timed(
+        lambda ts: [fast.lemmas.get(t, t) for t in ts], kept)
+
+    start = time.perf_counter()
+    fast.process_batch(texts)
+    batch_us = (time.perf_counter() - start) / len(texts) * 1e6
+
+    print(f"per query, {len(texts)} queries")
+    print(f"nltk  clean_text       {clean_us:9.1f} us")
+    print(f"nltk  lemmatizer       {lemmatize_us:9.1f} us")
+    print(f"nltk  total            {clean_us + lemmatize_us:9.1f} us")
+    print(f"fast  tokenize         {tokenize_us:9.1f} us")
+    print(f"fast  stopwords        {stopword_us:9.1f} us")
+    print(f"fast  lemma lookup     {lookup_us:9.1f} us")
+    print(f"fast  process_batch    {batch_us:9.1f} us")
+    print(f"speed-up               "
+          f"{(clean_us + lemmatize_us) / batch_us:9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
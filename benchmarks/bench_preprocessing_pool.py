@@ -0,0 +1,65 @@
+"""
+Throughput of the multi-process preprocessing pool by number of workers.
+
+The corpus is preprocessed once in the calling process, as the batch API
+did before, and then through `PreprocessingPool.map` with every worker
+count. The pool is started and warmed up before the clock starts, so the
+numbers exclude the worker startup. Scaling is near-linear as long as there
+are idle cores and the chunks are large enough to amortize the pickling of
+texts and token ids between the processes.
+
+Usage:
+    python -m benchmarks.bench_preprocessing_pool --workers 1 2 4 8 16 \
+        --size 50000
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+from benchmarks.utils import load_corpus
+from src.data_preprocessing import preprocessing_pool
+from src.data_preprocessing.preprocessing_pool import PreprocessingPool
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16])
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=50000)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--mode', choices=('nltk', 'fast'), default='nltk')
+    parser.add_argument('--fast-tables', type=Path,
+                        default=Path('data/fast_preprocessing.json'))
+    parser.add_argument('--vocab-index', type=Path,
+                        default=Path('data/vocab_index'))
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.size)
+    print(f"{len(texts)} texts, {args.mode} preprocessing, "
+          f"{os.cpu_count()} cores")
+
+    preprocessing_pool._init_worker(args.mode, args.fast_tables,
+                                    args.vocab_index, Path())
+    start = time.perf_counter()
+    preprocessing_pool.preprocess_texts(texts)
+    baseline = len(texts) / (time.perf_counter() - start)
+    print(f"in-process         {baseline:9.0f} texts/s")
+
+    for workers in args.workers:
+        with PreprocessingPool(workers, args.mode, args.fast_tables,
+                               args.vocab_index) as pool:
+            for future in [pool.submit(texts[:args.chunk_size])
+                           for _ in range(workers)]:
+                future.result()
+            start = time.perf_counter()
+            for _ in pool.map(texts, args.chunk_size):
+                pass
+            throughput = len(texts) / (time.perf_counter() - start)
+        print(f"{workers:3d} workers        {throughput:9.0f} texts/s  "
+              f"x{throughput / baseline:5.2f}")
+
+
+if __name__ == '__main__':
+    main()
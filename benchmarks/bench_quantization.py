@@ -0,0 +1,107 @@
+"""
+Accuracy, size and latency of the int8 classifier against the fp32 model.
+
+With `--eval`, a held-out JSONL file with a 'text' and a 'label' (intent
+name or index) per line, the accuracy of both models is reported. Without
+it, only the top-1 agreement of the two models on the benchmark corpus is.
+The int8 model is loaded from the model store, or quantized from the fp32
+model if `--quantized-tag` is not given.
+
+Usage:
+    python -m benchmarks.bench_quantization --eval heldout.jsonl \
+        --quantized-tag classifier_int8:latest
+"""
+
+import argparse
+import json
+import statistics
+from pathlib import Path
+import torch
+from benchmarks.bench_runtimes import measure
+from benchmarks.utils import load_classifier, load_sequences, percentile
+from benchmarks.utils import preprocess_texts
+from src.models.batching import batched_logits
+from src.models.quantization import model_size_bytes, quantize_classifier
+from src.utils.label_mapping import label_mapping
+
+
+def load_heldout(path: Path, vocab, fast_tables):
+    """
+    Reads and preprocesses the held-out set, skipping texts without tokens.
+    """
+    label_ids = {name: index for index, name in label_mapping.items()}
+    texts, labels = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                texts.append(row['text'])
+                label = row['label']
+                labels.append(label if isinstance(label, int)
+                              else label_ids[label])
+    pairs = [(seq, label) for seq, label
+             in zip(preprocess_texts(texts, vocab, fast_tables), labels)
+             if seq is not None]
+    return [seq for seq, _ in pairs], torch.tensor([l for _, l in pairs])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--eval', type=Path, default=None)
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--quantized-tag', default=None)
+    parser.add_argument('--fp16-embedding', action='store_true')
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--fast-tables', type=Path, default=None)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--bucket-boundaries', type=int, nargs='+',
+                        default=[16, 32, 64])
+    args = parser.parse_args()
+
+    sequences, vocab = load_sequences(args.corpus, args.size, args.vocab,
+                                      args.fast_tables)
+    pad_idx = vocab['<PAD>']
+    model = load_classifier(args.model_tag)
+    if args.quantized_tag:
+        quantized = load_classifier(args.quantized_tag)
+    else:
+        quantized = quantize_classifier(model, args.fp16_embedding)
+
+    models = {'fp32': model, 'int8': quantized}
+    if args.eval is not None:
+        eval_sequences, labels = load_heldout(args.eval, vocab,
+                                              args.fast_tables)
+    else:
+        eval_sequences, labels = sequences, None
+
+    predictions = {}
+    for name, candidate in models.items():
+        def forward(x, lengths, candidate=candidate):
+            return candidate(x, lengths=lengths)
+
+        with torch.no_grad():
+            predictions[name] = batched_logits(
+                forward, eval_sequences, pad_idx,
+                args.bucket_boundaries).argmax(dim=1)
+        latencies, throughput = measure(forward, sequences, pad_idx,
+                                        args.bucket_boundaries,
+                                        args.max_batch_size)
+        accuracy = ''
+        if labels is not None:
+            accuracy = (f"  accuracy "
+                        f"{(predictions[name] == labels).float().mean():.4f}")
+        print(f"{name:5s} size {model_size_bytes(candidate) / 2**20:6.2f} MiB"
+              f"  p50 {percentile(latencies, 50):6.3f} ms"
+              f"  p99 {percentile(latencies, 99):6.3f} ms"
+              f"  mean {statistics.mean(latencies):6.3f} ms"
+              f"  batched {throughput:9.1f} req/s{accuracy}")
+
+    agreement = (predictions['fp32'] == predictions['int8']).float().mean()
+    print(f"top-1 agreement on {len(eval_sequences)} queries: "
+          f"{agreement:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Latency and throughput of the eager classifier against its TorchScript
+export on the CPU.
+
+Batch-1 latency is measured with one forward pass per query, throughput
+with the corpus replayed in batches of `--max-batch-size` through
+`batched_logits`, as the runner does. The TorchScript model is loaded from
+the model store, or traced from the eager model if `--torchscript-tag` is
+not given.
+
+Usage:
+    python -m benchmarks.bench_runtimes --torchscript-tag \
+        classifier_torchscript:latest
+"""
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+import torch
+from benchmarks.utils import load_classifier, load_sequences, percentile
+from src.models.batching import batched_logits, pad_batch
+from src.models.export import max_abs_diff, trace_classifier
+
+
+def measure(forward, sequences, pad_idx, boundaries, max_batch_size):
+    latencies = []
+    with torch.no_grad():
+        for seq in sequences[:50]:
+            forward(*pad_batch([seq], pad_idx))
+        for seq in sequences:
+            x, lengths = pad_batch([seq], pad_idx)
+            start = time.perf_counter()
+            forward(x, lengths)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        for i in range(0, len(sequences), max_batch_size):
+            batched_logits(forward, sequences[i:i + max_batch_size],
+                           pad_idx, boundaries)
+        throughput = len(sequences) / (time.perf_counter() - start)
+    return latencies, throughput
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--torchscript-tag', default=None)
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--fast-tables', type=Path, default=None)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--bucket-boundaries', type=int, nargs='+',
+                        default=[16, 32, 64])
+    args = parser.parse_args()
+
+    sequences, vocab = load_sequences(args.corpus, args.size, args.vocab,
+                                      args.fast_tables)
+    pad_idx = vocab['<PAD>']
+    model = load_classifier(args.model_tag)
+    if args.torchscript_tag:
+        import bentoml
+        traced = bentoml.torchscript.load_model(args.torchscript_tag,
+                                                device_id='cpu')
+    else:
+        traced = trace_classifier(model, pad_idx)
+
+    runtimes = {
+        'eager': lambda x, lengths: model(x, lengths=lengths),
+        'torchscript': traced,
+    }
+    print(f"queries: {len(sequences)}, torch threads: "
+          f"{torch.get_num_threads()}")
+    for name, forward in runtimes.items():
+        latencies, throughput = measure(forward, sequences, pad_idx,
+                                        args.bucket_boundaries,
+                                        args.max_batch_size)
+        print(f"{name:12s} batch 1 mean {statistics.mean(latencies):6.3f} ms"
+              f"  p50 {percentile(latencies, 50):6.3f} ms"
+              f"  p99 {percentile(latencies, 99):6.3f} ms"
+              f"  batched {throughput:9.1f} req/s")
+    diff = max_abs_diff(runtimes['eager'], traced, sequences, pad_idx,
+                        args.bucket_boundaries)
+    print(f"max |logit diff|: {diff:.2e}")
+
+
+if __name__ == '__main__':
+    main()
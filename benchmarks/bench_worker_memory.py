@@ -0,0 +1,92 @@
+"""
+Per-worker memory of N model workers with private against shared weights.
+
+Every worker loads the classifier and the vocabulary and runs a forward
+pass, then reports its memory while all workers are alive. 'private'
+workers keep the unpickled weights and the `vocab.json` dictionary;
+'shared' workers memory-map the weights with `share_model_weights` and the
+vocabulary with `load_vocab_index`. Besides RSS, which counts shared pages
+in full for every process, the PSS (shared pages split across the
+processes mapping them) and USS (private pages) are reported from
+/proc/<pid>/smaps_rollup, so the script runs on Linux only.
+
+Usage:
+    python -m benchmarks.bench_worker_memory --workers 8
+"""
+
+import argparse
+import json
+import multiprocessing
+import statistics
+import tempfile
+from pathlib import Path
+
+
+def read_memory() -> dict:
+    fields = {}
+    with open('/proc/self/smaps_rollup', 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {'rss': fields['Rss'], 'pss': fields['Pss'],
+            'uss': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def worker(mode: str, args, barrier, results) -> None:
+    import torch
+    from benchmarks.utils import load_classifier
+    from src.data_preprocessing.text_processing import numericalize
+    from src.data_preprocessing.vocab_index import load_vocab_index
+    from src.models.shared_weights import share_model_weights
+
+    model = load_classifier(args.model_tag)
+    if mode == 'shared':
+        share_model_weights(model, args.weights_dir, args.model_tag)
+        vocab = load_vocab_index(args.vocab_index)
+    else:
+        with open(args.vocab, 'r', encoding='utf-8') as f:
+            vocab = json.load(f)
+
+    with torch.no_grad():
+        model(torch.tensor(numericalize(vocab, ['card', 'arrive'])))
+    barrier.wait()
+    results.put(read_memory())
+    barrier.wait()
+
+
+def measure(mode: str, args) -> list:
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(args.workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker,
+                                 args=(mode, args, barrier, results))
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--vocab-index', type=Path,
+                        default=Path('data/vocab_index'))
+    args = parser.parse_args()
+    args.weights_dir = tempfile.mkdtemp(prefix='shared-weights-')
+
+    print(f"{args.workers} workers, MiB per worker (mean)")
+    for mode in ('private', 'shared'):
+        samples = measure(mode, args)
+        print(f"{mode:8s} " + '  '.join(
+            f"{key.upper()} {statistics.mean(s[key] for s in samples):7.1f}"
+            for key in ('rss', 'pss', 'uss')))
+
+
+if __name__ == '__main__':
+    main()
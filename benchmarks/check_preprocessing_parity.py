@@ -0,0 +1,50 @@
+"""
+Parity check of the fast preprocessing path against the NLTK pipeline.
+
+Every query of the corpus is run through `lemmatizer(clean_text(text))`
+and through `FastPreprocessor.process`, and the results are compared as
+tokens and as the token ids the model actually sees, see
+`build_fast_tables.parity_report`, which also gates the build of the
+tables. The report includes how often the single lemma per token of the
+table differs from NLTK's lemma in context. The script exits with status
+1 when the share of queries with identical token ids is below
+`--min-agreement`, e.g. to check existing tables against a new corpus.
+
+Usage:
+    python -m benchmarks.check_preprocessing_parity --corpus queries.jsonl
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from benchmarks.utils import load_corpus
+from src.data_preprocessing.build_fast_tables import parity_report
+from src.data_preprocessing.fast_text_processing import DEFAULT_TABLES_PATH
+from src.data_preprocessing.fast_text_processing import load_fast_preprocessor
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=5000)
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--tables', type=Path, default=DEFAULT_TABLES_PATH)
+    parser.add_argument('--min-agreement', type=float, default=0.99)
+    parser.add_argument('--show', type=int, default=20,
+                        help='Number of mismatches to print.')
+    args = parser.parse_args()
+
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    fast = load_fast_preprocessor(args.tables)
+    report = parity_report(fast, load_corpus(args.corpus, args.size), vocab,
+                           args.show)
+    print(json.dumps(report, indent=2))
+
+    if report['identical_token_ids'] < args.min_agreement:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
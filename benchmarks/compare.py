@@ -0,0 +1,61 @@
+"""
+Comparison of two result files of the benchmark suite.
+
+Results are matched by section, name, thread count, batch size and
+concurrency. The script prints the relative change of throughput and p99
+latency of every match and exits with status 1 if any throughput dropped
+or any p99 latency rose by more than `--threshold` percent.
+
+Usage:
+    python -m benchmarks.compare results/base.json results/head.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+KEY_FIELDS = ('section', 'name', 'threads', 'batch_size', 'concurrency')
+
+
+def load_results(path: Path) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        results = json.load(f)['results']
+    return {tuple(row.get(k) for k in KEY_FIELDS): row for row in results
+            if 'skipped' not in row}
+
+
+def change(base: float, head: float) -> float:
+    return (head - base) / base * 100 if base else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('base', type=Path)
+    parser.add_argument('head', type=Path)
+    parser.add_argument('--threshold', type=float, default=10.0)
+    args = parser.parse_args()
+
+    base, head = load_results(args.base), load_results(args.head)
+    regressions = 0
+    for key in sorted(set(base) & set(head), key=str):
+        throughput = change(base[key]['throughput'], head[key]['throughput'])
+        p99 = change(base[key]['p99_ms'], head[key]['p99_ms'])
+        regressed = throughput < -args.threshold or p99 > args.threshold
+        regressions += regressed
+        label = ' '.join(f'{k}={v}' for k, v in zip(KEY_FIELDS[2:], key[2:])
+                         if v is not None)
+        print(f"{key[0]:13s} {key[1]:16s} {label:24s} "
+              f"throughput {throughput:+7.1f}%  p99 {p99:+7.1f}%"
+              f"{'  REGRESSION' if regressed else ''}")
+    for key in sorted(set(base) ^ set(head), key=str):
+        print(f"{key[0]:13s} {key[1]:16s} only in "
+              f"{'base' if key in base else 'head'}")
+
+    if regressions:
+        print(f'{regressions} regression(s) above {args.threshold}%')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
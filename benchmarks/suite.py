@@ -0,0 +1,318 @@
+"""
+Reproducible benchmark suite for preprocessing, the model and the service.
+
+The suite replays one query corpus through every preprocessing stage,
+through the model at each batch size and thread count, and through the
+full BentoML service at each concurrency level. The service runs as
+`bentoml serve` with the database replaced by the local PostgREST stand-in
+of `bench_supabase_pool.py`, and its peak RSS is summed over all of its
+processes. The prediction cache of the service stays enabled, so repeated
+queries of the corpus are served from it as in production. Every section
+runs in its own process so its peak RSS is measured in isolation.
+
+The results are written as JSON together with the commit, library
+versions and arguments, and two result files are compared with
+`python -m benchmarks.compare`.
+
+Usage:
+    python -m benchmarks.suite --output results/$(git rev-parse --short \
+        HEAD).json --fast-tables data/fast_preprocessing.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, List, Tuple
+from benchmarks.utils import load_corpus, peak_rss_mb, summarize
+
+SECTIONS = ('preprocessing', 'model', 'service')
+
+
+def timed_calls(func, items) -> tuple:
+    latencies = []
+    results = []
+    start = time.perf_counter()
+    for item in items:
+        call_start = time.perf_counter()
+        results.append(func(item))
+        latencies.append((time.perf_counter() - call_start) * 1000)
+    return results, latencies, time.perf_counter() - start
+
+
+def bench_preprocessing(args, texts: List[str]) -> List[dict]:
+    """
+    Per-query latency of every preprocessing stage of both pipelines.
+    """
+    from src.data_preprocessing import text_processing
+    from src.data_preprocessing.fast_text_processing import \
+        load_fast_preprocessor
+
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    records = []
+
+    def record(name, latencies, elapsed):
+        records.append({'name': name,
+                        **summarize(latencies, len(latencies), elapsed)})
+
+    try:
+        text_processing.check_nltk_resources()
+    except LookupError as e:
+        records.append({'name': 'nltk', 'skipped': str(e)})
+    else:
+        cleaned, latencies, elapsed = timed_calls(text_processing.clean_text,
+                                                  texts)
+        record('nltk.clean_text', latencies, elapsed)
+        cleaned = [c for c in cleaned if c]
+        tokens, latencies, elapsed = timed_calls(text_processing.lemmatizer,
+                                                 cleaned)
+        record('nltk.lemmatizer', latencies, elapsed)
+        _, latencies, elapsed = timed_calls(
+            lambda t: text_processing.numericalize(vocab, t), tokens)
+        record('numericalize', latencies, elapsed)
+
+    if args.fast_tables is None:
+        records.append({'name': 'fast', 'skipped': 'no --fast-tables'})
+    else:
+        fast = load_fast_preprocessor(args.fast_tables)
+        _, latencies, elapsed = timed_calls(fast.process, texts)
+        record('fast.process', latencies, elapsed)
+    return records
+
+
+def bench_model(args, texts: List[str]) -> List[dict]:
+    """
+    Latency per batch and throughput of the model for every batch size and
+    thread count.
+    """
+    import torch
+    from benchmarks.utils import load_classifier, preprocess_texts
+    from src.models.batching import batched_logits
+
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    sequences = [seq for seq in preprocess_texts(texts, vocab,
+                                                 args.fast_tables)
+                 if seq is not None]
+    model = load_classifier(args.model_tag)
+
+    def forward(x, lengths):
+        return model(x, lengths=lengths)
+
+    records = []
+    with torch.no_grad():
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            for batch_size in args.batch_sizes:
+                batches = [sequences[i:i + batch_size]
+                           for i in range(0, len(sequences), batch_size)]
+                for batch in batches[:3]:
+                    batched_logits(forward, batch, vocab['<PAD>'],
+                                   args.bucket_boundaries)
+                _, latencies, elapsed = timed_calls(
+                    lambda batch: batched_logits(forward, batch,
+                                                 vocab['<PAD>'],
+                                                 args.bucket_boundaries),
+                    batches)
+                records.append({'name': 'forward', 'threads': threads,
+                                'batch_size': batch_size,
+                                **summarize(latencies, len(sequences),
+                                            elapsed)})
+    return records
+
+
+def post(url: str, body: bytes, content_type: str) -> bytes:
+    request = urllib.request.Request(url, data=body,
+                                     headers={'Content-Type': content_type})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.read()
+
+
+@contextmanager
+def serve_stand_in(port: int, startup_timeout: float
+                   ) -> Iterator[Tuple[str, subprocess.Popen]]:
+    """
+    Runs `bentoml serve` against the local PostgREST stand-in of
+    `bench_supabase_pool.py` until the context exits.
+    Args:
+        port (int): Port of the service.
+        startup_timeout (float): Seconds to wait for the service to be ready.
+    Returns:
+        Iterator[Tuple[str, subprocess.Popen]]: The base URL of the ready
+                  service and its process.
+    """
+    from benchmarks.bench_supabase_pool import FAKE_KEY, StandInHandler
+
+    database = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=database.serve_forever, daemon=True).start()
+    tmp_dir = tempfile.mkdtemp(prefix='bench-service-')
+    env = dict(os.environ,
+               SUPABASE_URL=f'http://127.0.0.1:{database.server_address[1]}',
+               SUPABASE_KEY=FAKE_KEY,
+               WRITE_BUFFER_PATH=os.path.join(tmp_dir, 'buffer.sqlite3'))
+
+    base = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(
+        ['bentoml', 'serve', 'src.api.service:svc', '--port', str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError('bentoml serve exited during startup')
+            try:
+                with urllib.request.urlopen(f'{base}/readyz', timeout=5):
+                    break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError('The service did not become ready')
+                time.sleep(0.2)
+        yield base, server
+    finally:
+        server.terminate()
+        server.wait()
+        database.shutdown()
+
+
+def bench_service(args, texts: List[str]) -> List[dict]:
+    """
+    Latency and throughput of the /inference API at every concurrency level
+    and of the /classify_batch API at every batch size, against a stubbed
+    database.
+    """
+    records = []
+    with serve_stand_in(args.port, args.startup_timeout) as (base, server):
+        def infer(text):
+            post(f'{base}/inference', text.encode('utf-8'), 'text/plain')
+
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                latencies = list(pool.map(
+                    lambda text: timed_calls(infer, [text])[1][0], texts))
+            records.append({'name': 'inference', 'concurrency': concurrency,
+                            **summarize(latencies, len(texts),
+                                        time.perf_counter() - start)})
+
+        for batch_size in args.batch_sizes:
+            bodies = [json.dumps(texts[i:i + batch_size]).encode('utf-8')
+                      for i in range(0, len(texts), batch_size)]
+            _, latencies, elapsed = timed_calls(
+                lambda body: post(f'{base}/classify_batch', body,
+                                  'text/plain'), bodies)
+            records.append({'name': 'classify_batch',
+                            'batch_size': batch_size,
+                            **summarize(latencies, len(texts), elapsed)})
+
+        rss = peak_rss_mb(server.pid)
+        for row in records:
+            row['server_peak_rss_mb'] = rss
+    return records
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_child(args) -> None:
+    texts = load_corpus(args.corpus, args.size, args.seed)
+    section = {'preprocessing': bench_preprocessing, 'model': bench_model,
+               'service': bench_service}[args.section]
+    records = section(args, texts)
+    rss = peak_rss_mb()
+    for row in records:
+        row['section'] = args.section
+        row['peak_rss_mb'] = rss
+    print(json.dumps(records))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--output', type=Path, required=True)
+    parser.add_argument('--sections', nargs='+', choices=SECTIONS,
+                        default=list(SECTIONS))
+    parser.add_argument('--corpus', type=Path, default=None)
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--fast-tables', type=Path, default=None)
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[1, 8, 32, 64])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--bucket-boundaries', type=int, nargs='+',
+                        default=[16, 32, 64])
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 8, 32, 128])
+    parser.add_argument('--port', type=int, default=3999)
+    parser.add_argument('--startup-timeout', type=float, default=180.0)
+    parser.add_argument('--section', choices=SECTIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.section:
+        run_child(args)
+        return
+
+    results = []
+    for section in args.sections:
+        print(f'Running {section} benchmarks...', flush=True)
+        child = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.suite', '--section', section,
+             *sys.argv[1:]],
+            capture_output=True, text=True)
+        if child.returncode:
+            sys.exit(f'The {section} benchmarks failed:\n{child.stderr}')
+        results.extend(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    import torch
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': {k: str(v) if isinstance(v, Path) else v
+                     for k, v in vars(args).items() if k != 'section'},
+        },
+        'results': results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2)
+
+    for row in results:
+        if 'skipped' in row:
+            print(f"{row['section']:13s} {row['name']:16s} skipped: "
+                  f"{row['skipped']}")
+            continue
+        params = ' '.join(f'{k}={row[k]}' for k in
+                          ('threads', 'batch_size', 'concurrency')
+                          if k in row)
+        print(f"{row['section']:13s} {row['name']:16s} {params:24s} "
+              f"{row['throughput']:9.1f} q/s  p50 {row['p50_ms']:8.3f}  "
+              f"p95 {row['p95_ms']:8.3f}  p99 {row['p99_ms']:8.3f} ms  "
+              f"rss {row.get('server_peak_rss_mb', row['peak_rss_mb']):7.1f}"
+              f" MiB")
+    print(f'Wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
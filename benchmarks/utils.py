@@ -0,0 +1,201 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+The module includes:
+- `load_corpus`: Reads query texts from a JSONL file or generates a
+  synthetic Banking77-style corpus.
+- `preprocess_texts`: Preprocesses texts into token-id sequences.
+- `load_sequences`: Preprocesses a corpus into token-id sequences.
+- `load_classifier`: Loads the IntentClassifier from the BentoML model store.
+- `percentile`: Nearest-rank percentile of a list of latencies.
+- `summarize`: Throughput and latency percentiles of a measurement.
+- `peak_rss_mb`: Peak resident memory of a process and its children.
+"""
+
+import json
+import os
+import random
+import resource
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from src.utils.label_mapping import label_mapping
+
+TEMPLATES = [
+    "{intent}",
+    "I need help with {intent}",
+    "can you tell me about {intent} please",
+    "why is there a problem with {intent} on my account",
+    "hi, I have a question regarding {intent}, "
+    "it has been going on for a few days now and nobody could help me",
+]
+
+
+def load_corpus(path: Optional[Path] = None, size: int = 1000,
+                seed: int = 0) -> List[str]:
+    """
+    Loads the benchmark query corpus.
+    Args:
+        path (Path, optional): JSONL file with one query per line, either a
+                               JSON string or an object with a 'text',
+                               'query_text' or 'body' field. When omitted,
+                               a synthetic corpus is generated.
+        size (int): Number of queries to return.
+        seed (int): Seed of the synthetic corpus.
+    Returns:
+        List[str]: The query texts, repeated to reach `size` if necessary.
+    """
+    if path is not None:
+        from src.data_preprocessing.preprocessing_pool import TEXT_KEYS
+
+        texts = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if isinstance(row, str):
+                    texts.append(row)
+                else:
+                    texts.append(next(row[k] for k in TEXT_KEYS if k in row))
+        if not texts:
+            raise ValueError(f"No queries found in {path}")
+        return [texts[i % len(texts)] for i in range(size)]
+
+    rng = random.Random(seed)
+    intents = [label.replace('_', ' ') for label in label_mapping.values()]
+    return [rng.choice(TEMPLATES).format(intent=rng.choice(intents))
+            for _ in range(size)]
+
+
+def preprocess_texts(texts: List[str], vocab: Dict[str, int],
+                     fast_tables: Optional[Path] = None
+                     ) -> List[Optional[List[int]]]:
+    """
+    Preprocesses texts into token-id sequences.
+    Args:
+        texts (List[str]): The query texts.
+        vocab (dict): The model vocabulary.
+        fast_tables (Path, optional): Tables of the fast preprocessing path.
+                                      When omitted, the NLTK path is used.
+    Returns:
+        List[Optional[List[int]]]: The sequence of every text, or None for
+                                   texts without any token left.
+    """
+    from src.data_preprocessing.fast_text_processing import \
+        load_fast_preprocessor
+    from src.data_preprocessing.text_processing import clean_text
+    from src.data_preprocessing.text_processing import lemmatizer
+    from src.data_preprocessing.text_processing import numericalize
+
+    if fast_tables is not None:
+        token_lists = load_fast_preprocessor(fast_tables).process_batch(texts)
+    else:
+        token_lists = []
+        for text in texts:
+            cleaned = clean_text(text)
+            token_lists.append(lemmatizer(cleaned) if cleaned else [])
+    return [numericalize(vocab, tokens)[0] if tokens else None
+            for tokens in token_lists]
+
+
+def load_sequences(corpus: Optional[Path] = None, size: int = 1000,
+                   vocab_path: Path = Path('data/vocab.json'),
+                   fast_tables: Optional[Path] = None
+                   ) -> Tuple[List[List[int]], Dict[str, int]]:
+    """
+    Preprocesses the benchmark corpus into token-id sequences.
+    Args:
+        corpus (Path, optional): JSONL corpus, see `load_corpus`.
+        size (int): Number of queries.
+        vocab_path (Path): Path of the vocabulary.
+        fast_tables (Path, optional): See `preprocess_texts`.
+    Returns:
+        Tuple[List[List[int]], Dict[str, int]]: The non-empty sequences and
+                                                the vocabulary.
+    """
+    with open(vocab_path, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    sequences = preprocess_texts(load_corpus(corpus, size), vocab,
+                                 fast_tables)
+    return [seq for seq in sequences if seq is not None], vocab
+
+
+def load_classifier(model_tag: str = 'classifier:latest'):
+    """
+    Loads the IntentClassifier from the BentoML model store on the CPU.
+    Args:
+        model_tag (str): Tag of the Bento model.
+    Returns:
+        torch.nn.Module: The model in evaluation mode.
+    """
+    import bentoml
+
+    model = bentoml.pytorch.load_model(model_tag, device_id='cpu')
+    model.eval()
+    return model
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Returns the nearest-rank `q`-th percentile of `values`.
+    """
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1,
+                      int(round(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies_ms: List[float], items: int,
+              elapsed_s: float) -> Dict[str, float]:
+    """
+    Summarizes a measurement.
+    Args:
+        latencies_ms (List[float]): Latency of every call in milliseconds.
+        items (int): Number of queries processed by all calls.
+        elapsed_s (float): Wall-clock seconds of the whole measurement.
+    Returns:
+        Dict[str, float]: Throughput in queries/s and the mean, p50, p95 and
+                          p99 latency in milliseconds.
+    """
+    return {
+        'throughput': items / elapsed_s,
+        'mean_ms': sum(latencies_ms) / len(latencies_ms),
+        'p50_ms': percentile(latencies_ms, 50),
+        'p95_ms': percentile(latencies_ms, 95),
+        'p99_ms': percentile(latencies_ms, 99),
+    }
+
+
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """
+    Returns the peak resident memory in MiB of this process, or of the
+    process `pid` and all its descendants (Linux only, else None).
+    """
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    if not os.path.isdir('/proc'):
+        return None
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r', encoding='utf-8') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total_kb, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status', 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return total_kb / 1024
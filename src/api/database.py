@@ -1,58 +1,178 @@
 import logging
+import os
+import threading
 from src.db.session import get_supabase_client
-from src.db.models import insert_user_query, insert_feedback
+from src.db.models import insert_user_queries, insert_feedbacks
+from src.db.write_buffer import WriteBuffer
+from src.utils.ids import generate_id
 from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+from postgrest.exceptions import APIError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_write_buffer = None
+_write_buffer_lock = threading.Lock()
 
-def log_query_to_db(query_text: str, predicted_intent: str, 
+
+def is_permanent_error(error: Exception) -> bool:
+    """
+    Returns whether the database rejected written rows for good: Postgres
+    data exceptions (SQLSTATE class 22) and integrity constraint violations
+    (class 23), e.g. a feedback row referencing a missing query. Network
+    errors, timeouts and PostgREST errors are treated as transient.
+    """
+    return isinstance(error, APIError) and \
+        str(error.code or '')[:2] in ('22', '23')
+
+
+def get_write_buffer() -> WriteBuffer:
+    """
+    Returns the process-wide write buffer, creating and starting it on
+    first use. Its location and thresholds are read from the environment:
+
+    - WRITE_BUFFER_PATH: Local SQLite file (default
+      'data/write_buffer.sqlite3'). Every process buffers in its own file,
+      with its process ID inserted before the suffix, e.g.
+      'data/write_buffer.1234.sqlite3', so the workers of the service do
+      not flush each other's rows. On creation, the buffer adopts the rows
+      of the files left behind by processes that exited.
+    - WRITE_BUFFER_FLUSH_SIZE: Rows per bulk insert (default 500).
+    - WRITE_BUFFER_FLUSH_INTERVAL: Seconds between flushes (default 1.0).
+    """
+    global _write_buffer
+    with _write_buffer_lock:
+        if _write_buffer is None:
+            path = Path(os.getenv('WRITE_BUFFER_PATH',
+                                  'data/write_buffer.sqlite3'))
+            _write_buffer = WriteBuffer(
+                path.with_name(f'{path.stem}.{os.getpid()}{path.suffix}'),
+                writers={
+                    'user_queries': lambda rows: insert_user_queries(
+                        get_supabase_client(), rows),
+                    'feedback': lambda rows: insert_feedbacks(
+                        get_supabase_client(), rows),
+                },
+                flush_size=int(os.getenv('WRITE_BUFFER_FLUSH_SIZE', '500')),
+                flush_interval=float(
+                    os.getenv('WRITE_BUFFER_FLUSH_INTERVAL', '1.0')),
+                is_permanent=is_permanent_error,
+            )
+            # The unsuffixed file is the one all workers shared before.
+            for orphan in [path, *sorted(path.parent.glob(
+                    f'{path.stem}.*{path.suffix}'))]:
+                adopted = _write_buffer.adopt(orphan)
+                if adopted:
+                    logger.info(f"Adopted {adopted} buffered rows from "
+                                f"{orphan}")
+            _write_buffer.start()
+        return _write_buffer
+
+
+def close_write_buffer() -> None:
+    """
+    Flushes the pending rows and stops the write buffer, if it was started.
+    """
+    global _write_buffer
+    with _write_buffer_lock:
+        if _write_buffer is not None:
+            _write_buffer.close()
+            _write_buffer = None
+
+
+def log_query_to_db(query_text: str, predicted_intent: str,
                     confidence_score: float = None) -> int:
     """
     Log the user query and model prediction to the Supabase database.
-    
+    The row is buffered locally and inserted in the background, so the
+    returned ID can be referenced before the insert happened.
+
     Args:
         query_text (str): The user's query text.
         predicted_intent (str): The predicted intent label.
         confidence_score (float, optional): Prediction confidence score.
+    Returns:
+        int: The client-generated ID of the logged query.
+    """
+    return log_queries_to_db([query_text], [predicted_intent],
+                             [confidence_score])[0]
+
+
+def log_queries_to_db(query_texts: List[str], predicted_intents: List[str],
+                      confidence_scores: List[float]) -> List[int]:
+    """
+    Log a batch of user queries and model predictions to the Supabase
+    database. The rows are buffered locally and written in bulk inserts
+    in the background.
+
+    Args:
+        query_texts (List[str]): The users' query texts.
+        predicted_intents (List[str]): The predicted intent labels.
+        confidence_scores (List[float]): Prediction confidence scores.
+    Returns:
+        List[int]: The client-generated IDs of the logged queries, in input
+                   order.
     """
-    supabase = get_supabase_client()
     created_at = datetime.now(timezone.utc).isoformat()
+    query_ids = [generate_id() for _ in query_texts]
     try:
-        result = insert_user_query(supabase, query_text, predicted_intent,
-                                   confidence_score, created_at)
-        logger.info(f'Logged to datavase: {result}')
-        return result[0]['id']
-      
-    except (KeyError, IndexError) as e:
-        logger.error(f"Error accessing result ID: {e}")
-        raise
-      
+        get_write_buffer().put_many('user_queries', [{
+            "id": query_id,
+            "query_text": query_text,
+            "predicted_intent": predicted_intent,
+            "confidence_score": confidence_score,
+            "created_at": created_at,
+        } for query_id, query_text, predicted_intent, confidence_score in zip(
+            query_ids, query_texts, predicted_intents, confidence_scores)])
+        return query_ids
+
     except Exception as e:
         logger.error(f"Error logging to database: {e}")
         raise
-      
-      
-def log_feedback_to_db(query_id: int, is_correct: bool, 
+
+
+def log_feedback_to_db(query_id: int, is_correct: bool,
                        corrected_intent: str = None) -> None:
     """
     Log feedback about the prediction to the Supabase database.
-    
+    The row is buffered locally and inserted in the background, after the
+    query it references.
+
     Args:
         query_id (int): The ID of the user query being referenced.
         is_correct (bool): Whether the prediction was correct.
-        corrected_intent (str, optional): The corrected intent if the 
+        corrected_intent (str, optional): The corrected intent if the
                                           prediction was incorrect.
     """
-    supabase = get_supabase_client()
+    log_feedbacks_to_db([query_id], [is_correct], [corrected_intent])
+
+
+def log_feedbacks_to_db(query_ids: List[int], is_correct: List[bool],
+                        corrected_intents: List[Optional[str]]) -> None:
+    """
+    Log a batch of feedback to the Supabase database. The rows are
+    buffered locally in one transaction and written in bulk upserts in the
+    background, after the queries they reference.
+
+    Args:
+        query_ids (List[int]): The IDs of the user queries being referenced.
+        is_correct (List[bool]): Whether each prediction was correct.
+        corrected_intents (List[Optional[str]]): The corrected intents of
+                                                 the incorrect predictions.
+    """
     created_at = datetime.now(timezone.utc).isoformat()
 
     try:
-        result = insert_feedback(supabase, query_id, is_correct, 
-                                 corrected_intent, created_at)
-        
-        logger.info(f"Feedback logged to database: {result}")
+        get_write_buffer().put_many('feedback', [{
+            "id": generate_id(),
+            "query_id": query_id,
+            "is_correct": correct,
+            "corrected_intent": corrected_intent,
+            "created_at": created_at,
+        } for query_id, correct, corrected_intent in zip(
+            query_ids, is_correct, corrected_intents)])
     except Exception as e:
         logger.error(f"Error logging feedback to database: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,98 @@
+"""
+This module defines the Prometheus metrics of the inference path. BentoML
+exports them on the service's /metrics endpoint next to its own request
+metrics, aggregated over all API and runner worker processes.
+
+Recording a metric is a few lock-free memory writes, so the metrics stay
+enabled in production.
+
+The module includes:
+- `STAGE_SECONDS`: Latency histogram of each stage of a request.
+- `RUNNER_BATCH_SIZE`: Size of the batches the runner receives.
+- `CACHE_LOOKUPS`: Prediction cache hits and misses.
+- `WRITE_BUFFER_DEPTH`: Rows waiting in the database write buffer.
+- `DEAD_LETTERS`: Rows the database rejected, moved to the dead letters.
+- `MODEL_RELOADS`: Hot reloads of the served model by result.
+- `SHADOW_PREDICTIONS`: Shadow model predictions by agreement with the
+  served model, and shadow batches dropped under load.
+- `QUERY_TOKENS`: Token count of every query before truncation.
+- `TRUNCATED_QUERIES`: Queries truncated to `preprocessing.max_tokens`.
+- `stage_timer`: Context manager that records the latency of a stage.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Iterator
+import bentoml
+
+STAGE_SECONDS = bentoml.metrics.Histogram(
+    name='intent_stage_duration_seconds',
+    documentation='Latency of each stage of the inference path',
+    labelnames=['stage'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+             0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+RUNNER_BATCH_SIZE = bentoml.metrics.Histogram(
+    name='intent_runner_batch_size',
+    documentation='Number of queries per adaptive batch of the runner',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+CACHE_LOOKUPS = bentoml.metrics.Counter(
+    name='intent_prediction_cache_lookups',
+    documentation='Prediction cache lookups by result',
+    labelnames=['result'],
+)
+
+WRITE_BUFFER_DEPTH = bentoml.metrics.Gauge(
+    name='intent_write_buffer_depth',
+    documentation='Rows waiting in the database write buffers of the '
+                  'workers',
+    multiprocess_mode='livesum',
+)
+
+DEAD_LETTERS = bentoml.metrics.Counter(
+    name='intent_write_buffer_dead_letters',
+    documentation='Buffered rows the database rejected for good, moved to '
+                  'the dead letters, by table',
+    labelnames=['table'],
+)
+
+MODEL_RELOADS = bentoml.metrics.Counter(
+    name='intent_model_reloads',
+    documentation='Hot reloads of the served model by result',
+    labelnames=['result'],
+)
+
+SHADOW_PREDICTIONS = bentoml.metrics.Counter(
+    name='intent_shadow_predictions',
+    documentation='Queries scored by the shadow model by result: agree, '
+                  'disagree, or dropped when the shadow model lags behind',
+    labelnames=['result'],
+)
+
+QUERY_TOKENS = bentoml.metrics.Histogram(
+    name='intent_query_tokens',
+    documentation='Number of token ids of every query before truncation',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+)
+
+TRUNCATED_QUERIES = bentoml.metrics.Counter(
+    name='intent_truncated_queries',
+    documentation='Queries truncated to preprocessing.max_tokens token ids',
+)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """
+    Records the wall-clock duration of the enclosed block as `stage`.
+    Args:
+        stage (str): Label of the stage, e.g. 'lemmatizer' or 'runner'.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
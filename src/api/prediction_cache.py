@@ -0,0 +1,121 @@
+"""
+This module provides the bounded cache of model outputs used by the
+inference APIs.
+
+Banking queries are very repetitive, so the logits of a query are cached
+under the token-id sequence that `numericalize` produces for it. Phrasings
+that only differ in casing, punctuation, stopwords or inflection map to
+the same ids and share an entry. Entries are evicted least-recently-used
+beyond `max_size` and expire after `ttl_seconds`. The whole cache is
+cleared when the served model changes, e.g. when a new model is saved as
+`classifier:latest`.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence
+import torch
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with TTL from token-id sequences to logits.
+
+    Args:
+        max_size (int): Maximum number of cached sequences.
+        ttl_seconds (float): Seconds after which an entry expires.
+        resolve_model_tag (Callable[[], str]): Returns the tag of the model
+                          currently served; a change clears the cache.
+        tag_check_interval (float): Minimum seconds between two calls of
+                                    `resolve_model_tag`.
+    """
+    def __init__(self, max_size: int, ttl_seconds: float,
+                 resolve_model_tag: Callable[[], str],
+                 tag_check_interval: float = 30.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.resolve_model_tag = resolve_model_tag
+        self.tag_check_interval = tag_check_interval
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_tag = resolve_model_tag()
+        self._tag_checked_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, sequence: Sequence[int]) -> Optional[torch.Tensor]:
+        """
+        Returns the cached logits of a token-id sequence.
+        Args:
+            sequence (Sequence[int]): The token ids of a query.
+        Returns:
+            Optional[torch.Tensor]: The logits, or None on a miss.
+        """
+        self._check_model_tag()
+        key = tuple(sequence)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, sequence: Sequence[int], logits: torch.Tensor) -> None:
+        """
+        Caches the logits of a token-id sequence.
+        Args:
+            sequence (Sequence[int]): The token ids of a query.
+            logits (torch.Tensor): The model output for the sequence.
+        """
+        key = tuple(sequence)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds,
+                                  logits)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Removes all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the size of the cache and its hit/miss counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _check_model_tag(self) -> None:
+        now = time.monotonic()
+        if now - self._tag_checked_at < self.tag_check_interval:
+            return
+        self._tag_checked_at = now
+        model_tag = self.resolve_model_tag()
+        if model_tag != self._model_tag:
+            with self._lock:
+                self._entries.clear()
+                self._model_tag = model_tag
+                self.invalidations += 1
@@ -0,0 +1,316 @@
+"""
+This module defines the BentoML runnable that serves the IntentClassifier
+with adaptive micro-batching.
+
+BentoML collects the token-id sequences of concurrent requests into one
+batch, bounded by the `max_batch_size` and `max_latency_ms` settings of the
+runner. The runnable then groups the batch into length buckets and runs
+each bucket through the model as a single packed forward pass. The
+service can route long queries to a second runner with its own batching
+settings, see `create_classifier_runner`, so a short query never waits for
+a long one: each runner worker runs one batch at a time. On the CPU, the
+workers of both runners share the cores of the node without
+oversubscribing them, see `src/api/topology.py`.
+
+The model runs eagerly, as the TorchScript export written by
+`src/utils/export_model_to_bento.py`, or as the int8 variant saved by
+`src/utils/save_model_to_bento.py`, selected by the `runtime` setting.
+The int8 variant always runs on the CPU.
+
+Without a restart, the runnable picks up new models saved under the served
+tag (e.g. `classifier:latest`) in the model store it reads: a background
+thread checks the tag every `reload.check_interval` seconds, loads and
+warms up a new model next to the served one and then swaps it in with a
+single assignment. Every batch runs entirely on one model. Optionally, a
+candidate model scores a sample of the batches in the shadow of the served
+one, see `src/api/shadow.py`.
+
+Bulk callers, e.g. the chunks of a classify_batch request, use
+`predict_bulk` instead of `predict`. Its calls skip the adaptive batching,
+run one at a time between the adaptive batches and have their own latency
+budget (`batch.runner_max_latency_ms`), so a burst of bulk calls queues up
+instead of being shed by the budget of interactive queries. They are left
+out of `intent_runner_batch_size` and of the shadow samples.
+
+The module includes:
+- `ServedModel`: A loaded model with its tag and forward pass.
+- `IntentClassifierRunnable`: The batchable runnable wrapping the model.
+- `served_model_tag`: The model tag that the configured runtime serves.
+- `create_classifier_runner`: Builds a runner from the service config.
+"""
+
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Sequence
+import torch
+import bentoml
+# Registers the container that (de)serializes the tensors returned by the
+# runner, which resolving the model through `bentoml.models` does not.
+import bentoml.pytorch  # noqa: F401
+from src.api.metrics import MODEL_RELOADS, RUNNER_BATCH_SIZE
+from src.api.shadow import ShadowScorer
+from src.api.topology import apply_worker_topology, topology_strategy
+from src.models.batching import batched_logits
+from src.models.shared_weights import share_model_weights
+from src.utils.get_device import get_device
+
+logger = logging.getLogger(__name__)
+
+DEVICE = get_device()
+logger.debug(f"Using device: {DEVICE}")
+
+# Config key of the model tag served by each runtime.
+RUNTIME_MODEL_TAGS = {
+    'eager': 'model_tag',
+    'torchscript': 'torchscript_model_tag',
+    'quantized': 'quantized_model_tag',
+}
+
+
+class ServedModel(NamedTuple):
+    """
+    A loaded model, replaced as a whole when a new model is swapped in.
+    """
+    tag: str
+    model: torch.nn.Module
+    forward: Callable[[torch.Tensor, torch.Tensor], torch.Tensor]
+
+
+class IntentClassifierRunnable(bentoml.Runnable):
+    """
+    Runnable that maps a batch of token-id sequences to their logits.
+
+    Args:
+        model_tag (str): Tag of the Bento model to load.
+        runtime (str): 'eager', 'torchscript' or 'quantized', see
+                       `RUNTIME_MODEL_TAGS`.
+        vocab_path (str): Path of the vocabulary, read for the '<PAD>' index.
+        bucket_boundaries (Sequence[int]): Sorted upper length bounds of the
+                                           buckets used for padding.
+        warmup (bool): Whether to run one dummy forward pass per bucket
+                       before the runner reports ready.
+        shared_weights_dir (str, optional): Directory of the weight files
+                       that the workers of an eager CPU runner memory-map
+                       and share, see `share_model_weights`.
+        reload_tag (str, optional): Tag to watch for new models, e.g.
+                       'classifier:latest'. None disables reloading.
+        reload_interval (float): Seconds between two checks of `reload_tag`.
+        shadow (dict, optional): The `shadow` section of the service
+                       config. Without a `model_tag`, no shadow model runs.
+        interop_threads (int, optional): Inter-op threads of PyTorch, see
+                       `apply_worker_topology`.
+    """
+    SUPPORTED_RESOURCES = ("nvidia.com/gpu", "cpu")
+    SUPPORTS_CPU_MULTI_THREADING = True
+
+    def __init__(self, model_tag: str, runtime: str, vocab_path: str,
+                 bucket_boundaries: Sequence[int], warmup: bool = False,
+                 shared_weights_dir: Optional[str] = None,
+                 reload_tag: Optional[str] = None,
+                 reload_interval: float = 30.0,
+                 shadow: Optional[dict] = None,
+                 interop_threads: Optional[int] = None):
+        apply_worker_topology(interop_threads)
+        # Dynamically quantized kernels only exist for the CPU.
+        self.device = 'cpu' if runtime == 'quantized' else DEVICE
+        self.runtime = runtime
+        self.shared_weights_dir = shared_weights_dir
+        with open(vocab_path, 'r', encoding='utf-8') as f:
+            self.pad_idx = json.load(f)['<PAD>']
+        self.bucket_boundaries = sorted(bucket_boundaries)
+        self.served = self.load(model_tag)
+        if warmup:
+            self.warm_up()
+
+        self.shadow = None
+        if shadow and shadow['model_tag']:
+            candidate = self.load(str(bentoml.models.get(
+                shadow['model_tag']).tag))
+            self.shadow = ShadowScorer(
+                lambda sequences: self.logits(sequences, candidate),
+                candidate.tag, shadow['sample_rate'],
+                Path(shadow['log_path']) if shadow['log_path'] else None,
+                shadow['max_pending'])
+
+        if reload_tag and reload_interval > 0:
+            threading.Thread(target=self._watch_model_tag,
+                             args=(reload_tag, reload_interval),
+                             name='model-reload', daemon=True).start()
+
+    def load(self, model_tag: str) -> ServedModel:
+        """
+        Loads a model from the model store for the runtime of the runnable.
+        Args:
+            model_tag (str): The resolved tag of the Bento model.
+        Returns:
+            ServedModel: The model in evaluation mode.
+        """
+        if self.runtime == 'torchscript':
+            model = bentoml.torchscript.load_model(model_tag,
+                                                   device_id=self.device)
+            forward = model
+        else:
+            model = bentoml.pytorch.load_model(model_tag,
+                                               device_id=self.device)
+            forward = lambda x, lengths: model(x, lengths=lengths)
+        model.eval()
+        if (self.shared_weights_dir and self.runtime == 'eager'
+                and self.device == 'cpu'):
+            share_model_weights(model, self.shared_weights_dir, model_tag)
+        return ServedModel(model_tag, model, forward)
+
+    def warm_up(self, served: Optional[ServedModel] = None) -> None:
+        """
+        Runs a dummy batch with one sequence per length bucket through the
+        model, so the first request does not pay for lazy initialization.
+        Args:
+            served (ServedModel, optional): The model to warm up. Defaults
+                                            to the served one.
+        """
+        lengths = [1] + [boundary + 1 for boundary in self.bucket_boundaries]
+        self.logits([[self.pad_idx] * length for length in lengths], served)
+
+    def _watch_model_tag(self, model_tag: str, interval: float) -> None:
+        failed_tag = None
+        while True:
+            time.sleep(interval)
+            tag = None
+            try:
+                tag = str(bentoml.models.get(model_tag).tag)
+                if tag in (self.served.tag, failed_tag):
+                    continue
+                served = self.load(tag)
+                self.warm_up(served)
+            except Exception as e:
+                # A model that fails to load is not retried until the tag
+                # resolves to another one.
+                failed_tag = tag or failed_tag
+                MODEL_RELOADS.labels(result='failure').inc()
+                print(f"Failed to reload model {model_tag}: {e}")
+                continue
+            # Requests in flight finish on the model they started with.
+            self.served = served
+            MODEL_RELOADS.labels(result='success').inc()
+            print(f"Serving model {tag}")
+
+    @bentoml.Runnable.method(batchable=True, batch_dim=0)
+    def predict(self, sequences: List[List[int]]) -> torch.Tensor:
+        """
+        Computes the logits of a batch of token-id sequences.
+        Args:
+            sequences (List[List[int]]): Token-id sequences, one per query.
+        Returns:
+            torch.Tensor: Logits of shape (len(sequences), num_labels).
+        """
+        RUNNER_BATCH_SIZE.observe(len(sequences))
+        served = self.served
+        logits = self.logits(sequences, served)
+        if self.shadow is not None:
+            self.shadow.submit(sequences, logits, served.tag)
+        return logits
+
+    @bentoml.Runnable.method(batchable=False)
+    def predict_bulk(self, sequences: List[List[int]]) -> torch.Tensor:
+        """
+        Computes the logits of the token-id sequences of one bulk call,
+        outside of the adaptive batching. The call is neither recorded as
+        an adaptive batch nor sampled for the shadow model, which only
+        sees the interactive traffic.
+        Args:
+            sequences (List[List[int]]): Token-id sequences, one per query.
+        Returns:
+            torch.Tensor: Logits of shape (len(sequences), num_labels).
+        """
+        return self.logits(sequences)
+
+    @bentoml.Runnable.method(batchable=False)
+    def model_tag(self, _: Optional[str] = None) -> str:
+        """
+        Returns the tag of the model that currently serves the predictions.
+        The argument is ignored; BentoML's dispatcher cannot route calls
+        without one.
+        """
+        return self.served.tag
+
+    def logits(self, sequences: List[List[int]],
+               served: Optional[ServedModel] = None) -> torch.Tensor:
+        """
+        Computes the logits of token-id sequences without recording them,
+        e.g. for the warm-up and the bulk calls.
+        Args:
+            sequences (List[List[int]]): Token-id sequences.
+            served (ServedModel, optional): The model to run. Defaults to
+                                            the served one.
+        """
+        served = served or self.served
+        with torch.no_grad():
+            return batched_logits(served.forward, sequences, self.pad_idx,
+                                  self.bucket_boundaries, self.device)
+
+
+def served_model_tag(config: dict) -> str:
+    """
+    Returns the model tag served by the configured runtime.
+    Args:
+        config (dict): The service configuration loaded from
+                       `service_config.yaml`.
+    Returns:
+        str: The (possibly unresolved, e.g. ':latest') model tag.
+    """
+    runtime = config['runtime']
+    if runtime not in RUNTIME_MODEL_TAGS:
+        raise ValueError(f"Unknown runtime '{runtime}', expected one of "
+                         f"{sorted(RUNTIME_MODEL_TAGS)}")
+    return config[RUNTIME_MODEL_TAGS[runtime]]
+
+
+def create_classifier_runner(config: dict,
+                             long_queries: bool = False) -> bentoml.Runner:
+    """
+    Creates the classifier runner from the service configuration.
+    Args:
+        config (dict): The service configuration loaded from
+                       `service_config.yaml`.
+        long_queries (bool): Whether to create the runner of the queries
+                       longer than `batching.long_queries.threshold`,
+                       batched with the `batching.long_queries` settings.
+    Returns:
+        bentoml.Runner: The runner named 'classifier', or 'classifier_long'
+                        for the long queries.
+    """
+    bento_model = bentoml.models.get(served_model_tag(config))
+    batching = config['batching']
+    limits = batching['long_queries'] if long_queries else batching
+    options = {}
+    if DEVICE == 'cpu':
+        # The runners share the cores of the node, see `src/api/topology.py`.
+        runners = 1 if batching['long_queries']['threshold'] is None else 2
+        options['scheduling_strategy'] = topology_strategy(
+            config['serving'], runners, int(long_queries))
+    return bentoml.Runner(
+        IntentClassifierRunnable,
+        name='classifier_long' if long_queries else 'classifier',
+        models=[bento_model],
+        runnable_init_params={
+            'model_tag': str(bento_model.tag),
+            'runtime': config['runtime'],
+            'vocab_path': config['vocab_path'],
+            'bucket_boundaries': batching['bucket_boundaries'],
+            'warmup': config['warmup']['enabled'],
+            'shared_weights_dir': (config['shared_weights']['directory']
+                                   if config['shared_weights']['enabled']
+                                   else None),
+            'reload_tag': served_model_tag(config),
+            'reload_interval': config['reload']['check_interval'],
+            'shadow': config['shadow'],
+            'interop_threads': config['serving']['interop_threads'],
+        },
+        max_batch_size=limits['max_batch_size'],
+        max_latency_ms=limits['max_latency_ms'],
+        method_configs={'predict_bulk': {
+            'max_latency_ms': config['batch']['runner_max_latency_ms']}},
+        **options,
+    )
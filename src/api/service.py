@@ -5,87 +5,641 @@ The model is managed using BentoML and deployed as a service that takes in
 text input and returns the predicted intent label.
 
 The module includes the following components:
-- Device selection logic to determine whether to use CUDA, MPS, or CPU.
-- Vocabulary loading from a JSON file to support text preprocessing.
+- Service configuration loading from `service_config.yaml`.
+- Lazy vocabulary loading: the JSON vocabulary numericalizes single
+  queries, and the rows of batch requests are numericalized a chunk at a
+  time with the memory-mapped index shared by all workers, if configured.
+- Optional NLTK-free fast preprocessing (`preprocessing.mode: fast`).
+- A sized thread pool (`preprocessing.workers`) that runs preprocessing
+  off the event loop, so the async APIs keep serving concurrent requests.
+- An optional warm-up (`warmup.enabled`) that loads the preprocessing
+  resources in the startup hook and runs a dummy forward pass in the
+  runner, so the service only reports ready once both are loaded.
+- An LRU/TTL cache of model outputs keyed on the token ids of a query
+  (see `src/api/prediction_cache.py`), cleared once the runner serves a
+  new model.
+- Confidence scores calibrated with a temperature fitted offline on the
+  feedback table (`calibration.temperature_path`, see
+  `src/models/calibration.py`), and the top-k intents of a query on
+  request (`?top_k=3`).
+- Token-id sequences truncated to `preprocessing.max_tokens`, with the
+  token count of every query recorded before truncation.
+- A batchable classifier runner that groups concurrent requests into
+  length-bucketed, packed forward passes, hot-reloads new models saved
+  under the served tag (`reload.check_interval`, which also sets how often
+  the prediction cache checks for a swap) and optionally runs a
+  candidate model in its shadow (`shadow.model_tag`, see
+  `src/api/runner.py`). Queries longer than
+  `batching.long_queries.threshold` run in a second runner with its own
+  batches, so short queries never wait behind them.
 - BentoML service definition that wraps the model as an API for inference.
 
+Per-stage latencies, runner batch sizes, query token counts, prediction
+cache lookups and the depth of the database write buffer are exported as
+Prometheus metrics on /metrics (see `src/api/metrics.py`). With
+`profiling.enabled`, the /debug/profile API records a sampling profile of
+the worker for deep dives.
+
+The classify_batch API scores a JSON list or a JSONL body of texts in chunks
+and streams one JSON result row per input line back as each chunk finishes.
+The next chunks are preprocessed while the current one is scored, in a
+process pool when `batch.preprocessing_workers` is set (see
+`src/data_preprocessing/preprocessing_pool.py`). Chunks run in the runners'
+non-adaptive `predict_bulk` method, and calls the runners shed are retried
+with a backoff. A chunk that still fails gets an error row per input row,
+so the stream always covers every row.
+
+The submit_feedback_batch API takes a burst of feedback in one request,
+keeps the last feedback per query and buffers all rows in one local
+transaction.
+
+Queries and feedback are logged through a local write buffer that inserts
+them into the database in bulk in the background (see
+`src/db/write_buffer.py`), so the APIs never wait on the database. The
+local buffer writes themselves run in a worker thread. Every worker
+process has its own buffer file (see `get_write_buffer`).
+
 The inference function performs the following steps:
 1. Cleans and preprocesses the input text.
-2. Converts the processed text into a tensor that the model can use.
+2. Converts the processed text into a sequence of token ids.
 3. Runs the model to predict the intent label.
 4. Returns the predicted label as a string.
 """
 
+import asyncio
+import collections
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import io
+import itertools
 import json
+from pathlib import Path
+from typing import AsyncGenerator, Callable, Dict, Iterable, Iterator, List
+from typing import Optional, Tuple, TypeVar, Union
 import torch
-import torch.nn.functional as F
 import bentoml
+import yaml
+from bentoml.exceptions import BentoMLException, InternalServerError
+from bentoml.exceptions import InvalidArgument, ServiceUnavailable
 from bentoml.io import Text, JSON
 from src.utils.label_mapping import label_mapping
-from src.data_preprocessing.text_processing import clean_text, lemmatizer
-from src.data_preprocessing.text_processing import numericalize
-from src.utils.get_device import get_device
-from src.api.database import log_query_to_db, log_feedback_to_db
+from src.data_preprocessing.text_processing import numericalize, warm_up
+from src.data_preprocessing.fast_text_processing import FastPreprocessor
+from src.data_preprocessing.vocab_index import VocabIndex, load_vocab_index
+from src.data_preprocessing.fast_text_processing import load_fast_preprocessor
+from src.data_preprocessing.preprocessing_pool import ChunkResult, ID_KEYS
+from src.data_preprocessing.preprocessing_pool import PreprocessingPool
+from src.data_preprocessing.preprocessing_pool import TEXT_KEYS
+from src.data_preprocessing.preprocessing_pool import preprocess_batch
+from src.data_preprocessing.preprocessing_pool import tokenize
+from src.models.batching import truncate_sequences
+from src.models.calibration import load_temperature, top_k_probabilities
+from src.api.runner import create_classifier_runner, served_model_tag
+from src.api.prediction_cache import PredictionCache
+from src.api.metrics import CACHE_LOOKUPS, WRITE_BUFFER_DEPTH, stage_timer
+from src.api.metrics import QUERY_TOKENS, TRUNCATED_QUERIES, DEAD_LETTERS
+from src.api.database import log_query_to_db, log_queries_to_db
+from src.api.database import log_feedback_to_db, log_feedbacks_to_db
+from src.api.database import close_write_buffer
+from src.api.database import get_write_buffer
+from src.db.session import client_manager
 from src.schemas.schemas import FeedbackModel, InferenceResponseModel 
-from pydantic import ValidationError
+from src.schemas.schemas import FeedbackBatchModel
+from src.schemas.schemas import BatchInferenceResponseModel
+from src.schemas.schemas import IntentScoreModel
+from src.utils.profiling import profile_to_file
+
+T = TypeVar('T')
+
+
+with open(Path(__file__).parent / 'service_config.yaml', 'r',
+          encoding='utf-8') as f:
+    config = yaml.safe_load(f)
+
+classifier = create_classifier_runner(config)
+runners = [classifier]
+long_query_runner = None
+if config['batching']['long_queries']['threshold'] is not None:
+    long_query_runner = create_classifier_runner(config, long_queries=True)
+    runners.append(long_query_runner)
+svc = bentoml.Service('classifier', runners=runners)
+
+# Tag of the model the runners serve, updated by `watch_served_tag`. A
+# runner swaps in a new model only after loading it, so the cache follows
+# the runners instead of the model store, which changes earlier.
+served_tag = str(bentoml.models.get(served_model_tag(config)).tag)
+
+prediction_cache = None
+if config['cache']['enabled']:
+    prediction_cache = PredictionCache(
+        max_size=config['cache']['max_size'],
+        ttl_seconds=config['cache']['ttl_seconds'],
+        resolve_model_tag=lambda: served_tag,
+        tag_check_interval=0,
+    )
+background_tasks = set()
+
+
+@functools.lru_cache(maxsize=None)
+def get_vocab() -> Dict[str, int]:
+    """
+    Returns the model vocabulary dictionary, loaded on first use. Looking
+    up the tokens of a single query in it is faster than in the index.
+    """
+    with open(config['vocab_path'], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=None)
+def get_batch_vocab() -> Union[VocabIndex, Dict[str, int]]:
+    """
+    Returns the vocabulary the rows of batch requests are numericalized
+    with, loaded on first use: the memory-mapped index if `vocab_index` is
+    set, which looks up all rows of a chunk at once, else the dictionary.
+    """
+    if config['vocab_index']:
+        return load_vocab_index(Path(config['vocab_index']))
+    return get_vocab()
+
+
+@functools.lru_cache(maxsize=None)
+def get_fast_preprocessor() -> Optional[FastPreprocessor]:
+    """
+    Returns the fast preprocessing pipeline, loaded on first use, or None
+    if the service runs the NLTK pipeline.
+    """
+    if config['preprocessing']['mode'] != 'fast':
+        return None
+    return load_fast_preprocessor(
+        Path(config['preprocessing']['fast_tables']))
+
+
+@functools.lru_cache(maxsize=None)
+def get_temperature() -> float:
+    """
+    Returns the temperature of the confidence scores, loaded on first use,
+    or 1.0 if no calibration file is configured.
+    """
+    return load_temperature(config['calibration']['temperature_path'])
+
+
+@functools.lru_cache(maxsize=None)
+def get_preprocess_executor() -> ThreadPoolExecutor:
+    """
+    Returns the thread pool that runs preprocessing off the event loop,
+    created on first use with `preprocessing.workers` threads.
+    """
+    return ThreadPoolExecutor(max_workers=config['preprocessing']['workers'],
+                              thread_name_prefix='preprocess')
+
+
+async def run_preprocessing(func: Callable[..., T], *args) -> T:
+    """
+    Runs a preprocessing function in the preprocessing thread pool.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        get_preprocess_executor(), func, *args)
+
+
+@functools.lru_cache(maxsize=None)
+def get_batch_preprocessing_pool() -> Optional[PreprocessingPool]:
+    """
+    Returns the process pool that preprocesses the chunks of batch
+    requests, started on first use, or None if
+    `batch.preprocessing_workers` is 0.
+    """
+    workers = config['batch']['preprocessing_workers']
+    if not workers:
+        return None
+    vocab_index = config['vocab_index']
+    return PreprocessingPool(
+        workers, mode=config['preprocessing']['mode'],
+        fast_tables=Path(config['preprocessing']['fast_tables']),
+        vocab_index=Path(vocab_index) if vocab_index else None,
+        vocab_path=Path(config['vocab_path']))
+
+
+async def watch_served_tag(interval: float) -> None:
+    """
+    Polls the tags of the models the runners serve, so the prediction
+    cache is cleared when a runner swaps in a new model. While the runners
+    serve different models, the tag is their combination, so the cache is
+    cleared again once they agree.
+    Args:
+        interval (float): Seconds between two polls.
+    """
+    global served_tag
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            tags = await asyncio.gather(*[runner.model_tag.async_run(None)
+                                          for runner in runners])
+            served_tag = ','.join(sorted(set(tags)))
+        except Exception as e:
+            print(f"Error reading the served model tag: {e}")
+
+
+@svc.on_startup
+def startup(ctx: bentoml.Context) -> None:
+    """
+    Warms up preprocessing and checks the database connection when the 
+    worker starts. Database failures are only logged, since queries are 
+    buffered until the database is back.
+    """
+    if config['warmup']['enabled']:
+        if get_fast_preprocessor() is None:
+            warm_up()
+        preprocess(config['warmup']['text'])
+        preprocess_rows([config['warmup']['text']])
+    # The runners only swap models when reloading is enabled, and at most
+    # once per check interval, so the cache is checked as often.
+    reload_interval = config['reload']['check_interval']
+    if prediction_cache is not None and reload_interval:
+        task = asyncio.get_running_loop().create_task(
+            watch_served_tag(reload_interval))
+        background_tasks.add(task)
+    write_buffer = get_write_buffer()
+    write_buffer.on_depth = WRITE_BUFFER_DEPTH.set
+    write_buffer.on_dead_letter = \
+        lambda table: DEAD_LETTERS.labels(table=table).inc()
+    WRITE_BUFFER_DEPTH.set(write_buffer.depth())
+    client_manager.health_check()
+
+
+@svc.on_shutdown
+def shutdown(ctx: bentoml.Context) -> None:
+    """
+    Flushes the buffered database writes and closes the database 
+    connections before the worker exits.
+    """
+    for task in background_tasks:
+        task.cancel()
+    get_preprocess_executor().shutdown(wait=False, cancel_futures=True)
+    if config['batch']['preprocessing_workers']:
+        get_batch_preprocessing_pool().close()
+    close_write_buffer()
+    client_manager.close()
+
+
+def preprocess(text: str) -> List[int]:
+    """
+    Cleans, lemmatizes and numericalizes a single input text.
+    Args:
+        text (str): Input text from the user.
+    Returns:
+        List[int]: The token ids of the text.
+    """
+    tokens = tokenize(text, get_fast_preprocessor(), stage_timer)
+    with stage_timer('numericalize'):
+        return numericalize(get_vocab(), tokens)[0]
+
+
+def truncate(sequences: List[List[int]]) -> List[List[int]]:
+    """
+    Records the token count of every query and truncates its token ids to
+    `preprocessing.max_tokens`.
+    Args:
+        sequences (List[List[int]]): Token ids of the queries.
+    Returns:
+        List[List[int]]: The truncated token ids, in input order.
+    """
+    max_tokens = config['preprocessing']['max_tokens']
+    for seq in sequences:
+        QUERY_TOKENS.observe(len(seq))
+        if max_tokens is not None and len(seq) > max_tokens:
+            TRUNCATED_QUERIES.inc()
+    return truncate_sequences(sequences, max_tokens)
+
+
+async def run_bulk(runner: bentoml.Runner,
+                   sequences: List[List[int]]) -> torch.Tensor:
+    """
+    Runs one bulk call in a runner, retrying it with an exponential backoff
+    while the runner sheds it, see the `batch` section of the config.
+    """
+    retries = config['batch']['runner_retries']
+    backoff = config['batch']['retry_backoff_ms'] / 1000
+    for attempt in range(retries + 1):
+        try:
+            return await runner.predict_bulk.async_run(sequences)
+        except ServiceUnavailable:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+
+async def run_classifier(sequences: List[List[int]],
+                         bulk: bool = False) -> torch.Tensor:
+    """
+    Computes the logits of token-id sequences in the runners. Sequences
+    longer than `batching.long_queries.threshold` run in the long-query
+    runner. Every runner call carries at most the maximum batch size of its
+    runner, and all calls run concurrently.
+    Args:
+        sequences (List[List[int]]): Token ids of the queries.
+        bulk (bool): Whether to run the sequences in calls of at most
+                     `batch.runner_call_size` to `predict_bulk`, see
+                     `run_bulk`, instead of the adaptive batching.
+    Returns:
+        torch.Tensor: Logits of shape (len(sequences), num_labels), in
+                  input order.
+    """
+    batching = config['batching']
+    threshold = batching['long_queries']['threshold']
+    routes = [(classifier, batching['max_batch_size'],
+               [i for i, seq in enumerate(sequences)
+                if long_query_runner is None or len(seq) <= threshold])]
+    if long_query_runner is not None:
+        routes.append((long_query_runner,
+                       batching['long_queries']['max_batch_size'],
+                       [i for i, seq in enumerate(sequences)
+                        if len(seq) > threshold]))
+
+    calls, order = [], []
+    for runner, step, indices in routes:
+        if bulk:
+            step = config['batch']['runner_call_size']
+        for i in range(0, len(indices), step):
+            part = indices[i:i + step]
+            part_sequences = [sequences[index] for index in part]
+            calls.append(run_bulk(runner, part_sequences) if bulk
+                         else runner.predict.async_run(part_sequences))
+            order.extend(part)
+    computed = torch.cat(await asyncio.gather(*calls))
+    logits = torch.empty_like(computed)
+    logits[order] = computed
+    return logits
+
+
+def preprocess_rows(texts: List[object]) -> ChunkResult:
+    """
+    Preprocesses the texts of batch rows, collecting per-row errors.
+    Args:
+        texts (List[object]): The texts, None or other objects for rows
+                              that could not be parsed.
+    Returns:
+        ChunkResult: The token ids of the valid rows, their offsets and the
+                  error of every invalid row by offset.
+    """
+    return preprocess_batch(texts, get_batch_vocab(), get_fast_preprocessor(),
+                            stage_timer)
+
 
+def cached_logits(sequences: List[List[int]]
+                  ) -> Tuple[List[Optional[torch.Tensor]], List[int]]:
+    """
+    Looks up the logits of token-id sequences in the prediction cache.
+    Args:
+        sequences (List[List[int]]): Token ids of the queries.
+    Returns:
+        Tuple[List[Optional[torch.Tensor]], List[int]]: The cached logits
+                  (None for misses) and the indices of the misses.
+    """
+    if prediction_cache is None:
+        return [None] * len(sequences), list(range(len(sequences)))
 
-DEVICE = get_device()
-print(f"Using device: {DEVICE}")
+    with stage_timer('cache_lookup'):
+        logits = [prediction_cache.get(seq) for seq in sequences]
+    misses = [i for i, row in enumerate(logits) if row is None]
+    CACHE_LOOKUPS.labels(result='hit').inc(len(sequences) - len(misses))
+    CACHE_LOOKUPS.labels(result='miss').inc(len(misses))
+    return logits, misses
 
-with open('data/vocab.json', 'r', encoding='utf-8') as f:
-    vocab = json.load(f)
 
-classifier = bentoml.pytorch.get('classifier:latest').to_runner()
-svc = bentoml.Service('classifier', runners=[classifier])
+def requested_top_k(ctx: bentoml.Context) -> int:
+    """
+    Reads the number of intents to return per query from the 'top_k' query
+    parameter of the request, 0 if it is not given.
+    """
+    value = ctx.request.query_params.get('top_k', '0')
+    top_k_max = config['calibration']['top_k_max']
+    if not value.isdigit() or int(value) > top_k_max:
+        raise ValueError(f"top_k must be an integer from 0 to {top_k_max}.")
+    return int(value)
+
+
+def postprocess(logits: torch.Tensor, top_k: int = 0
+                ) -> Tuple[List[str], List[float],
+                           List[Optional[List[IntentScoreModel]]]]:
+    """
+    Converts the logits of a batch of queries to predictions, with one
+    calibrated softmax and one topk over the whole batch.
+    Args:
+        logits (torch.Tensor): Logits of shape (batch_size, num_labels).
+        top_k (int): Number of intents to return per query, 0 for none.
+    Returns:
+        Tuple[List[str], List[float], List[Optional[List[IntentScoreModel]]]]:
+                  The predicted intent, its calibrated confidence score and
+                  the top-k intents (None if `top_k` is 0) of every query.
+    """
+    scores, indices = top_k_probabilities(logits, max(top_k, 1),
+                                          get_temperature())
+    scores, indices = scores.tolist(), indices.tolist()
+    predicted_intents = [label_mapping[row[0]] for row in indices]
+    confidence_scores = [row[0] for row in scores]
+    if not top_k:
+        return predicted_intents, confidence_scores, [None] * len(scores)
+    return predicted_intents, confidence_scores, [
+        [IntentScoreModel(intent=label_mapping[i], score=score)
+         for i, score in zip(row_indices, row_scores)]
+        for row_indices, row_scores in zip(indices, scores)]
+
+
+def parse_jsonl_line(line: str) -> object:
+    """
+    Parses one JSONL line, returning None if it is not valid JSON.
+    """
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return None
+
+
+def batch_row(row: object) -> Tuple[Optional[str], object]:
+    """
+    Returns the id and the text of a parsed batch row, see
+    `iter_batch_rows`.
+    """
+    if isinstance(row, dict):
+        row_id = next((str(row[k]) for k in ID_KEYS if k in row), None)
+        return row_id, next((row[k] for k in TEXT_KEYS if k in row), None)
+    return None, row
+
+
+def iter_batch_rows(body: str) -> Iterator[Tuple[Optional[str], object]]:
+    """
+    Parses the body of a batch request. A JSON list is parsed at once, and
+    JSONL lazily, line by line.
+    Args:
+        body (str): Either a JSON list or JSONL, one row per line. A row is
+                    a JSON string or an object with a 'text', 'query_text'
+                    or 'body' field and an optional 'id' or 'request_id'.
+    Returns:
+        Iterator[Tuple[Optional[str], object]]: The id and the text of every
+                  row. The text is None when the row cannot be parsed.
+    Raises:
+        ValueError: If the body is not a valid JSON list.
+    """
+    if body.lstrip().startswith('['):
+        rows = json.loads(body)
+        if not isinstance(rows, list):
+            raise ValueError("Expected a JSON list or JSONL rows.")
+    else:
+        rows = (parse_jsonl_line(line) for line in io.StringIO(body)
+                if line.strip())
+    return (batch_row(row) for row in rows)
+
+
+def error_rows(chunk: List[Tuple[Optional[str], object]], start: int,
+               offsets: Iterable[int], error: str) -> List[str]:
+    """
+    Returns the JSON error rows of the given rows of a chunk.
+    """
+    return [json.dumps({'index': start + offset, 'id': chunk[offset][0],
+                        'error': error}) for offset in offsets]
+
+
+def preprocess_chunk(chunk: List[Tuple[Optional[str], object]]
+                     ) -> 'asyncio.Future[ChunkResult]':
+    """
+    Starts preprocessing one chunk of batch rows, in the batch process pool
+    if there is one and in the preprocessing thread pool otherwise.
+    """
+    texts = [text for _, text in chunk]
+    pool = get_batch_preprocessing_pool()
+    if pool is not None:
+        return asyncio.wrap_future(pool.submit(texts))
+    return asyncio.ensure_future(run_preprocessing(preprocess_rows, texts))
+
+
+async def classify_chunk(chunk: List[Tuple[Optional[str], object]],
+                         start: int, preprocessed: ChunkResult,
+                         top_k: int = 0) -> str:
+    """
+    Predicts the intents of one chunk of batch rows and logs them to the
+    database.
+    Args:
+        chunk (List[Tuple[Optional[str], object]]): The (id, text) rows.
+        start (int): Index of the first row of the chunk in the request.
+        preprocessed (ChunkResult): The preprocessed rows, see
+                                    `preprocess_rows`.
+        top_k (int): Number of intents to return per row, 0 for none.
+    Returns:
+        str: One JSON result row per input row, newline-terminated.
+    """
+    sequences, valid, errors = preprocessed
+
+    results = {}
+    if sequences:
+        try:
+            sequences = truncate(sequences)
+            rows, misses = cached_logits(sequences)
+            missed = [sequences[i] for i in misses]
+            if missed:
+                with stage_timer('runner'):
+                    computed = await run_classifier(missed, bulk=True)
+                for index, row in zip(misses, computed):
+                    rows[index] = row
+                    if prediction_cache is not None:
+                        prediction_cache.put(sequences[index], row)
+            with stage_timer('postprocess'):
+                predicted_intents, confidence_scores, top_intents = \
+                    postprocess(torch.stack(rows), top_k)
+            with stage_timer('db_log'):
+                query_ids = await asyncio.to_thread(
+                    log_queries_to_db, [chunk[offset][1] for offset in valid],
+                    predicted_intents, confidence_scores)
+        except Exception as e:
+            # The rows of the chunk fail, the rest of the stream goes on.
+            message = f'Scoring failed: {str(e) or type(e).__name__}'
+            errors = dict(errors, **{offset: message for offset in valid})
+        else:
+            results = dict(zip(valid, zip(predicted_intents,
+                                          confidence_scores, query_ids,
+                                          top_intents)))
+
+    lines = []
+    for offset, (row_id, _) in enumerate(chunk):
+        if offset in errors:
+            lines.extend(error_rows(chunk, start, [offset], errors[offset]))
+            continue
+        predicted_intent, confidence_score, query_id, top_intents = \
+            results[offset]
+        lines.append(BatchInferenceResponseModel(
+            index=start + offset,
+            id=row_id,
+            predicted_intent=predicted_intent,
+            confidence_score=confidence_score,
+            query_id=query_id,
+            top_k=top_intents
+        ).model_dump_json())
+    return '\n'.join(lines) + '\n'
 
 
 @svc.api(input=Text(), output=JSON(pydantic_model=InferenceResponseModel))
-def inference(text: str) -> InferenceResponseModel:
+async def inference(text: str,
+                    ctx: bentoml.Context) -> InferenceResponseModel:
     """
       Perform inference on input text to predict the customer's intent.
+      Preprocessing runs in the preprocessing thread pool and the model in
+      the runner, so the event loop keeps serving other requests meanwhile.
       Args:
           text (str): Input text from the user for which the intent is to \
                       be predicted.
+          ctx (bentoml.Context): Request context, read for the optional
+                      'top_k' query parameter.
       Returns:
-          str: The predicted label representing the customer's intent.
+          str: The predicted label representing the customer's intent,
+               its calibrated confidence score and, with 'top_k', the most
+               probable intents.
     """
     try:
-        if not text or not isinstance(text, str):
-            raise ValueError("Invalid input. Please provide a text string.")
-      
-        cleaned_text = clean_text(text)
-        lemmatized_text = lemmatizer(cleaned_text)
-        numericalized_text = numericalize(vocab, lemmatized_text)
-        tensor_text = torch.tensor(numericalized_text).to(DEVICE)
-      
-        with torch.no_grad():
-            logits = classifier.run(tensor_text)
-            probas = F.softmax(logits, dim=1).cpu().numpy()
-            pred_index = torch.argmax(logits, dim=1).cpu().numpy()[0]
-            confidence_score = float(probas[0][pred_index])
-            predicted_intent = label_mapping[pred_index]
-            
-            query_id = log_query_to_db(text, predicted_intent, 
-                                       confidence_score)
-            
-            return InferenceResponseModel(
-                predicted_intent=predicted_intent,
-                confidence_score=confidence_score,
-                query_id=query_id
-            )
+        top_k = requested_top_k(ctx)
+        numericalized_text = truncate(
+            [await run_preprocessing(preprocess, text)])
+
+        cached, _ = cached_logits(numericalized_text)
+        if cached[0] is not None:
+            logits = cached[0].unsqueeze(0)
+        else:
+            with stage_timer('runner'):
+                logits = await run_classifier(numericalized_text)
+            if prediction_cache is not None:
+                prediction_cache.put(numericalized_text[0], logits[0])
+        with stage_timer('postprocess'):
+            predicted_intents, confidence_scores, top_intents = postprocess(
+                logits, top_k)
+            predicted_intent = predicted_intents[0]
+            confidence_score = confidence_scores[0]
+
+        with stage_timer('db_log'):
+            query_id = await asyncio.to_thread(
+                log_query_to_db, text, predicted_intent, confidence_score)
+
+        return InferenceResponseModel(
+            predicted_intent=predicted_intent,
+            confidence_score=confidence_score,
+            query_id=query_id,
+            top_k=top_intents[0]
+        )
     except ValueError as ve:
-        raise ValidationError(f'Invalid input: {ve}')
-      
+        raise InvalidArgument(f'Invalid input: {ve}') from ve
+
     except KeyError as ke:
-        raise ValidationError(f'Prediction failed: {ke}')
-      
+        raise InternalServerError(f'Prediction failed: {ke}') from ke
+
+    except BentoMLException:
+        # Keeps the status of runner errors, e.g. 503 when the runner sheds
+        # load beyond `batching.max_latency_ms`.
+        raise
+
     except Exception as e:
-        raise RuntimeError(f'An error occured during inference: {e}')
-              
+        raise RuntimeError(f'An error occured during inference: {e}') from e
+
 
 @svc.api(input=JSON(pydantic_model=FeedbackModel), output=JSON())
-def submit_feedback(feedback_data: FeedbackModel) -> dict:
+async def submit_feedback(feedback_data: FeedbackModel,
+                          ctx: bentoml.Context) -> dict:
     """
     Submit feedback about the prediction.
     Args:
@@ -95,6 +649,7 @@ def submit_feedback(feedback_data: FeedbackModel) -> dict:
             - is_correct (bool): Whether the prediction was correct.
             - corrected_intent (str, optional): The corrected intent if the 
                                                 prediction was incorrect.
+        ctx (bentoml.Context): Request context, used to set the status code.
     Returns:
         dict: A confirmation message.
     """
@@ -102,12 +657,145 @@ def submit_feedback(feedback_data: FeedbackModel) -> dict:
         query_id = feedback_data.query_id
         is_correct = feedback_data.is_correct
         corrected_intent = feedback_data.corrected_intent
-        
-        log_feedback_to_db(query_id, is_correct, corrected_intent)
-        return {"message": "Feedback submitted successfully"}, 200
-      
-    except ValueError as ve: 
-        return {"error": str(ve)}, 400
-            
+
+        with stage_timer('db_log_feedback'):
+            await asyncio.to_thread(log_feedback_to_db, query_id, is_correct,
+                                    corrected_intent)
+        return {"message": "Feedback submitted successfully"}
+
+    except ValueError as ve:
+        ctx.response.status_code = 400
+        return {"error": str(ve)}
+
+    except Exception as e:
+        ctx.response.status_code = 500
+        return {"error": "An unexpected error occured: " + str(e)}
+
+
+@svc.api(input=JSON(pydantic_model=FeedbackBatchModel), output=JSON())
+async def submit_feedback_batch(feedback_batch: FeedbackBatchModel,
+                                ctx: bentoml.Context) -> dict:
+    """
+    Submit feedback about many predictions at once. The list is validated
+    as a whole, so one invalid item rejects the request. Several feedbacks
+    on the same query are deduplicated, keeping the last one.
+    Args:
+        feedback_batch (FeedbackBatchModel): A list of feedback items,
+                                             shaped like FeedbackModel.
+        ctx (bentoml.Context): Request context, used to set the status code.
+    Returns:
+        dict: A confirmation message with the number of feedback items
+              received and submitted.
+    """
+    max_batch_size = config['feedback']['max_batch_size']
+    if len(feedback_batch.root) > max_batch_size:
+        ctx.response.status_code = 400
+        return {"error": f"At most {max_batch_size} feedback items are "
+                         f"accepted per request."}
+
+    latest = {feedback.query_id: feedback for feedback in feedback_batch.root}
+    try:
+        with stage_timer('db_log_feedback'):
+            await asyncio.to_thread(
+                log_feedbacks_to_db, list(latest),
+                [feedback.is_correct for feedback in latest.values()],
+                [feedback.corrected_intent for feedback in latest.values()])
+        return {"message": "Feedback submitted successfully",
+                "received": len(feedback_batch.root),
+                "submitted": len(latest)}
+
     except Exception as e:
-        return {"error": "An unexpected error occured: " + str(e)}, 500
\ No newline at end of file
+        ctx.response.status_code = 500
+        return {"error": "An unexpected error occured: " + str(e)}
+
+
+async def stream_batch(rows: Iterator[Tuple[Optional[str], object]],
+                       top_k: int = 0) -> AsyncGenerator[str, None]:
+    """
+    Scores the rows of a classify_batch request chunk by chunk, preprocessing
+    the next chunks while the current one is scored. A chunk that fails
+    yields an error row per input row instead of ending the stream.
+    Args:
+        rows (Iterator[Tuple[Optional[str], object]]): The (id, text) rows
+                    of the request, see `iter_batch_rows`.
+        top_k (int): Number of intents to return per row, 0 for none.
+    Returns:
+        AsyncGenerator[str, None]: The JSONL rows of every chunk.
+    """
+    chunk_size = config['batch']['chunk_size']
+    pool = get_batch_preprocessing_pool()
+    # Bounds the chunks preprocessed ahead of the one being scored.
+    max_pending = pool.max_pending if pool is not None else 2
+    pending = collections.deque()
+    start = 0
+    try:
+        while True:
+            while len(pending) < max_pending:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                pending.append((chunk, preprocess_chunk(chunk)))
+            if not pending:
+                break
+            chunk, preprocessed = pending.popleft()
+            try:
+                preprocessed = await preprocessed
+            except Exception as e:
+                message = f'Preprocessing failed: {str(e) or type(e).__name__}'
+                yield '\n'.join(error_rows(chunk, start, range(len(chunk)),
+                                           message)) + '\n'
+            else:
+                yield await classify_chunk(chunk, start, preprocessed, top_k)
+            start += len(chunk)
+    finally:
+        for _, preprocessed in pending:
+            preprocessed.cancel()
+
+
+@svc.api(input=Text(), output=Text())
+async def classify_batch(body: str,
+                         ctx: bentoml.Context) -> AsyncGenerator[str, None]:
+    """
+    Predict the intents of many texts in one request.
+    Args:
+        body (str): A JSON list or JSONL stream of texts, see 
+                    `iter_batch_rows` for the accepted row shapes.
+        ctx (bentoml.Context): Request context, read for the optional
+                    'top_k' query parameter.
+    Returns:
+        AsyncGenerator[str, None]: JSONL rows shaped like 
+                    InferenceResponseModel plus the row 'index' and 'id',
+                    or an 'error' for rows that could not be scored, 
+                    streamed chunk by chunk in input order.
+    """
+    # The request context is only set until the response starts streaming,
+    # so the query parameters are read before.
+    try:
+        top_k = requested_top_k(ctx)
+        rows = iter_batch_rows(body)
+    except ValueError as ve:
+        raise InvalidArgument(str(ve)) from ve
+    return stream_batch(rows, top_k)
+
+
+if config['profiling']['enabled']:
+    @svc.api(input=JSON(), output=JSON(), route='/debug/profile')
+    async def profile(request: dict) -> dict:
+        """
+        Samples the stacks of all threads of the API worker that handles
+        this request and writes them as collapsed stacks, for flame graphs.
+        Args:
+            request (dict): Optional 'seconds' to sample for, capped at
+                            `profiling.max_seconds`.
+        Returns:
+            dict: The path of the written profile.
+        """
+        seconds = min(float(request.get('seconds', 10)),
+                      config['profiling']['max_seconds'])
+        try:
+            path = await asyncio.to_thread(
+                profile_to_file, Path(config['profiling']['output_dir']),
+                seconds, config['profiling']['interval'])
+        except RuntimeError as e:
+            return {"error": str(e)}
+        return {"profile": str(path), "seconds": seconds}
@@ -0,0 +1,118 @@
+"""
+This module runs a candidate model in the shadow of the served one.
+
+A sampled fraction of the runner batches is also scored by the candidate,
+in a background thread of the runner, after the served model has answered.
+The response never waits for the candidate: batches that arrive while
+`max_pending` batches are still waiting for it are dropped. Queries on
+which the two models predict different intents are counted and appended to
+a JSONL log, to judge a candidate on live traffic before serving it.
+
+The module includes:
+- `ShadowScorer`: Compares the candidate with the served model.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+import torch
+import torch.nn.functional as F
+from src.api.metrics import SHADOW_PREDICTIONS
+from src.utils.label_mapping import label_mapping
+
+logger = logging.getLogger(__name__)
+
+
+class ShadowScorer:
+    """
+    Scores sampled batches with a candidate model in a background thread.
+
+    Args:
+        logits (Callable[[List[List[int]]], torch.Tensor]): Computes the
+                    candidate's logits of token-id sequences.
+        model_tag (str): Tag of the candidate model, for the log.
+        sample_rate (float): Fraction of the batches to score, 0 to 1.
+        log_path (Path, optional): JSONL file the disagreements are
+                    appended to. Without one, they are only counted.
+        max_pending (int): Batches waiting for the candidate at most.
+    """
+    def __init__(self, logits: Callable[[List[List[int]]], torch.Tensor],
+                 model_tag: str, sample_rate: float,
+                 log_path: Optional[Path] = None, max_pending: int = 4):
+        self.logits = logits
+        self.model_tag = model_tag
+        self.sample_rate = sample_rate
+        self.log_path = log_path
+        if log_path is not None:
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix='shadow')
+
+    def submit(self, sequences: List[List[int]], logits: torch.Tensor,
+               model_tag: str) -> bool:
+        """
+        Schedules the comparison of a batch, if it is sampled and the
+        candidate keeps up.
+        Args:
+            sequences (List[List[int]]): Token ids of the batch.
+            logits (torch.Tensor): Logits of the served model.
+            model_tag (str): Tag of the served model.
+        Returns:
+            bool: Whether the batch was scheduled.
+        """
+        if random.random() >= self.sample_rate:
+            return False
+        if not self._pending.acquire(blocking=False):
+            SHADOW_PREDICTIONS.labels(result='dropped').inc(len(sequences))
+            return False
+        self._executor.submit(self._compare, sequences, logits.cpu(),
+                              model_tag)
+        return True
+
+    def _compare(self, sequences: List[List[int]], logits: torch.Tensor,
+                 model_tag: str) -> None:
+        try:
+            served_scores, served_indices = F.softmax(logits, dim=1).max(1)
+            shadow_scores, shadow_indices = F.softmax(
+                self.logits(sequences).cpu(), dim=1).max(1)
+            disagreements = (served_indices != shadow_indices).nonzero()
+            disagreements = disagreements.flatten().tolist()
+            SHADOW_PREDICTIONS.labels(result='agree').inc(
+                len(sequences) - len(disagreements))
+            SHADOW_PREDICTIONS.labels(result='disagree').inc(
+                len(disagreements))
+            if disagreements and self.log_path is not None:
+                self._log(sequences, disagreements, model_tag,
+                          (served_scores, served_indices),
+                          (shadow_scores, shadow_indices))
+        except Exception as e:
+            logger.error(f"Error scoring with shadow model: {e}")
+        finally:
+            self._pending.release()
+
+    def _log(self, sequences, disagreements, model_tag, served, shadow):
+        now = time.time()
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            for i in disagreements:
+                f.write(json.dumps({
+                    'time': now,
+                    'token_ids': sequences[i],
+                    'model_tag': model_tag,
+                    'predicted_intent': label_mapping[int(served[1][i])],
+                    'confidence_score': float(served[0][i]),
+                    'shadow_model_tag': self.model_tag,
+                    'shadow_intent': label_mapping[int(shadow[1][i])],
+                    'shadow_score': float(shadow[0][i]),
+                }) + '\n')
+
+    def close(self) -> None:
+        """
+        Stops the background thread, dropping the batches not yet scored.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,132 @@
+"""
+This module lays out the runner workers of the service on the CPU cores of
+a node, from the `serving` section of the service config.
+
+By default, BentoML starts one worker per multi-threaded runner and lets
+every worker start one thread per core of the node, so two runners, or
+several workers per runner, run more threads than there are cores and
+preempt each other. Here, the cores available to the runners are divided
+among all their workers instead: every worker gets `torch_threads` intra-op
+threads (by default its share of the cores) and, with `pin_workers`, its
+own slice of the cores as CPU affinity, so its threads never compete with
+another worker's.
+
+The layout reaches the worker processes through the environment that
+BentoML's scheduling strategy assigns to every worker; the runnable applies
+it when it starts, see `apply_worker_topology`.
+
+The module includes:
+- `runner_cores`: The cores the runner workers may run on.
+- `worker_layout`: The threads and cores of every runner worker.
+- `topology_strategy`: A BentoML scheduling strategy for one runner.
+- `apply_worker_topology`: Applies the layout inside a runner worker.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple, Type
+import torch
+import bentoml
+
+# Cores of a runner worker, e.g. '4,5,6,7', set when workers are pinned.
+CORES_ENV = 'INTENT_RUNNER_CORES'
+# Thread pool sizes read by PyTorch and the math libraries at import.
+THREAD_ENVS = ('BENTOML_NUM_THREAD', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+               'OPENBLAS_NUM_THREADS')
+
+
+def runner_cores(serving: dict) -> List[int]:
+    """
+    Returns the cores the runner workers may run on: `runner_cores` if set,
+    else all cores this process may run on.
+    """
+    if serving['runner_cores']:
+        return list(serving['runner_cores'])
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_layout(serving: dict, runners: int
+                  ) -> List[Tuple[int, Optional[List[int]]]]:
+    """
+    Lays out the workers of all runners on the runner cores.
+    Args:
+        serving (dict): The `serving` section of the service config.
+        runners (int): Number of runners, each with `runner_workers`
+                       workers.
+    Returns:
+        List[Tuple[int, Optional[List[int]]]]: The intra-op threads and the
+                  pinned cores (None without `pin_workers`) of every worker,
+                  the workers of the first runner first.
+    """
+    cores = runner_cores(serving)
+    workers = serving['runner_workers'] * runners
+    threads = serving['torch_threads'] or max(1, len(cores) // workers)
+    layout = []
+    for index in range(workers):
+        pinned = None
+        if serving['pin_workers']:
+            # With more threads than cores, slices wrap around and overlap.
+            pinned = sorted({cores[(index * threads + i) % len(cores)]
+                             for i in range(threads)})
+        layout.append((threads, pinned))
+    return layout
+
+
+def topology_strategy(serving: dict, runners: int,
+                      runner_index: int) -> Type[bentoml.Strategy]:
+    """
+    Creates the scheduling strategy of one runner, which starts
+    `runner_workers` workers and hands each of them its threads and cores.
+    Args:
+        serving (dict): The `serving` section of the service config.
+        runners (int): Number of runners sharing the runner cores.
+        runner_index (int): Index of this runner among them.
+    Returns:
+        Type[bentoml.Strategy]: The strategy class for `bentoml.Runner`.
+    """
+    workers = serving['runner_workers']
+    layout = worker_layout(serving, runners)[runner_index * workers:
+                                             (runner_index + 1) * workers]
+
+    class TopologyStrategy(bentoml.Strategy):
+        @classmethod
+        def get_worker_count(cls, runnable_class, resource_request,
+                             workers_per_resource) -> int:
+            return workers
+
+        @classmethod
+        def get_worker_env(cls, runnable_class, resource_request,
+                           workers_per_resource,
+                           worker_index: int) -> Dict[str, str]:
+            threads, cores = layout[worker_index]
+            environ = {'CUDA_VISIBLE_DEVICES': '-1'}
+            environ.update((name, str(threads)) for name in THREAD_ENVS)
+            if cores is not None:
+                environ[CORES_ENV] = ','.join(map(str, cores))
+            return environ
+
+    return TopologyStrategy
+
+
+def apply_worker_topology(interop_threads: Optional[int]) -> None:
+    """
+    Pins the current runner worker to its cores and sets the threads of
+    PyTorch from the environment assigned by `topology_strategy`.
+    Args:
+        interop_threads (int, optional): Inter-op threads of PyTorch. None
+                                         keeps its default.
+    """
+    cores = os.environ.get(CORES_ENV)
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, [int(core) for core in cores.split(',')])
+    threads = os.environ.get('BENTOML_NUM_THREAD')
+    if threads:
+        torch.set_num_threads(int(threads))
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Only possible before the first inter-op parallel work.
+            print("Inter-op threads were already started, keeping "
+                  f"{torch.get_num_interop_threads()}")
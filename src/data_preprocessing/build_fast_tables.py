@@ -0,0 +1,260 @@
+"""
+This module builds the lookup tables of the fast preprocessing path in
+`fast_text_processing.py` from NLTK and the model vocabulary.
+
+The tables contain:
+- The NLTK English stopwords.
+- The abbreviations of the English Punkt sentence tokenizer.
+- A token -> lemma table, resolved for every (token, POS) pair with the
+  POS tag the token most likely receives. Candidate tokens are the
+  vocabulary entries, their regular inflections and WordNet's irregular
+  forms of them. The POS of a token is taken from its most frequent
+  in-context tag in the corpus, and otherwise from tagging the token on
+  its own.
+- The parity report of the tables against the NLTK pipeline on the
+  corpus, see `parity_report`.
+
+The table has one lemma per token, so a token that NLTK lemmatizes
+differently depending on its context, e.g. 'saw' or 'left', always gets
+the lemma of its most frequent tag. The parity report measures how often
+this, and any tokenization difference, changes the token ids of a query.
+The tables are only written if the share of queries with identical token
+ids reaches `--min-agreement`, and `load_fast_preprocessor` refuses tables
+without a report, so the parity gate is part of every build.
+
+Only public NLTK APIs are used: the stopwords corpus, the tagger, the
+lemmatizer and the data files of WordNet and Punkt.
+
+Usage:
+    python -m src.data_preprocessing.build_fast_tables \
+        --vocab data/vocab.json --corpus queries.jsonl \
+        --output data/fast_preprocessing.json
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Set
+import nltk
+from nltk import pos_tag
+from nltk.corpus import stopwords, wordnet
+from nltk.stem import WordNetLemmatizer
+from src.data_preprocessing.fast_text_processing import DEFAULT_TABLES_PATH
+from src.data_preprocessing.fast_text_processing import FastPreprocessor
+from src.data_preprocessing.text_processing import clean_text, lemmatizer
+from src.data_preprocessing.text_processing import nltk_to_wordnet_pos
+
+SPECIAL_TOKENS = ('<UNK>', '<PAD>')
+VOWELS = set('aeiou')
+EXCEPTION_FILES = ('noun.exc', 'verb.exc', 'adj.exc', 'adv.exc')
+ABBREVIATIONS_FILE = 'tokenizers/punkt_tab/english/abbrev_types.txt'
+
+
+def inflections(lemma: str) -> Set[str]:
+    """
+    Generates the regular English inflections of a lemma.
+    Args:
+        lemma (str): A base form, e.g. 'card' or 'stop'.
+    Returns:
+        Set[str]: Candidate inflected forms, e.g. 'cards', 'stopped'.
+    """
+    forms = {lemma + 's', lemma + 'es', lemma + 'ed', lemma + 'd',
+             lemma + 'ing', lemma + 'er', lemma + 'est'}
+    if lemma.endswith('y') and len(lemma) > 2:
+        forms.update({lemma[:-1] + 'ies', lemma[:-1] + 'ied',
+                      lemma[:-1] + 'ier', lemma[:-1] + 'iest'})
+    if lemma.endswith('e'):
+        forms.update({lemma[:-1] + 'ing', lemma[:-1] + 'er',
+                      lemma[:-1] + 'est'})
+    if (len(lemma) > 2 and lemma[-1] not in VOWELS | {'w', 'x', 'y'}
+            and lemma[-2] in VOWELS and lemma[-3] not in VOWELS):
+        forms.update({lemma + lemma[-1] + 'ed', lemma + lemma[-1] + 'ing',
+                      lemma + lemma[-1] + 'er'})
+    return forms
+
+
+def candidate_tokens(vocab: Dict[str, int]) -> Set[str]:
+    """
+    Collects the surface forms whose lemma may be in the vocabulary.
+    Args:
+        vocab (dict): The model vocabulary.
+    Returns:
+        Set[str]: Vocabulary tokens, their regular inflections and the
+                  irregular WordNet forms of them.
+    """
+    lemmas = {token for token in vocab if token not in SPECIAL_TOKENS}
+    candidates = set(lemmas)
+    for lemma in lemmas:
+        candidates.update(inflections(lemma))
+    for name in EXCEPTION_FILES:
+        with wordnet.open(name) as f:
+            for line in f:
+                form, *bases = line.split()
+                if lemmas.intersection(bases):
+                    candidates.add(form)
+    return {token for token in candidates if token.isalpha()}
+
+
+def corpus_tags(texts: Iterable[str]) -> Dict[str, Counter]:
+    """
+    Counts the in-context WordNet POS tags of every cleaned token, exactly
+    as `lemmatizer` assigns them.
+    Args:
+        texts (Iterable[str]): Representative query texts.
+    Returns:
+        Dict[str, Counter]: POS tag counts per token.
+    """
+    counts: Dict[str, Counter] = defaultdict(Counter)
+    for text in texts:
+        cleaned = clean_text(text)
+        if not cleaned:
+            continue
+        for token, tag in pos_tag(cleaned.split()):
+            counts[token][nltk_to_wordnet_pos(tag)] += 1
+    return counts
+
+
+def build_tables(vocab: Dict[str, int], texts: Iterable[str] = ()) -> dict:
+    """
+    Builds the tables of the fast preprocessing path.
+    Args:
+        vocab (dict): The model vocabulary.
+        texts (Iterable[str]): Optional corpus used to resolve the POS of
+                               ambiguous tokens from their context.
+    Returns:
+        dict: The 'stop_words', 'abbreviations' and 'lemmas' tables.
+    """
+    stop_words = set(stopwords.words('english'))
+    wordnet_lem = WordNetLemmatizer()
+    tag_counts = corpus_tags(texts)
+
+    tokens: List[str] = sorted(
+        (candidate_tokens(vocab) | set(tag_counts)) - stop_words)
+    tagged = {token: pos_tag([token])[0][1] for token in tokens}
+
+    lemmas = {}
+    for token in tokens:
+        if token in tag_counts:
+            wn_tag = tag_counts[token].most_common(1)[0][0]
+        else:
+            wn_tag = nltk_to_wordnet_pos(tagged[token])
+        if wn_tag is None:
+            lemma = wordnet_lem.lemmatize(token)
+        else:
+            lemma = wordnet_lem.lemmatize(token, pos=wn_tag)
+        if lemma != token:
+            lemmas[token] = lemma
+
+    with nltk.data.find(ABBREVIATIONS_FILE).open(encoding='utf-8') as f:
+        abbreviations = {line.strip() for line in f if line.strip()}
+
+    return {
+        'stop_words': sorted(stop_words),
+        'abbreviations': sorted(abbreviations),
+        'lemmas': lemmas,
+    }
+
+
+def parity_report(fast: FastPreprocessor, texts: Sequence[str],
+                  vocab: Dict[str, int], show: int = 20) -> dict:
+    """
+    Compares the fast path with `lemmatizer(clean_text(text))` on a corpus.
+    Args:
+        fast (FastPreprocessor): The fast path to check.
+        texts (Sequence[str]): The corpus. Duplicates are compared once.
+        vocab (dict): The model vocabulary, to compare token ids.
+        show (int): Number of mismatching queries and tokens reported.
+    Returns:
+        dict: The number of 'queries', the shares of them with
+              'identical_tokens' and with 'identical_token_ids', the
+              'token_id_agreement' over all tokens, the 'lemma_disagreement'
+              of the tokens both paths split alike, i.e. how often the
+              lemma of the token's most frequent tag differs from its lemma
+              in context, the tokens with the most such disagreements in
+              'context_dependent_tokens' and examples of 'mismatches'.
+    """
+    unk = vocab['<UNK>']
+    texts = list(dict.fromkeys(texts))
+    same_tokens = same_ids = total_tokens = same_token_ids = 0
+    split_alike = lemma_differs = 0
+    context_dependent = Counter()
+    mismatches = []
+    for text in texts:
+        cleaned = clean_text(text)
+        expected = lemmatizer(cleaned) if cleaned else []
+        actual = fast.process(text)
+        expected_ids = [vocab.get(t, unk) for t in expected]
+        actual_ids = [vocab.get(t, unk) for t in actual]
+        same_tokens += expected == actual
+        same_ids += expected_ids == actual_ids
+        total_tokens += len(expected)
+        same_token_ids += sum(a == b for a, b in zip(expected_ids,
+                                                     actual_ids))
+        tokens = cleaned.split()
+        if [t for t in fast.tokenize(text)
+                if t not in fast.stop_words] == tokens:
+            split_alike += len(tokens)
+            for token, e, a in zip(tokens, expected, actual):
+                if e != a:
+                    lemma_differs += 1
+                    context_dependent[token] += 1
+        if expected_ids != actual_ids and len(mismatches) < show:
+            mismatches.append({'text': text, 'nltk': expected,
+                               'fast': actual})
+
+    queries = max(len(texts), 1)
+    return {
+        'queries': len(texts),
+        'identical_tokens': same_tokens / queries,
+        'identical_token_ids': same_ids / queries,
+        'token_id_agreement': same_token_ids / max(total_tokens, 1),
+        'lemma_disagreement': lemma_differs / max(split_alike, 1),
+        'context_dependent_tokens': dict(context_dependent.most_common(show)),
+        'mismatches': mismatches,
+    }
+
+
+def read_texts(path: Path) -> List[str]:
+    """
+    Reads query texts from a JSONL file with one JSON string or object
+    with a 'text' field per line.
+    """
+    texts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                texts.append(row if isinstance(row, str) else row['text'])
+    return texts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the fast preprocessing tables.')
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--corpus', type=Path, required=True,
+                        help='JSONL queries that resolve the POS of the '
+                             'tokens and that the parity gate runs on')
+    parser.add_argument('--output', type=Path, default=DEFAULT_TABLES_PATH)
+    parser.add_argument('--min-agreement', type=float, default=0.99,
+                        help='Share of queries with identical token ids '
+                             'below which no tables are written')
+    args = parser.parse_args()
+
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    corpus = read_texts(args.corpus)
+
+    tables = build_tables(vocab, corpus)
+    tables['parity'] = parity_report(
+        FastPreprocessor(tables['stop_words'], tables['abbreviations'],
+                         tables['lemmas']), corpus, vocab)
+    print(json.dumps(tables['parity'], indent=2))
+    if tables['parity']['identical_token_ids'] < args.min_agreement:
+        sys.exit(f"Parity {tables['parity']['identical_token_ids']:.4f} "
+                 f"is below {args.min_agreement}; not writing {args.output}")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(tables, f, ensure_ascii=False, sort_keys=True)
+    print(f"Wrote {len(tables['lemmas'])} lemmas to {args.output}")
@@ -0,0 +1,27 @@
+"""
+This module vendors the NLTK resources used by `text_processing.py` into
+the `nltk_data` directory, which `bentofile.yaml` ships with the Bento.
+
+It runs once at build time, so the service never downloads anything at
+startup and resolves NLTK data only from the vendored directory.
+
+Usage:
+    python -m src.data_preprocessing.download_nltk_data --output nltk_data
+"""
+
+import argparse
+import nltk
+from src.data_preprocessing.text_processing import NLTK_DATA_DIR
+from src.data_preprocessing.text_processing import NLTK_RESOURCES
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Vendor the NLTK resources into nltk_data.')
+    parser.add_argument('--output', default=NLTK_DATA_DIR)
+    args = parser.parse_args()
+
+    for name in NLTK_RESOURCES:
+        if not nltk.download(name, download_dir=args.output, quiet=True):
+            raise SystemExit(f"Failed to download NLTK resource '{name}'")
+    print(f"Vendored {sorted(NLTK_RESOURCES)} into {args.output}")
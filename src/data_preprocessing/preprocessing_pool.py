@@ -0,0 +1,289 @@
+"""
+This module provides a multi-process preprocessing engine for large batch
+jobs, such as scoring historical chat logs.
+
+The `clean_text` -> `lemmatizer` chain is pure Python and holds the GIL, so
+threads do not speed it up. The engine shards the input into chunks and
+preprocesses them in a pool of worker processes. Every worker loads the
+NLTK resources (or the fast preprocessing tables) and the vocabulary once,
+when it starts. Chunks are returned in input order, and only a bounded
+number of chunks is in flight at any time, so memory stays bounded however
+large the input is and however slowly the results are consumed.
+
+The module includes:
+- `TEXT_KEYS` and `ID_KEYS`: The fields of the text and of the id of a
+  batch row, shared by every reader of batch rows.
+- `tokenize`: Cleans and lemmatizes a single text, with the fast path or
+  with NLTK.
+- `preprocess_batch`: Preprocesses texts into token ids, collecting
+  per-text errors. The service runs it on the chunks of batch requests.
+- `preprocess_texts`: `preprocess_batch` with the resources of a worker.
+  This is what every worker runs on its chunks.
+- `PreprocessingPool`: The process pool, with in-order, bounded streaming
+  of chunks.
+- `read_texts`: Reads the texts of a JSONL file of batch rows.
+
+Usage:
+    python -m src.data_preprocessing.preprocessing_pool \
+        --input chat_logs.jsonl --output token_ids.jsonl --workers 16
+"""
+
+import argparse
+import collections
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, ContextManager, Deque, Dict, Iterable, Iterator
+from typing import List, Optional, Tuple, Union
+from src.data_preprocessing.text_processing import check_nltk_resources
+from src.data_preprocessing.text_processing import clean_text, lemmatizer
+from src.data_preprocessing.text_processing import numericalize_batch
+from src.data_preprocessing.text_processing import warm_up
+from src.data_preprocessing.fast_text_processing import FastPreprocessor
+from src.data_preprocessing.fast_text_processing import load_fast_preprocessor
+from src.data_preprocessing.vocab_index import VocabIndex, load_vocab_index
+
+# Token ids of the valid texts, their offsets in the chunk and the error of
+# every invalid text by offset.
+ChunkResult = Tuple[List[List[int]], List[int], Dict[int, str]]
+
+TEXT_KEYS = ('text', 'query_text', 'body')
+ID_KEYS = ('id', 'request_id')
+
+_vocab: Union[VocabIndex, Dict[str, int], None] = None
+_fast_preprocessor: Optional[FastPreprocessor] = None
+
+
+def _init_worker(mode: str, fast_tables: Optional[Path],
+                 vocab_index: Optional[Path], vocab_path: Path) -> None:
+    global _vocab, _fast_preprocessor
+    if mode == 'fast':
+        _fast_preprocessor = load_fast_preprocessor(fast_tables)
+    else:
+        warm_up()
+
+    if vocab_index is not None:
+        _vocab = load_vocab_index(vocab_index)
+    else:
+        with open(vocab_path, 'r', encoding='utf-8') as f:
+            _vocab = json.load(f)
+
+
+def tokenize(text: object,
+             fast_preprocessor: Optional[FastPreprocessor] = None,
+             timer: Callable[[str], ContextManager] = contextlib.nullcontext
+             ) -> List[str]:
+    """
+    Cleans and lemmatizes a single text.
+    Args:
+        text (object): Input text from the user.
+        fast_preprocessor (FastPreprocessor, optional): The fast path. The
+                    NLTK path is used without one.
+        timer (Callable[[str], ContextManager]): Times every stage by its
+                    name, e.g. the service's `stage_timer`.
+    Returns:
+        List[str]: The lemmatized tokens of the text.
+    Raises:
+        ValueError: If the text is not a non-empty string or has no token
+                    left.
+    """
+    if not text or not isinstance(text, str):
+        raise ValueError("Invalid input. Please provide a text string.")
+
+    if fast_preprocessor is not None:
+        with timer('fast_preprocess'):
+            tokens = fast_preprocessor.process(text)
+    else:
+        with timer('clean_text'):
+            cleaned_text = clean_text(text)
+        with timer('lemmatizer'):
+            tokens = lemmatizer(cleaned_text)
+    if not tokens:
+        raise ValueError("Invalid input: Expected a non-empty string.")
+    return tokens
+
+
+def preprocess_batch(texts: Iterable[object],
+                     vocab: Union[VocabIndex, Dict[str, int]],
+                     fast_preprocessor: Optional[FastPreprocessor] = None,
+                     timer: Callable[[str], ContextManager]
+                     = contextlib.nullcontext) -> ChunkResult:
+    """
+    Cleans, lemmatizes and numericalizes a chunk of texts. The tokens of
+    all valid texts are numericalized at once, see `numericalize_batch`.
+    Args:
+        texts (Iterable[object]): The texts. Anything that is not a
+                    non-empty string is reported as an error.
+        vocab (Union[VocabIndex, Dict[str, int]]): The vocabulary.
+        fast_preprocessor (FastPreprocessor, optional): See `tokenize`.
+        timer (Callable[[str], ContextManager]): See `tokenize`.
+    Returns:
+        ChunkResult: The token ids of the valid texts, their offsets and
+                     the error of every invalid text by offset.
+    """
+    token_lists, valid, errors = [], [], {}
+    for offset, text in enumerate(texts):
+        try:
+            token_lists.append(tokenize(text, fast_preprocessor, timer))
+            valid.append(offset)
+        except (ValueError, RuntimeError) as e:
+            errors[offset] = str(e)
+    with timer('numericalize_batch'):
+        sequences = numericalize_batch(vocab, token_lists)
+    return sequences, valid, errors
+
+
+def preprocess_texts(texts: List[object]) -> ChunkResult:
+    """
+    Preprocesses a chunk of texts with the resources loaded by the worker
+    initializer, see `preprocess_batch`.
+    """
+    return preprocess_batch(texts, _vocab, _fast_preprocessor)
+
+
+class PreprocessingPool:
+    """
+    Pool of worker processes that preprocess chunks of texts.
+
+    Args:
+        workers (int): Number of worker processes, at most one per core
+                       makes sense.
+        mode (str): 'nltk' for `clean_text` and `lemmatizer`, 'fast' for the
+                    NLTK-free `FastPreprocessor`.
+        fast_tables (Path, optional): Tables of the fast preprocessing path.
+        vocab_index (Path, optional): Directory of the memory-mapped
+                    vocabulary index, shared by all workers.
+        vocab_path (Path): The JSON vocabulary, used without `vocab_index`.
+        max_pending (int, optional): Chunks in flight at most in `map`.
+                    Defaults to two per worker.
+    """
+    def __init__(self, workers: int, mode: str = 'nltk',
+                 fast_tables: Optional[Path] = None,
+                 vocab_index: Optional[Path] = None,
+                 vocab_path: Path = Path('data/vocab.json'),
+                 max_pending: Optional[int] = None):
+        if mode not in ('nltk', 'fast'):
+            raise ValueError(f"Unknown preprocessing mode: {mode}")
+        if mode == 'nltk':
+            # Fails here instead of breaking every worker at startup.
+            check_nltk_resources()
+
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        # Spawned workers do not inherit the threads and locks of the
+        # parent, which is unsafe with fork in a BentoML worker.
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(mode, fast_tables, vocab_index, vocab_path))
+
+    def submit(self, texts: List[object]) -> 'Future[ChunkResult]':
+        """
+        Preprocesses one chunk of texts in a worker.
+        Args:
+            texts (List[object]): The texts of the chunk.
+        Returns:
+            Future[ChunkResult]: The result of `preprocess_texts`.
+        """
+        return self._executor.submit(preprocess_texts, texts)
+
+    def map(self, texts: Iterable[object], chunk_size: int = 256
+            ) -> Iterator[Tuple[List[object], ChunkResult]]:
+        """
+        Preprocesses texts chunk by chunk, in input order. The input is read
+        lazily and at most `max_pending` chunks are in flight, so a slow
+        consumer holds the workers back instead of buffering results.
+        Args:
+            texts (Iterable[object]): The texts.
+            chunk_size (int): Texts per chunk.
+        Returns:
+            Iterator[Tuple[List[object], ChunkResult]]: Every chunk with
+                     its result.
+        """
+        texts = iter(texts)
+        pending: Deque[Tuple[List[object], Future]] = collections.deque()
+        while True:
+            while len(pending) < self.max_pending:
+                chunk = list(itertools.islice(texts, chunk_size))
+                if not chunk:
+                    break
+                pending.append((chunk, self.submit(chunk)))
+            if not pending:
+                return
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+
+    def close(self) -> None:
+        """
+        Stops the worker processes, dropping chunks that did not start.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> 'PreprocessingPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def read_texts(lines: Iterable[str]) -> Iterator[object]:
+    """
+    Reads the text of every JSONL row, see `TEXT_KEYS`. Rows that are not
+    valid JSON are passed on as None, so they are reported as errors.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            yield None
+            continue
+        if isinstance(row, dict):
+            yield next((row[k] for k in TEXT_KEYS if k in row), None)
+        else:
+            yield row
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Preprocess a JSONL file of texts into token ids.')
+    parser.add_argument('--input', type=Path, required=True,
+                        help="JSONL rows: strings or objects with a 'text', "
+                             "'query_text' or 'body' field")
+    parser.add_argument('--output', type=Path, required=True,
+                        help="JSONL rows with the 'index' and the "
+                             "'token_ids' or 'error' of every input row")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--mode', choices=('nltk', 'fast'), default='nltk')
+    parser.add_argument('--fast-tables', type=Path,
+                        default=Path('data/fast_preprocessing.json'))
+    parser.add_argument('--vocab-index', type=Path,
+                        default=Path('data/vocab_index'))
+    args = parser.parse_args()
+
+    count = errors = 0
+    with open(args.input, 'r', encoding='utf-8') as f_in, \
+            open(args.output, 'w', encoding='utf-8') as f_out, \
+            PreprocessingPool(args.workers, args.mode, args.fast_tables,
+                              args.vocab_index) as pool:
+        for chunk, (sequences, valid, chunk_errors) in pool.map(
+                read_texts(f_in), args.chunk_size):
+            ids = dict(zip(valid, sequences))
+            for offset in range(len(chunk)):
+                row = ({'index': count + offset, 'token_ids': ids[offset]}
+                       if offset in ids else
+                       {'index': count + offset,
+                        'error': chunk_errors[offset]})
+                f_out.write(json.dumps(row) + '\n')
+            count += len(chunk)
+            errors += len(chunk_errors)
+    print(f"Preprocessed {count} rows ({errors} errors) into {args.output}",
+          file=sys.stderr)
@@ -5,7 +5,11 @@ numericalize text based on a given vocabulary. These utilities are designed to
 be used as part of a larger pipeline for preparing text data for machine
 learning models.
 
+NLTK resources are resolved only from the vendored `nltk_data` directory
+and the stopwords, tagger and lemmatizer are loaded lazily on first use.
+
 The module includes:
+- `warm_up`: Loads the lazily initialized NLTK resources ahead of time.
 - `clean_text`: Cleans input text by removing punctuation, stopwords, and
   converting to lowercase.
 - `nltk_to_wordnet_pos`: Converts NLTK POS tags to WordNet POS tags for
@@ -14,40 +18,93 @@ The module includes:
   to their base form.
 - `numericalize`: Converts tokens in text data to numerical indices based on a
   given vocabulary. 
+- `numericalize_batch`: Converts the tokens of many texts at once, with the
+  vectorized lookup of a `VocabIndex`.
 Dependencies:
 - NLTK (Natural Language Toolkit) is used for tokenization, stopwords,
   POS tagging, and lemmatization.
 """
 
+import functools
+import os
 import re
-# import os
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
-from nltk import pos_tag
 from nltk.corpus import wordnet
 from nltk.stem import WordNetLemmatizer
+from nltk.tag import PerceptronTagger
 import nltk
-from typing import List, Dict, Union
+from typing import List, Dict, Sequence, Union, FrozenSet
+
+
+# NLTK resources are vendored into `nltk_data` at build time (see
+# `download_nltk_data.py`) and are only resolved from there, so importing
+# this module never touches the network.
+NLTK_DATA_DIR = os.path.abspath(os.getenv('NLTK_DATA', 'nltk_data'))
+nltk.data.path[:] = [NLTK_DATA_DIR]
+
+NLTK_RESOURCES = {
+    'punkt_tab': 'tokenizers/punkt_tab',
+    'averaged_perceptron_tagger_eng': 'taggers/averaged_perceptron_tagger_eng',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+}
+
+
+def check_nltk_resources() -> None:
+    """
+    Checks that all NLTK resources used by this module are vendored.
+    Raises:
+        LookupError: If a resource is missing from `NLTK_DATA_DIR`.
+    """
+    missing = []
+    for name, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            try:
+                nltk.data.find(resource + '.zip')
+            except LookupError:
+                missing.append(name)
+    if missing:
+        raise LookupError(
+            f"NLTK resources {missing} not found in {NLTK_DATA_DIR}. Vendor "
+            "them with `python -m src.data_preprocessing.download_nltk_data`.")
+
+
+@functools.lru_cache(maxsize=None)
+def get_stop_words() -> FrozenSet[str]:
+    """
+    Returns the English stopwords, loaded on first use.
+    """
+    return frozenset(stopwords.words('english'))
+
+
+@functools.lru_cache(maxsize=None)
+def get_wordnet_lemmatizer() -> WordNetLemmatizer:
+    """
+    Returns the WordNet lemmatizer, loaded on first use.
+    """
+    wordnet_lem = WordNetLemmatizer()
+    wordnet.ensure_loaded()
+    return wordnet_lem
+
 
+@functools.lru_cache(maxsize=None)
+def get_tagger() -> PerceptronTagger:
+    """
+    Returns the English POS tagger, loaded on first use.
+    """
+    return PerceptronTagger()
 
-nltk.data.path.append('nltk_data')
-# nltk.data.load(os.path.join('nltk_data',
-#                             'tokenizers/punkt/PY3/english.pickle'))
-# nltk.data.load(
-#     os.path.join(
-#         'nltk_data',
-#         'taggers',
-#         'averaged_perceptron_tagger',
-#         'averaged_perceptron_tagger.pickle'
-#     )
-# )
-# nltk.data.load(os.path.join('nltk_data', 'corpora/stopwords/english'),
-#                format='text')
 
-nltk.download('punkt')
-nltk.download('punkt_tab')
-nltk.download('averaged_perceptron_tagger_eng')
-nltk.download('stopwords')
+def warm_up() -> None:
+    """
+    Loads all lazily initialized NLTK resources by preprocessing a dummy
+    text, so the first real request does not pay for it.
+    """
+    check_nltk_resources()
+    lemmatizer(clean_text('Where is my new card?'))
 
 
 def clean_text(text: str) -> str:
@@ -61,7 +118,7 @@ def clean_text(text: str) -> str:
     tokens = word_tokenize(tokens)
     tokens = [w.lower() for w in tokens]
     tokens = [word for word in tokens if word.isalpha()]
-    stop_words = set(stopwords.words('english'))
+    stop_words = get_stop_words()
     tokens = [word for word in tokens if word not in stop_words]
     return ' '.join(tokens)
   
@@ -112,9 +169,9 @@ def lemmatizer(data: str) -> List[str]:
         raise ValueError("Invalid input: Expected a non-empty string.")
     
     try:
-        wordnet_lem = WordNetLemmatizer()
+        wordnet_lem = get_wordnet_lemmatizer()
         tokens = word_tokenize(data)
-        pos_tags = pos_tag(tokens)
+        pos_tags = get_tagger().tag(tokens)
     except Exception as e:
         raise RuntimeError(f"Error during tokenization or POS tagging: {e}")
     
@@ -138,7 +195,7 @@ def numericalize(vocab: Dict[str, int],
     a special '<UNK>' token is used.
     Args:
         vocab (dict): A dictionary mapping tokens (words) to their
-                      corresponding numerical indices.
+                      corresponding numerical indices, or a `VocabIndex`.
         data (Union[List[str], List[List[str]]]): 
                      A list of tokens (words) to be converted into numerical
                      indices.
@@ -146,14 +203,45 @@ def numericalize(vocab: Dict[str, int],
         List[List[int]]: A list containing a list of numerical indices 
                         representing the input text data.
     """
-    if not vocab or '<UNK>' not in vocab:
-        raise ValueError("Vocabulary is missing or '<UNK>' token not found.")
-
     if not isinstance(data, list) or not data:
         raise ValueError("Input data must be a non-empty list.")
-      
+
+    # A VocabIndex knows its '<UNK>' id and looks up all tokens at once.
+    if hasattr(vocab, 'lookup'):
+        return [vocab.lookup(data).tolist()]
+
+    unk_id = vocab.get('<UNK>') if vocab else None
+    if unk_id is None:
+        raise ValueError("Vocabulary is missing or '<UNK>' token not found.")
+
     indexed_data = []
-    indexed_seq = [vocab.get(token, vocab['<UNK>']) for token in data]
+    indexed_seq = [vocab.get(token, unk_id) for token in data]
     indexed_data.append(indexed_seq)
 
-    return indexed_data
\ No newline at end of file
+    return indexed_data
+
+
+def numericalize_batch(vocab: Dict[str, int],
+                       data: Sequence[List[str]]) -> List[List[int]]:
+    """
+    Converts the tokens of many texts into their numerical indices. With a
+    `VocabIndex`, all tokens are looked up in one vectorized search, which
+    is much cheaper per text than `VocabIndex.lookup` on every text; use
+    `numericalize` with the dictionary for single texts. The indices are
+    returned as lists, since the prediction cache, the truncation, the
+    routing by length and the runners all take lists, so the padded
+    buffer of `VocabIndex.numericalize_batch` is not passed on.
+    Args:
+        vocab (dict): The vocabulary dictionary, or a `VocabIndex`.
+        data (Sequence[List[str]]): The non-empty token lists of the texts.
+    Returns:
+        List[List[int]]: The numerical indices of every text, in input
+                         order.
+    """
+    if not hasattr(vocab, 'numericalize_batch'):
+        return [numericalize(vocab, tokens)[0] for tokens in data]
+    if not all(data):
+        raise ValueError("Input data must be non-empty lists.")
+    padded, lengths = vocab.numericalize_batch(data)
+    return [row[:length]
+            for row, length in zip(padded.tolist(), lengths.tolist())]
@@ -0,0 +1,206 @@
+"""
+This module provides a compact, memory-mapped index of the vocabulary that
+replaces the `vocab.json` dictionary in the serving workers.
+
+The tokens are stored as one sorted array of fixed-width byte strings next
+to the array of their ids, both as `.npy` files. The workers memory-map
+the files read-only, so all of them share the same pages, and look tokens
+up by binary search. All tokens of a query, or of a whole batch of
+queries, are looked up in one vectorized search, and a batch is written
+straight into a padded int64 buffer that can be reused across batches.
+
+The module includes:
+- `VocabIndex`: Read-only, dict-like view of the index, usable wherever
+  `numericalize` expects the vocabulary, with vectorized lookups of token
+  lists and batches.
+- `build_vocab_index`: Writes the index files of a vocabulary.
+- `load_vocab_index`: Memory-maps the index files.
+
+Usage:
+    python -m src.data_preprocessing.vocab_index --vocab data/vocab.json \
+        --output data/vocab_index
+"""
+
+import argparse
+import itertools
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+import numpy as np
+
+DEFAULT_INDEX_PATH = Path('data/vocab_index')
+TOKENS_FILE = 'tokens.npy'
+IDS_FILE = 'ids.npy'
+
+
+class VocabIndex:
+    """
+    Sorted token -> id index with the read-only mapping interface of the
+    vocabulary dictionary.
+
+    Args:
+        tokens (np.ndarray): Sorted, UTF-8 encoded tokens of dtype 'S<n>'.
+        ids (np.ndarray): Id of every token in `tokens`.
+        unk_token (str): Token whose id replaces unknown tokens.
+        pad_token (str): Token whose id pads batches.
+    """
+    def __init__(self, tokens: np.ndarray, ids: np.ndarray,
+                 unk_token: str = '<UNK>', pad_token: str = '<PAD>'):
+        # Plain ndarray views of memory-mapped files still share their pages
+        # but skip the per-call overhead of the np.memmap subclass.
+        self.tokens = np.asarray(tokens)
+        self.ids = np.asarray(ids)
+        self.width = tokens.dtype.itemsize
+        # Keys are encoded one byte wider than the stored tokens to spot the
+        # longer ones, which can never match, before they are truncated.
+        self.key_dtype = np.dtype(f'S{self.width + 1}')
+        self.unk_id = self[unk_token]
+        self.pad_id = self[pad_token]
+
+    def _position(self, token: str) -> Optional[int]:
+        key = token.encode('utf-8')
+        if len(key) > self.width or not key or key.endswith(b'\0'):
+            return None
+        position = int(np.searchsorted(self.tokens, key))
+        if position < len(self.tokens) and self.tokens[position] == key:
+            return position
+        return None
+
+    def get(self, token: str, default: Optional[int] = None) -> Optional[int]:
+        """
+        Returns the id of `token`, or `default` if it is not in the vocabulary.
+        """
+        position = self._position(token)
+        return default if position is None else int(self.ids[position])
+
+    def __getitem__(self, token: str) -> int:
+        position = self._position(token)
+        if position is None:
+            raise KeyError(token)
+        return int(self.ids[position])
+
+    def __contains__(self, token: object) -> bool:
+        return isinstance(token, str) and self._position(token) is not None
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def __iter__(self) -> Iterator[str]:
+        return (token.decode('utf-8') for token in self.tokens)
+
+    def _encode(self, tokens: Iterable[str], count: int) -> np.ndarray:
+        # The tokens are read twice when one is not ASCII, so a one-shot
+        # iterator is materialized first.
+        if not isinstance(tokens, (list, tuple)):
+            tokens = list(tokens)
+        try:
+            return np.fromiter(tokens, dtype=self.key_dtype, count=count)
+        except UnicodeEncodeError:
+            return np.fromiter((token.encode('utf-8') for token in tokens),
+                               dtype=self.key_dtype, count=count)
+
+    def _lookup_keys(self, keys: np.ndarray) -> np.ndarray:
+        too_long = keys.view(np.uint8).reshape(len(keys), -1)[:, -1] != 0
+        # Searching with the dtype of the stored tokens avoids converting
+        # the whole token array on every call.
+        keys = keys.astype(self.tokens.dtype)
+        positions = np.searchsorted(self.tokens, keys)
+        np.minimum(positions, len(self.tokens) - 1, out=positions)
+        found = (self.tokens[positions] == keys) & ~too_long
+        return np.where(found, self.ids[positions], self.unk_id)
+
+    def lookup(self, tokens: Sequence[str]) -> np.ndarray:
+        """
+        Looks up all tokens of a query in one vectorized search. NumPy
+        byte strings drop trailing NUL characters, so unlike `get`, tokens
+        ending in them, which the preprocessing never produces, match the
+        token without them.
+        Args:
+            tokens (Sequence[str]): The tokens.
+        Returns:
+            np.ndarray: The int64 ids, with the '<UNK>' id for unknown tokens.
+        """
+        keys = self._encode(tokens, len(tokens))
+        return self._lookup_keys(keys).astype(np.int64, copy=False)
+
+    def numericalize_batch(self, token_lists: Sequence[Sequence[str]],
+                           out: Optional[np.ndarray] = None
+                           ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Numericalizes a batch of token lists into a right-padded int64
+        buffer, without building per-query lists of ids.
+        Args:
+            token_lists (Sequence[Sequence[str]]): The tokens of each query.
+            out (np.ndarray, optional): Preallocated int64 buffer with at
+                    least `len(token_lists)` rows and as many columns as
+                    the longest token list, reused across batches. A new
+                    buffer is allocated when omitted.
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The padded ids, a view of `out`
+                    of shape (len(token_lists), max_length), and the length
+                    of every query.
+        """
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64,
+                              count=len(token_lists))
+        max_length = int(lengths.max()) if len(lengths) else 0
+        if out is None:
+            out = np.empty((len(token_lists), max_length), dtype=np.int64)
+        elif (out.dtype != np.int64 or out.shape[0] < len(token_lists)
+              or out.shape[1] < max_length):
+            raise ValueError(f"Buffer of shape {out.shape} and dtype "
+                             f"{out.dtype} cannot hold {len(token_lists)} "
+                             f"int64 rows of length {max_length}.")
+
+        padded = out[:len(token_lists), :max_length]
+        padded.fill(self.pad_id)
+        keys = self._encode(itertools.chain.from_iterable(token_lists),
+                            int(lengths.sum()))
+        mask = np.arange(max_length) < lengths[:, None]
+        padded[mask] = self._lookup_keys(keys)
+        return padded, lengths
+
+
+def build_vocab_index(vocab: Dict[str, int], path: Path) -> None:
+    """
+    Writes the index files of a vocabulary.
+    Args:
+        vocab (dict): The model vocabulary.
+        path (Path): Directory of the index files.
+    """
+    keys = sorted(token.encode('utf-8') for token in vocab)
+    tokens = np.array(keys, dtype=f'S{max(map(len, keys))}')
+    ids = np.array([vocab[key.decode('utf-8')] for key in keys],
+                   dtype=np.int32)
+    path.mkdir(parents=True, exist_ok=True)
+    np.save(path / TOKENS_FILE, tokens)
+    np.save(path / IDS_FILE, ids)
+
+
+def load_vocab_index(path: Path = DEFAULT_INDEX_PATH) -> VocabIndex:
+    """
+    Memory-maps the index files written by `build_vocab_index`.
+    Args:
+        path (Path): Directory of the index files.
+    Returns:
+        VocabIndex: The read-only index.
+    """
+    try:
+        return VocabIndex(np.load(path / TOKENS_FILE, mmap_mode='r'),
+                          np.load(path / IDS_FILE, mmap_mode='r'))
+    except FileNotFoundError as e:
+        raise FileNotFoundError(
+            f"Vocabulary index not found at {path}. Build it with "
+            "`python -m src.data_preprocessing.vocab_index`.") from e
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the memory-mapped vocabulary index.')
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--output', type=Path, default=DEFAULT_INDEX_PATH)
+    args = parser.parse_args()
+
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    build_vocab_index(vocab, args.output)
+    print(f"Wrote the index of {len(vocab)} tokens to {args.output}")
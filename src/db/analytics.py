@@ -0,0 +1,410 @@
+"""
+This module keeps local, incrementally maintained aggregates of the logged
+predictions and feedback for monitoring dashboards.
+
+Dashboards ask a few questions over and over: how many queries each intent
+received per day, how confident the model was, how often the feedback
+marked its predictions correct, and whether the mix of intents drifts.
+Answering them from the raw `user_queries` and `feedback` tables means
+pulling every row out of Supabase each time. Here, only the rows inserted
+since the last sync are read, from a watermark per table, and folded into
+daily aggregates kept in a local SQLite file. The raw rows are
+not copied. A dashboard query then reads a few hundred aggregate rows and
+takes milliseconds, however large the tables grow.
+
+Rows are read in the order the database inserted them, by the
+server-assigned 'inserted_at' and the id (see
+`fetch_rows_inserted_after`), not by their ids, which the service
+generates before its write buffer inserts the rows, possibly much later,
+e.g. after a database outage. A late row is therefore synced by the next
+sync and counted on the day it was created. Only rows inserted more than
+`settle_minutes` ago are read, so that inserts still being committed
+cannot appear behind the watermark. The aggregates of a page and the new
+watermark are committed in one transaction, so an interrupted sync
+resumes where it stopped without counting a row twice.
+
+The aggregates are per UTC day and intent:
+- `intent_counts`: The queries and the sum of their confidence scores.
+- `confidence_histogram`: The queries per confidence bin of equal width.
+- `feedback_accuracy`: The feedback received on the predictions of an
+  intent and how much of it marked them correct.
+
+The module includes:
+- `AnalyticsStore`: Syncs and queries the aggregates.
+- `population_stability`: The drift between two intent distributions.
+- An entry point that syncs the store or prints a dashboard report.
+
+Usage:
+    python -m src.db.analytics sync
+    python -m src.db.analytics report --days 7
+"""
+
+import argparse
+import collections
+import json
+import math
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from supabase import Client
+from src.db.models import FEEDBACK_WITH_QUERY_COLUMNS
+from src.db.models import fetch_rows_inserted_after
+
+DEFAULT_PATH = Path('data/analytics.sqlite3')
+QUERY_COLUMNS = "id, predicted_intent, confidence_score, created_at"
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS settings ('
+    'name TEXT PRIMARY KEY, value TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS watermarks ('
+    'source TEXT PRIMARY KEY, inserted_at TEXT NOT NULL, '
+    'last_id INTEGER NOT NULL, synced_at REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS intent_counts ('
+    'day TEXT NOT NULL, intent TEXT NOT NULL, queries INTEGER NOT NULL, '
+    'confidence_sum REAL NOT NULL, PRIMARY KEY (day, intent))',
+    'CREATE TABLE IF NOT EXISTS confidence_histogram ('
+    'day TEXT NOT NULL, intent TEXT NOT NULL, bin INTEGER NOT NULL, '
+    'queries INTEGER NOT NULL, PRIMARY KEY (day, intent, bin))',
+    'CREATE TABLE IF NOT EXISTS feedback_accuracy ('
+    'day TEXT NOT NULL, intent TEXT NOT NULL, feedback INTEGER NOT NULL, '
+    'correct INTEGER NOT NULL, PRIMARY KEY (day, intent))',
+)
+
+
+def population_stability(expected: Dict[str, int], actual: Dict[str, int],
+                         epsilon: float = 1e-4) -> Optional[float]:
+    """
+    Returns the population stability index between two distributions of
+    counts. Below 0.1 is usually read as stable, above 0.25 as a shift.
+    Args:
+        expected (Dict[str, int]): Counts of the reference window.
+        actual (Dict[str, int]): Counts of the compared window.
+        epsilon (float): Share assumed for a key missing in a window.
+    Returns:
+        Optional[float]: The index, None if a window is empty, since there
+                         is nothing to compare.
+    """
+    expected_total, actual_total = sum(expected.values()), sum(actual.values())
+    if not expected_total or not actual_total:
+        return None
+    index = 0.0
+    for key in expected.keys() | actual.keys():
+        e = max(expected.get(key, 0) / expected_total, epsilon)
+        a = max(actual.get(key, 0) / actual_total, epsilon)
+        index += (a - e) * math.log(a / e)
+    return index
+
+
+class AnalyticsStore:
+    """
+    Local daily aggregates of the `user_queries` and `feedback` tables.
+
+    Args:
+        path (Path): Location of the local SQLite file.
+        bins (int): Number of confidence histogram bins between 0 and 1.
+                    Fixed when the file is created.
+    """
+    def __init__(self, path: Path = DEFAULT_PATH, bins: int = 20):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.execute(
+            'INSERT OR IGNORE INTO settings (name, value) VALUES (?, ?)',
+            ('bins', str(bins)))
+        stored = int(self._setting('bins'))
+        if stored != bins:
+            raise ValueError(f"{path} was built with {stored} confidence "
+                             f"bins, not {bins}; delete it to rebuild")
+        self.bins = bins
+
+    def sync(self, supabase: Client, settle_minutes: float = 5.0,
+             page_size: int = 1000) -> Dict[str, int]:
+        """
+        Folds the rows inserted since the last sync into the aggregates.
+        Args:
+            supabase (Client): The Supabase client instance.
+            settle_minutes (float): Rows inserted less than this ago are
+                                    left for the next sync.
+            page_size (int): Rows per request and per transaction.
+        Returns:
+            Dict[str, int]: The number of rows read from each table.
+        """
+        inserted_before = (datetime.now(timezone.utc)
+                           - timedelta(minutes=settle_minutes)).isoformat()
+        queries = fetch_rows_inserted_after(
+            supabase, 'user_queries', QUERY_COLUMNS,
+            self.watermark('user_queries'), inserted_before, page_size)
+        feedback = fetch_rows_inserted_after(
+            supabase, 'feedback', FEEDBACK_WITH_QUERY_COLUMNS,
+            self.watermark('feedback'), inserted_before, page_size)
+        return {
+            'user_queries': self._fold('user_queries', queries, page_size,
+                                       self._fold_queries),
+            'feedback': self._fold('feedback', feedback, page_size,
+                                   self._fold_feedback),
+        }
+
+    def watermark(self, source: str) -> Optional[Tuple[str, int]]:
+        """
+        Returns the 'inserted_at' and the id of the last synced row of a
+        table, None before the first sync.
+        """
+        row = self._conn.execute(
+            'SELECT inserted_at, last_id FROM watermarks WHERE source = ?',
+            (source,)).fetchone()
+        return tuple(row) if row else None
+
+    def intent_counts(self, start: Optional[str] = None,
+                      end: Optional[str] = None) -> List[dict]:
+        """
+        Returns the queries and the mean confidence of every intent.
+        Args:
+            start (str, optional): First day, 'YYYY-MM-DD', inclusive.
+            end (str, optional): Last day, 'YYYY-MM-DD', inclusive.
+        Returns:
+            List[dict]: {'intent', 'queries', 'mean_confidence'} rows, the
+                        most frequent intent first.
+        """
+        where, params = self._days(start, end)
+        rows = self._conn.execute(
+            'SELECT intent, SUM(queries), SUM(confidence_sum) '
+            f'FROM intent_counts {where} GROUP BY intent '
+            'ORDER BY SUM(queries) DESC, intent', params).fetchall()
+        return [{'intent': intent, 'queries': queries,
+                 'mean_confidence': confidence / queries}
+                for intent, queries, confidence in rows]
+
+    def daily_counts(self, intent: Optional[str] = None,
+                     start: Optional[str] = None,
+                     end: Optional[str] = None) -> List[dict]:
+        """
+        Returns the queries of every day, of one intent or of all.
+        Args:
+            intent (str, optional): The intent, None for all intents.
+            start (str, optional): First day, 'YYYY-MM-DD', inclusive.
+            end (str, optional): Last day, 'YYYY-MM-DD', inclusive.
+        Returns:
+            List[dict]: {'day', 'queries', 'mean_confidence'} rows in day
+                        order.
+        """
+        where, params = self._days(start, end, intent)
+        rows = self._conn.execute(
+            'SELECT day, SUM(queries), SUM(confidence_sum) '
+            f'FROM intent_counts {where} GROUP BY day ORDER BY day',
+            params).fetchall()
+        return [{'day': day, 'queries': queries,
+                 'mean_confidence': confidence / queries}
+                for day, queries, confidence in rows]
+
+    def confidence_histogram(self, intent: Optional[str] = None,
+                             start: Optional[str] = None,
+                             end: Optional[str] = None) -> List[dict]:
+        """
+        Returns the histogram of the confidence scores, of one intent or of
+        all.
+        Args:
+            intent (str, optional): The intent, None for all intents.
+            start (str, optional): First day, 'YYYY-MM-DD', inclusive.
+            end (str, optional): Last day, 'YYYY-MM-DD', inclusive.
+        Returns:
+            List[dict]: {'low', 'high', 'queries'} rows for every bin, in
+                        confidence order.
+        """
+        where, params = self._days(start, end, intent)
+        counts = dict(self._conn.execute(
+            'SELECT bin, SUM(queries) FROM confidence_histogram '
+            f'{where} GROUP BY bin', params).fetchall())
+        return [{'low': i / self.bins, 'high': (i + 1) / self.bins,
+                 'queries': counts.get(i, 0)} for i in range(self.bins)]
+
+    def feedback_accuracy(self, start: Optional[str] = None,
+                          end: Optional[str] = None) -> dict:
+        """
+        Returns the share of the feedback that marked the predictions
+        correct, overall and per predicted intent.
+        Args:
+            start (str, optional): First day, 'YYYY-MM-DD', inclusive.
+            end (str, optional): Last day, 'YYYY-MM-DD', inclusive.
+        Returns:
+            dict: {'feedback', 'accuracy', 'intents'}, where 'intents' has
+                  {'intent', 'feedback', 'accuracy'} rows, the least
+                  accurate intent first. Accuracies are None without
+                  feedback.
+        """
+        where, params = self._days(start, end)
+        rows = self._conn.execute(
+            'SELECT intent, SUM(feedback), SUM(correct) '
+            f'FROM feedback_accuracy {where} GROUP BY intent', params
+        ).fetchall()
+        intents = sorted(
+            ({'intent': intent, 'feedback': feedback,
+              'accuracy': correct / feedback}
+             for intent, feedback, correct in rows),
+            key=lambda row: (row['accuracy'], row['intent']))
+        feedback = sum(row[1] for row in rows)
+        correct = sum(row[2] for row in rows)
+        return {'feedback': feedback,
+                'accuracy': correct / feedback if feedback else None,
+                'intents': intents}
+
+    def intent_drift(self, start: str, end: str, reference_start: str,
+                     reference_end: str) -> Optional[float]:
+        """
+        Returns the population stability index of the intent distribution
+        of a window against a reference window, see `population_stability`.
+        None if either window has no queries.
+        """
+        def counts(first, last):
+            return {row['intent']: row['queries']
+                    for row in self.intent_counts(first, last)}
+
+        return population_stability(counts(reference_start, reference_end),
+                                    counts(start, end))
+
+    def report(self, days: int = 7,
+               today: Optional[datetime] = None) -> dict:
+        """
+        Returns the dashboard summary of the last `days` days, including
+        today, with the intent drift against the `days` days before, None
+        without queries in either window.
+        """
+        today = (today or datetime.now(timezone.utc)).date()
+        start = (today - timedelta(days=days - 1)).isoformat()
+        reference_start = (today - timedelta(days=2 * days - 1)).isoformat()
+        reference_end = (today - timedelta(days=days)).isoformat()
+        return {
+            'start': start,
+            'end': today.isoformat(),
+            'watermarks': {source: self.watermark(source)
+                           for source in ('user_queries', 'feedback')},
+            'intents': self.intent_counts(start),
+            'daily': self.daily_counts(start=start),
+            'confidence_histogram': self.confidence_histogram(start=start),
+            'feedback': self.feedback_accuracy(start),
+            'intent_drift': self.intent_drift(
+                start, today.isoformat(), reference_start, reference_end),
+        }
+
+    def close(self) -> None:
+        """
+        Closes the local file.
+        """
+        self._conn.close()
+
+    def _setting(self, name: str) -> str:
+        return self._conn.execute(
+            'SELECT value FROM settings WHERE name = ?', (name,)).fetchone()[0]
+
+    @staticmethod
+    def _days(start: Optional[str], end: Optional[str],
+              intent: Optional[str] = None) -> Tuple[str, tuple]:
+        conditions, params = [], []
+        for condition, value in (('day >= ?', start), ('day <= ?', end),
+                                 ('intent = ?', intent)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return where, tuple(params)
+
+    def _fold(self, source: str, rows: Iterable[dict], page_size: int,
+              fold) -> int:
+        read, page = 0, []
+        for row in rows:
+            page.append(row)
+            if len(page) == page_size:
+                self._commit(source, page, fold)
+                read, page = read + len(page), []
+        if page:
+            self._commit(source, page, fold)
+            read += len(page)
+        return read
+
+    def _commit(self, source: str, page: List[dict], fold) -> None:
+        self._conn.execute('BEGIN')
+        try:
+            fold(page)
+            self._conn.execute(
+                'INSERT INTO watermarks (source, inserted_at, last_id, '
+                'synced_at) VALUES (?, ?, ?, ?) ON CONFLICT (source) DO '
+                'UPDATE SET inserted_at = excluded.inserted_at, '
+                'last_id = excluded.last_id, synced_at = excluded.synced_at',
+                (source, page[-1]['inserted_at'], page[-1]['id'],
+                 time.time()))
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def _fold_queries(self, rows: List[dict]) -> None:
+        counts = collections.defaultdict(lambda: [0, 0.0])
+        histogram = collections.Counter()
+        for row in rows:
+            key = (row['created_at'][:10], row['predicted_intent'])
+            score = row['confidence_score']
+            counts[key][0] += 1
+            counts[key][1] += score
+            histogram[key + (min(int(score * self.bins), self.bins - 1),)] \
+                += 1
+        self._conn.executemany(
+            'INSERT INTO intent_counts (day, intent, queries, '
+            'confidence_sum) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (day, intent) DO UPDATE SET '
+            'queries = queries + excluded.queries, '
+            'confidence_sum = confidence_sum + excluded.confidence_sum',
+            [key + tuple(value) for key, value in counts.items()])
+        self._conn.executemany(
+            'INSERT INTO confidence_histogram (day, intent, bin, queries) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT (day, intent, bin) DO UPDATE '
+            'SET queries = queries + excluded.queries',
+            [key + (count,) for key, count in histogram.items()])
+
+    def _fold_feedback(self, rows: List[dict]) -> None:
+        counts = collections.defaultdict(lambda: [0, 0])
+        for row in rows:
+            query = row['user_queries']
+            # Feedback on a query that was never logged has no intent.
+            if query is None:
+                continue
+            key = (row['created_at'][:10], query['predicted_intent'])
+            counts[key][0] += 1
+            counts[key][1] += bool(row['is_correct'])
+        self._conn.executemany(
+            'INSERT INTO feedback_accuracy (day, intent, feedback, correct) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT (day, intent) DO UPDATE SET '
+            'feedback = feedback + excluded.feedback, '
+            'correct = correct + excluded.correct',
+            [key + tuple(value) for key, value in counts.items()])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Sync or query the local analytics aggregates.')
+    parser.add_argument('command', choices=('sync', 'report'))
+    parser.add_argument('--path', type=Path, default=DEFAULT_PATH)
+    parser.add_argument('--bins', type=int, default=20)
+    parser.add_argument('--settle-minutes', type=float, default=5.0)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=7,
+                        help='Days of the report window, including today')
+    args = parser.parse_args()
+
+    store = AnalyticsStore(args.path, args.bins)
+    try:
+        if args.command == 'sync':
+            from src.db.session import get_supabase_client
+
+            start = time.perf_counter()
+            read = store.sync(get_supabase_client(), args.settle_minutes,
+                              args.page_size)
+            print(json.dumps({'rows_read': read, 'seconds': round(
+                time.perf_counter() - start, 3)}))
+        else:
+            print(json.dumps(store.report(args.days), indent=2))
+    finally:
+        store.close()
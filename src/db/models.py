@@ -1,5 +1,12 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from supabase import Client
 
+# Feedback columns with the query they reference, see
+# `fetch_feedback_with_queries`.
+FEEDBACK_WITH_QUERY_COLUMNS = (
+    "id, query_id, is_correct, corrected_intent, created_at, "
+    "user_queries(query_text, predicted_intent)")
+
 
 def insert_user_query(supabase: Client, query_text: str, predicted_intent: str,
                       confidence_score: float, created_at: str):
@@ -39,6 +46,31 @@ def insert_user_query(supabase: Client, query_text: str, predicted_intent: str,
         print(f"Error inserting user query: {e}")
         raise
   
+
+def insert_user_queries(supabase: Client, rows: List[Dict[str, Any]]):
+    """
+    Insert several user queries into the database with a single request.
+    Rows carry their client-generated 'id', and rows whose id already 
+    exists are skipped, so retrying a partially applied insert is safe.
+    Args:
+        supabase (Client): The Supabase client instance.
+        rows (List[dict]): The records to insert, each with the keys 'id',
+                           'query_text', 'predicted_intent',
+                           'confidence_score' and 'created_at'.
+    Returns:
+        list: The inserted records.
+    Raises:
+        Exception: If the insert operation fails.
+    """
+    try:
+        response = supabase.table("user_queries").upsert(
+            rows, on_conflict="id", ignore_duplicates=True).execute()
+        return response.data
+
+    except Exception as e:
+        print(f"Error inserting user queries: {e}")
+        raise
+  
   
 def insert_feedback(supabase: Client, query_id: int, is_correct: bool,
                     corrected_intent: str = None, created_at: str = None):
@@ -77,4 +109,153 @@ def insert_feedback(supabase: Client, query_id: int, is_correct: bool,
 
     except Exception as e:
         print(f"Error inserting feedback: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def insert_feedbacks(supabase: Client, rows: List[Dict[str, Any]]):
+    """
+    Insert several feedback records into the feedback table with a single 
+    request. Rows carry their client-generated 'id', and rows whose id 
+    already exists are skipped, so retrying an insert is safe.
+    Args:
+        supabase (Client): The Supabase client instance.
+        rows (List[dict]): The records to insert, each with the keys 'id',
+                           'query_id', 'is_correct', 'corrected_intent' and
+                           'created_at'.
+    Returns:
+        list: The inserted feedback records.
+    Raises:
+        Exception: If the insert operation fails.
+    """
+    try:
+        response = supabase.table("feedback").upsert(
+            rows, on_conflict="id", ignore_duplicates=True).execute()
+        return response.data
+
+    except Exception as e:
+        print(f"Error inserting feedback: {e}")
+        raise
+
+
+def fetch_feedback_with_queries(supabase: Client, page_size: int = 1000,
+                                after_id: Optional[int] = None,
+                                before_id: Optional[int] = None
+                                ) -> Iterator[Dict[str, Any]]:
+    """
+    Read feedback records together with the queries they reference, in id
+    order, one page per request.
+    Args:
+        supabase (Client): The Supabase client instance.
+        page_size (int): Number of records per request.
+        after_id (int, optional): Only read records with a greater id.
+        before_id (int, optional): Only read records with a smaller id.
+    Returns:
+        Iterator[dict]: The feedback records with the keys 'id',
+                        'query_id', 'is_correct', 'corrected_intent',
+                        'created_at' and 'user_queries', the referenced
+                        record with the keys 'query_text' and
+                        'predicted_intent'.
+    Raises:
+        Exception: If a select operation fails.
+    """
+    while True:
+        query = supabase.table("feedback").select(
+            FEEDBACK_WITH_QUERY_COLUMNS)
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        if before_id is not None:
+            query = query.lt("id", before_id)
+        try:
+            response = query.order("id").limit(page_size).execute()
+        except Exception as e:
+            print(f"Error reading feedback: {e}")
+            raise
+
+        yield from response.data
+        if len(response.data) < page_size:
+            return
+        after_id = response.data[-1]["id"]
+
+
+def fetch_user_queries(supabase: Client, page_size: int = 1000,
+                       after_id: Optional[int] = None,
+                       before_id: Optional[int] = None,
+                       columns: str = "id, query_text"
+                       ) -> Iterator[Dict[str, Any]]:
+    """
+    Read the logged user queries in id order, one page per request.
+    Args:
+        supabase (Client): The Supabase client instance.
+        page_size (int): Number of records per request.
+        after_id (int, optional): Only read records with a greater id.
+        before_id (int, optional): Only read records with a smaller id.
+        columns (str): The selected columns, including 'id'.
+    Returns:
+        Iterator[dict]: The records with the selected keys.
+    Raises:
+        Exception: If a select operation fails.
+    """
+    while True:
+        query = supabase.table("user_queries").select(columns)
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        if before_id is not None:
+            query = query.lt("id", before_id)
+        try:
+            response = query.order("id").limit(page_size).execute()
+        except Exception as e:
+            print(f"Error reading user queries: {e}")
+            raise
+
+        yield from response.data
+        if len(response.data) < page_size:
+            return
+        after_id = response.data[-1]["id"]
+
+
+def fetch_rows_inserted_after(supabase: Client, table: str, columns: str,
+                              after: Optional[Tuple[str, int]] = None,
+                              inserted_before: Optional[str] = None,
+                              page_size: int = 1000
+                              ) -> Iterator[Dict[str, Any]]:
+    """
+    Read the records of a table in the order the database inserted them,
+    one page per request. The order is that of the server-assigned
+    'inserted_at' column, then of 'id', so unlike the client-generated ids
+    it includes records that reached the database late, e.g. after waiting
+    in the write buffer during an outage.
+    Args:
+        supabase (Client): The Supabase client instance.
+        table (str): Name of the table, 'user_queries' or 'feedback'.
+        columns (str): The selected columns, see `select`.
+        after (Tuple[str, int], optional): The 'inserted_at' and 'id' of
+                                           the last record read before.
+        inserted_before (str, optional): Only read records inserted before
+                                         this ISO 8601 timestamp.
+        page_size (int): Number of records per request.
+    Returns:
+        Iterator[dict]: The records with the selected keys and the keys
+                        'id' and 'inserted_at'.
+    Raises:
+        Exception: If a select operation fails.
+    """
+    while True:
+        query = supabase.table(table).select(f"{columns}, inserted_at")
+        if after is not None:
+            inserted_at, row_id = after
+            query = query.or_(
+                f'inserted_at.gt."{inserted_at}",'
+                f'and(inserted_at.eq."{inserted_at}",id.gt.{row_id})')
+        if inserted_before is not None:
+            query = query.lt("inserted_at", inserted_before)
+        try:
+            response = query.order("inserted_at").order("id") \
+                .limit(page_size).execute()
+        except Exception as e:
+            print(f"Error reading {table}: {e}")
+            raise
+
+        yield from response.data
+        if len(response.data) < page_size:
+            return
+        after = (response.data[-1]["inserted_at"], response.data[-1]["id"])
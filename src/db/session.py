@@ -1,20 +1,100 @@
+import logging
 import os
-from supabase import create_client, Client
+import threading
+import httpx
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+class SupabaseClientManager:
+    """
+    Holds the process-wide Supabase client and its HTTP connection pool.
+
+    The client is created on first use and shared by all threads, so every
+    insert reuses the kept-alive connections of one `httpx.Client` instead
+    of opening a new connection (and TLS handshake) per call.
+
+    Args:
+        pool_size (int): Maximum number of open and of kept-alive
+                         connections to Supabase.
+        keepalive_expiry (float): Seconds an idle connection is kept open.
+        timeout (float): Timeout of a request in seconds.
+    """
+    def __init__(self, pool_size: int = 10, keepalive_expiry: float = 60.0,
+                 timeout: float = 10.0):
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self._client = None
+        self._http_client = None
+        self._lock = threading.Lock()
+
+    def get_client(self) -> Client:
+        """
+        Returns the shared Supabase client, creating it on first use.
+        """
+        with self._lock:
+            if self._client is None:
+                supabase_url = os.getenv("SUPABASE_URL")
+                supabase_key = os.getenv("SUPABASE_KEY")
+
+                if not supabase_url or not supabase_key:
+                    raise ValueError(
+                        "Supabase URL and API key must be set in the env")
+
+                self._http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=self.pool_size,
+                        max_keepalive_connections=self.pool_size,
+                        keepalive_expiry=self.keepalive_expiry),
+                    timeout=self.timeout,
+                    follow_redirects=True,
+                )
+                self._client = create_client(
+                    supabase_url, supabase_key,
+                    options=ClientOptions(httpx_client=self._http_client))
+            return self._client
+
+    def health_check(self) -> bool:
+        """
+        Checks that Supabase answers a minimal query over the pool.
+        Returns:
+            bool: True if the query succeeded.
+        """
+        try:
+            self.get_client().table("user_queries").select("id") \
+                .limit(1).execute()
+            return True
+        except Exception as e:
+            logger.warning(f"Supabase health check failed: {e}")
+            return False
+
+    def close(self) -> None:
+        """
+        Closes the pooled connections. A later `get_client` call creates a
+        new client.
+        """
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._client = None
+            self._http_client = None
+
+
+client_manager = SupabaseClientManager(
+    pool_size=int(os.getenv("SUPABASE_POOL_SIZE", "10")),
+    keepalive_expiry=float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "60")),
+    timeout=float(os.getenv("SUPABASE_TIMEOUT", "10")),
+)
+
 
 def get_supabase_client() -> Client:
     """
     Returns the Supabase client for interacting with the database.
+    The client and its connection pool are shared by the whole process.
     """
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY")
-    
-    if not supabase_url or not supabase_key:
-        raise ValueError("Supabase URL and API key must be set in the env")
-    
-    supabase: Client = create_client(supabase_url,
-                                     supabase_key)
-    return supabase
\ No newline at end of file
+    return client_manager.get_client()
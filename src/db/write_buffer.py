@@ -0,0 +1,345 @@
+"""
+This module provides a write-behind buffer for database inserts.
+
+Rows are first appended to a local SQLite file, which makes them durable
+without a network round trip, and a background thread flushes them to the
+database in bulk once `flush_size` rows are pending or every
+`flush_interval` seconds. Rows are only removed from the local file after
+the database accepted them, so a database outage delays the writes instead
+of blocking the request path or losing rows. Pending rows left behind by a
+previous process are flushed on start.
+
+A row the database rejects for good, e.g. a feedback row referencing a
+query that does not exist, would otherwise fail its batch on every retry
+and hold back all later rows of its table. When a batch fails with an
+error that `is_permanent` recognizes, it is split in halves that are
+written separately, down to single rows, and a single rejected row is
+moved to the `dead_letters` table of the local file, where it can be
+inspected and replayed by hand. Any other error stops the flush and keeps
+the rows buffered for the next attempt.
+
+A buffer file belongs to one process at a time: the buffer holds an
+exclusive lock on it until it is closed, so two processes never flush the
+same rows. A process can `adopt` the file of a process that exited, which
+moves its pending rows and dead letters into its own file.
+"""
+
+import fcntl
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Writer = Callable[[List[dict]], None]
+Batch = List[Tuple[int, str]]
+
+
+class WriteBuffer:
+    """
+    Durable, batching write buffer in front of the database.
+
+    Args:
+        path (Path): Location of the local SQLite file. It must not be used
+                     by another open buffer.
+        writers (Dict[str, Writer]): Bulk insert function of each table.
+                    Tables are flushed in this order, and a table is only
+                    flushed once all tables before it were flushed, so rows
+                    referencing another table must come after it.
+        flush_size (int): Number of pending rows that triggers a flush, and
+                          the maximum number of rows per bulk insert.
+        flush_interval (float): Maximum seconds between two flushes.
+        retry_interval (float): Seconds to wait after a failed flush.
+        on_depth (Callable[[int], None], optional): Called with the number
+                    of pending rows whenever it changes, e.g. to export it
+                    as a metric.
+        is_permanent (Callable[[Exception], bool], optional): Whether a
+                    write error rejects the rows for good rather than
+                    being transient. Without it, no error is permanent.
+        on_dead_letter (Callable[[str], None], optional): Called with the
+                    table of every row moved to the dead letters.
+    """
+    def __init__(self, path: Path, writers: Dict[str, Writer],
+                 flush_size: int = 500, flush_interval: float = 1.0,
+                 retry_interval: float = 5.0,
+                 on_depth: Optional[Callable[[int], None]] = None,
+                 is_permanent: Optional[Callable[[Exception], bool]] = None,
+                 on_dead_letter: Optional[Callable[[str], None]] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file_lock = _lock_file(self.path)
+        if self._file_lock is None:
+            raise RuntimeError(f"{path} is used by another process")
+        self.writers = writers
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.on_depth = on_depth
+        self.is_permanent = is_permanent or (lambda error: False)
+        self.on_dead_letter = on_dead_letter
+
+        self._conn = sqlite3.connect(str(path), check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'tbl TEXT NOT NULL, payload TEXT NOT NULL)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS dead_letters ('
+            'seq INTEGER PRIMARY KEY, tbl TEXT NOT NULL, '
+            'payload TEXT NOT NULL, error TEXT NOT NULL, '
+            'failed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)')
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='write-buffer')
+        self._depth = self._count()
+
+    def start(self) -> None:
+        """
+        Starts the background flush thread.
+        """
+        self._thread.start()
+
+    def put(self, table: str, row: dict) -> None:
+        """
+        Appends a row to the local buffer. The row is written to `table` by
+        a later flush.
+        Args:
+            table (str): Name of the destination table.
+            row (dict): The record to insert.
+        """
+        self.put_many(table, [row])
+
+    def put_many(self, table: str, rows: List[dict]) -> None:
+        """
+        Appends rows to the local buffer in a single transaction, so either
+        all or none of them are written to `table` by later flushes.
+        Args:
+            table (str): Name of the destination table.
+            rows (List[dict]): The records to insert.
+        """
+        if table not in self.writers:
+            raise ValueError(f"No writer registered for table '{table}'")
+
+        payloads = [(table, json.dumps(row)) for row in rows]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    'INSERT INTO pending (tbl, payload) VALUES (?, ?)',
+                    payloads)
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            self._set_depth(self._depth + len(payloads))
+            if self._depth >= self.flush_size:
+                self._wakeup.set()
+
+    def depth(self) -> int:
+        """
+        Returns the number of rows waiting to be written to the database.
+        """
+        return self._depth
+
+    def dead_letters(self, table: Optional[str] = None) -> List[dict]:
+        """
+        Returns the rows the database rejected, oldest first.
+        Args:
+            table (str, optional): Only return the rows of this table.
+        Returns:
+            List[dict]: {'table', 'row', 'error', 'failed_at'} records.
+        """
+        query = 'SELECT tbl, payload, error, failed_at FROM dead_letters'
+        params = ()
+        if table is not None:
+            query, params = query + ' WHERE tbl = ?', (table,)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY seq',
+                                      params).fetchall()
+        return [{'table': tbl, 'row': json.loads(payload), 'error': error,
+                 'failed_at': failed_at}
+                for tbl, payload, error, failed_at in rows]
+
+    def adopt(self, path: Path) -> int:
+        """
+        Moves the pending rows and dead letters of the buffer file of a
+        process that exited into this buffer and deletes the file. Pending
+        rows keep their order, after the rows already in this buffer. A
+        file still used by another process is left alone.
+        Args:
+            path (Path): Location of the other buffer file.
+        Returns:
+            int: The number of pending rows moved into this buffer.
+        """
+        path = Path(path)
+        if not path.exists() or path.resolve() == self.path.resolve():
+            return 0
+        file_lock = _lock_file(path)
+        if file_lock is None:
+            return 0
+        try:
+            # Another process may have adopted it in the meantime.
+            if not path.exists():
+                return 0
+            with self._lock:
+                adopted = self._move_rows(path)
+                self._set_depth(self._count())
+            for suffix in ('', '-wal', '-shm', '.lock'):
+                Path(f'{path}{suffix}').unlink(missing_ok=True)
+        finally:
+            file_lock.close()
+        if adopted:
+            self._wakeup.set()
+        return adopted
+
+    def flush(self) -> bool:
+        """
+        Writes the rows pending at the time of the call to the database,
+        table by table. Rows the database rejects for good are moved to the
+        dead letters.
+        Returns:
+            bool: True if the rows were written or dead-lettered, False if
+                  a write failed with a transient error.
+        """
+        with self._lock:
+            last_seq = self._conn.execute(
+                'SELECT COALESCE(MAX(seq), 0) FROM pending').fetchone()[0]
+
+        for table, writer in self.writers.items():
+            while True:
+                with self._lock:
+                    batch = self._conn.execute(
+                        'SELECT seq, payload FROM pending '
+                        'WHERE tbl = ? AND seq <= ? ORDER BY seq LIMIT ?',
+                        (table, last_seq, self.flush_size)).fetchall()
+                if not batch:
+                    break
+                if not self._write(table, writer, batch):
+                    return False
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Stops the flush thread after a final flush attempt. Rows that could
+        not be written stay in the local file for the next process.
+        Args:
+            timeout (float): Maximum seconds to wait for the final flush.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        with self._lock:
+            self._conn.close()
+        self._file_lock.close()
+
+    def _move_rows(self, path: Path) -> int:
+        self._conn.execute('ATTACH DATABASE ? AS other', (str(path),))
+        try:
+            self._conn.execute('BEGIN')
+            try:
+                adopted = self._conn.execute(
+                    'INSERT INTO pending (tbl, payload) '
+                    'SELECT tbl, payload FROM other.pending ORDER BY seq'
+                ).rowcount
+                self._conn.execute(
+                    'INSERT INTO dead_letters (tbl, payload, error, '
+                    'failed_at) SELECT tbl, payload, error, failed_at '
+                    'FROM other.dead_letters ORDER BY seq')
+                # Emptied in the same transaction, so the rows are not
+                # moved twice if the file cannot be deleted.
+                self._conn.execute('DELETE FROM other.pending')
+                self._conn.execute('DELETE FROM other.dead_letters')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+        finally:
+            self._conn.execute('DETACH DATABASE other')
+        return adopted
+
+    def _set_depth(self, depth: int) -> None:
+        self._depth = depth
+        if self.on_depth is not None:
+            self.on_depth(depth)
+
+    def _write(self, table: str, writer: Writer, batch: Batch) -> bool:
+        try:
+            writer([json.loads(payload) for _, payload in batch])
+        except Exception as e:
+            if not self.is_permanent(e):
+                logger.error(f"Error flushing {len(batch)} rows to "
+                             f"{table}, keeping them buffered: {e}")
+                return False
+            if len(batch) > 1:
+                # Isolate the rejected rows, so the others are written.
+                middle = len(batch) // 2
+                return (self._write(table, writer, batch[:middle])
+                        and self._write(table, writer, batch[middle:]))
+            self._dead_letter(table, batch[0], e)
+            return True
+
+        with self._lock:
+            self._conn.executemany('DELETE FROM pending WHERE seq = ?',
+                                   [(seq,) for seq, _ in batch])
+            self._set_depth(self._count())
+        logger.info(f"Flushed {len(batch)} rows to {table}")
+        return True
+
+    def _dead_letter(self, table: str, entry: Tuple[int, str],
+                     error: Exception) -> None:
+        seq, payload = entry
+        logger.error(f"{table} rejected row {payload}, moving it to the "
+                     f"dead letters: {error}")
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO dead_letters '
+                    '(seq, tbl, payload, error) VALUES (?, ?, ?, ?)',
+                    (seq, table, payload, str(error)))
+                self._conn.execute('DELETE FROM pending WHERE seq = ?',
+                                   (seq,))
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            self._set_depth(self._count())
+        if self.on_dead_letter is not None:
+            self.on_dead_letter(table)
+
+    def _count(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._depth and not self.flush():
+                self._stopped.wait(self.retry_interval)
+        if self._depth:
+            self.flush()
+
+
+def _lock_file(path: Path):
+    """
+    Takes the exclusive lock of a buffer file without waiting. The lock is
+    released when the returned file is closed or the process exits.
+    Returns:
+        The open lock file, or None if another process holds the lock.
+    """
+    lock_file = open(f'{path}.lock', 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
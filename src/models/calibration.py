@@ -0,0 +1,250 @@
+"""
+This module calibrates the confidence scores of the IntentClassifier with
+temperature scaling.
+
+The softmax of an over-confident model is sharpened: a 0.9 score is right
+less than 90% of the time. Dividing the logits by a single temperature
+T > 1, fitted by minimizing the negative log-likelihood on labeled
+queries, fixes this without changing the predicted intents, so routing
+can rely on a confidence threshold. The labeled queries come from the
+feedback table: the predicted intent of queries marked correct and the
+corrected intent of the others.
+
+The module includes:
+- `top_k_probabilities`: The k most probable intents of a batch of logits,
+  in one vectorized softmax and topk.
+- `top_k_predictions`: The same as (intent, probability) pairs.
+- `fit_temperature`: Fits the temperature on logits and labels.
+- `expected_calibration_error`: Measures the calibration of probabilities.
+- `load_temperature`: Loads a fitted temperature.
+- `feedback_label`: The true label of a feedback row.
+- An entry point that fits the temperature on the feedback table.
+
+Usage:
+    python -m src.models.calibration --model-tag classifier:latest \
+        --output data/calibration.json
+"""
+
+import argparse
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+import torch
+import torch.nn.functional as F
+from src.utils.label_mapping import intent_ids, label_mapping
+
+
+def top_k_probabilities(logits: torch.Tensor, k: int,
+                        temperature: float = 1.0
+                        ) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Returns the k most probable intents of every row.
+    Args:
+        logits (torch.Tensor): Logits of shape (batch_size, num_labels).
+        k (int): Number of intents per row.
+        temperature (float): Temperature the logits are divided by.
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: The calibrated probabilities and
+                  the label indices, both of shape (batch_size, k), most
+                  probable first.
+    """
+    return F.softmax(logits / temperature, dim=1).topk(k, dim=1)
+
+
+def top_k_predictions(logits: torch.Tensor, k: int,
+                      temperature: float = 1.0
+                      ) -> List[List[Tuple[str, float]]]:
+    """
+    Converts logits to the k most probable intents of every row.
+    Args:
+        logits (torch.Tensor): Logits of shape (batch_size, num_labels).
+        k (int): Number of intents per row.
+        temperature (float): Temperature the logits are divided by.
+    Returns:
+        List[List[Tuple[str, float]]]: The (intent, probability) pairs of
+                  every row, most probable first.
+    """
+    scores, indices = top_k_probabilities(logits, k, temperature)
+    return [[(label_mapping[i], s) for i, s in zip(row_indices, row_scores)]
+            for row_indices, row_scores in zip(indices.tolist(),
+                                               scores.tolist())]
+
+
+def fit_temperature(logits: torch.Tensor, labels: torch.Tensor,
+                    max_iter: int = 200) -> float:
+    """
+    Fits the temperature that minimizes the negative log-likelihood.
+    Args:
+        logits (torch.Tensor): Logits of shape (num_samples, num_labels).
+        labels (torch.Tensor): True label index of every sample.
+        max_iter (int): Maximum number of L-BFGS iterations.
+    Returns:
+        float: The fitted temperature.
+    """
+    logits = logits.detach().float()
+    # Optimizing the log keeps the temperature positive.
+    log_temperature = torch.zeros(1, requires_grad=True)
+    optimizer = torch.optim.LBFGS([log_temperature], lr=0.1,
+                                  max_iter=max_iter)
+
+    def closure():
+        optimizer.zero_grad()
+        loss = F.cross_entropy(logits / log_temperature.exp(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return float(log_temperature.detach().exp())
+
+
+def expected_calibration_error(probabilities: torch.Tensor,
+                               labels: torch.Tensor, bins: int = 15
+                               ) -> float:
+    """
+    Returns the expected calibration error: the mean gap between the
+    confidence and the accuracy of equal-width confidence bins, weighted by
+    the share of samples in every bin.
+    Args:
+        probabilities (torch.Tensor): Probabilities of shape
+                                      (num_samples, num_labels).
+        labels (torch.Tensor): True label index of every sample.
+        bins (int): Number of confidence bins.
+    Returns:
+        float: The error, between 0 and 1.
+    """
+    confidences, predictions = probabilities.max(dim=1)
+    correct = (predictions == labels).float()
+    bin_ids = (confidences * bins).long().clamp(max=bins - 1)
+    error = 0.0
+    for b in range(bins):
+        mask = bin_ids == b
+        if mask.any():
+            error += (mask.float().mean()
+                      * (confidences[mask].mean() - correct[mask].mean())
+                      .abs()).item()
+    return error
+
+
+def load_temperature(path: Optional[Union[str, Path]]) -> float:
+    """
+    Loads the temperature written by this module's entry point.
+    Args:
+        path (Union[str, Path], optional): The calibration file. Without
+                                           one, the logits are not scaled.
+    Returns:
+        float: The temperature, 1.0 without a calibration file.
+    """
+    if path is None:
+        return 1.0
+    with open(path, 'r', encoding='utf-8') as f:
+        return float(json.load(f)['temperature'])
+
+
+def feedback_label(row: dict) -> Optional[int]:
+    """
+    Returns the true label index of a feedback row read by
+    `fetch_feedback_with_queries`: the predicted intent of a query marked
+    correct, else the corrected intent. None if the row has no query text
+    or no known intent.
+    """
+    query = row.get('user_queries') or {}
+    intent = (query.get('predicted_intent') if row['is_correct']
+              else row.get('corrected_intent'))
+    if not query.get('query_text') or intent not in intent_ids:
+        return None
+    return intent_ids[intent]
+
+
+def fetch_feedback_samples(page_size: int = 1000
+                           ) -> Iterator[Tuple[str, int]]:
+    """
+    Reads the labeled queries of the feedback table, page by page.
+    Args:
+        page_size (int): Rows per request.
+    Returns:
+        Iterator[Tuple[str, int]]: The query text and the true label index
+                  of every feedback row whose intent is known.
+    """
+    from src.db.models import fetch_feedback_with_queries
+    from src.db.session import get_supabase_client
+
+    for row in fetch_feedback_with_queries(get_supabase_client(),
+                                           page_size):
+        label = feedback_label(row)
+        if label is not None:
+            yield row['user_queries']['query_text'], label
+
+
+def read_samples(path: Path) -> Iterator[Tuple[str, int]]:
+    """
+    Reads labeled queries from a JSONL file of {'text', 'intent'} rows.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                if row['intent'] in intent_ids:
+                    yield row['text'], intent_ids[row['intent']]
+
+
+if __name__ == '__main__':
+    from src.data_preprocessing.preprocessing_pool import PreprocessingPool
+    from src.models.batching import batched_logits
+    from src.utils.score_offline import BUCKET_BOUNDARIES, load_scoring_model
+
+    parser = argparse.ArgumentParser(
+        description='Fit the confidence temperature on the feedback table.')
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--runtime', default='eager',
+                        choices=('eager', 'torchscript', 'quantized'))
+    parser.add_argument('--output', type=Path,
+                        default=Path('data/calibration.json'))
+    parser.add_argument('--samples', type=Path, default=None,
+                        help="JSONL of {'text', 'intent'} rows to fit on "
+                             "instead of the feedback table")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--mode', choices=('nltk', 'fast'), default='nltk')
+    parser.add_argument('--fast-tables', type=Path,
+                        default=Path('data/fast_preprocessing.json'))
+    parser.add_argument('--vocab-index', type=Path,
+                        default=Path('data/vocab_index'))
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    args = parser.parse_args()
+
+    samples = list(read_samples(args.samples) if args.samples
+                   else fetch_feedback_samples())
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        pad_idx = json.load(f)['<PAD>']
+    forward = load_scoring_model(args.model_tag, args.runtime)
+
+    logits, labels = [], []
+    with PreprocessingPool(args.workers, args.mode, args.fast_tables,
+                           args.vocab_index, args.vocab) as pool, \
+            torch.no_grad():
+        for chunk_start, (chunk, (sequences, valid, _)) in zip(
+                range(0, len(samples), 256),
+                pool.map((text for text, _ in samples), 256)):
+            if sequences:
+                logits.append(batched_logits(forward, sequences, pad_idx,
+                                             BUCKET_BOUNDARIES))
+                labels.extend(samples[chunk_start + i][1] for i in valid)
+    if not labels:
+        raise SystemExit("No labeled queries to fit the temperature on.")
+    logits, labels = torch.cat(logits), torch.tensor(labels)
+
+    temperature = fit_temperature(logits, labels)
+    report = {
+        'temperature': temperature,
+        'model_tag': args.model_tag,
+        'samples': len(labels),
+        'fitted_at': datetime.now(timezone.utc).isoformat(),
+    }
+    for name, t in (('uncalibrated', 1.0), ('calibrated', temperature)):
+        report[f'nll_{name}'] = F.cross_entropy(logits / t, labels).item()
+        report[f'ece_{name}'] = expected_calibration_error(
+            F.softmax(logits / t, dim=1), labels)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,91 @@
+"""
+This module converts the eager IntentClassifier into a TorchScript module
+for CPU serving without Python dispatch overhead per layer.
+
+The classifier is traced through its packed, length-aware forward pass, so
+the batch and the sequence axes of the traced module stay dynamic and it
+accepts the same right-padded batches as the eager model.
+
+The module includes:
+- `PackedForward`: Wraps the classifier with the positional
+  `(x, lengths)` signature that tracing requires.
+- `trace_classifier`: Traces and freezes the classifier.
+- `random_sequences`: Generates token-id sequences for export checks.
+- `max_abs_diff`: Compares the logits of two models on the same sequences.
+"""
+
+import random
+from typing import Callable, List, Sequence
+import torch
+from torch import nn
+from src.models.batching import batched_logits, pad_batch
+
+
+class PackedForward(nn.Module):
+    """
+    Exposes `model(x, lengths=lengths)` as `forward(x, lengths)`.
+
+    Args:
+        model (nn.Module): The eager IntentClassifier.
+    """
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x: torch.Tensor, lengths: torch.Tensor) -> torch.Tensor:
+        return self.model(x, lengths=lengths)
+
+
+def trace_classifier(model: nn.Module, pad_idx: int,
+                     freeze: bool = True) -> torch.jit.ScriptModule:
+    """
+    Traces the classifier on the CPU into a TorchScript module with dynamic
+    batch and sequence axes.
+    Args:
+        model (nn.Module): The eager IntentClassifier.
+        pad_idx (int): Index of the '<PAD>' token in the vocabulary.
+        freeze (bool): Whether to freeze the weights into the graph and
+                       apply TorchScript's inference optimizations.
+    Returns:
+        torch.jit.ScriptModule: Module called as `traced(x, lengths)`.
+    """
+    model = model.cpu().eval()
+    example = pad_batch([[pad_idx] * 5, [pad_idx] * 3, [pad_idx] * 8],
+                        pad_idx)
+    with torch.no_grad():
+        traced = torch.jit.trace(PackedForward(model), example)
+    if freeze:
+        traced = torch.jit.optimize_for_inference(
+            torch.jit.freeze(traced.eval()))
+    return traced
+
+
+def random_sequences(vocab_size: int, count: int, max_length: int,
+                     seed: int = 0) -> List[List[int]]:
+    """
+    Generates random token-id sequences of random lengths.
+    Args:
+        vocab_size (int): Number of token ids.
+        count (int): Number of sequences.
+        max_length (int): Maximum length of a sequence.
+        seed (int): Seed of the generator.
+    Returns:
+        List[List[int]]: The sequences.
+    """
+    rng = random.Random(seed)
+    return [[rng.randrange(vocab_size)
+             for _ in range(rng.randint(1, max_length))]
+            for _ in range(count)]
+
+
+def max_abs_diff(reference: Callable, candidate: Callable,
+                 sequences: Sequence[Sequence[int]], pad_idx: int,
+                 boundaries: Sequence[int]) -> float:
+    """
+    Returns the largest absolute difference between the logits of two
+    models, each called as `forward(x, lengths)` on the same batches.
+    """
+    with torch.no_grad():
+        expected = batched_logits(reference, sequences, pad_idx, boundaries)
+        actual = batched_logits(candidate, sequences, pad_idx, boundaries)
+    return (expected - actual).abs().max().item()
@@ -10,6 +10,27 @@ LinearConfig classes.
 import torch
 from torch import nn
 from torch.nn import init
+from torch.nn.utils.rnn import PackedSequence, pack_padded_sequence
+from src.models.shared_weights import load_embedding_matrix
+
+
+def last_step_indices(packed: PackedSequence,
+                      lengths: torch.Tensor) -> torch.Tensor:
+    """
+    Locates the last valid time step of every sequence in a packed batch.
+    Args:
+        packed (PackedSequence): Packed output of the LSTM.
+        lengths (torch.Tensor): CPU tensor with the length of every sequence,
+            in the original batch order.
+    Returns:
+        torch.Tensor: Indices into `packed.data`, in the original batch order.
+    """
+    # Rows of `packed.data` are grouped by time step; step t holds
+    # `batch_sizes[t]` rows, one per sequence (sorted by length) that is
+    # still running at t.
+    offsets = torch.cumsum(packed.batch_sizes, dim=0) - packed.batch_sizes
+    steps = offsets[lengths - 1].to(packed.data.device)
+    return steps + packed.unsorted_indices
 
 
 class IntentClassifier(nn.Module):
@@ -22,6 +43,8 @@ class IntentClassifier(nn.Module):
     Args:
         config (dict): Configuration dictionary containing model parameters 
         such as:
+            - 'embedding_path' (str): The pretrained embedding matrix, see
+              `load_embedding_matrix`.
             - 'input_size' (int): Size of the input feature vector.
             - 'hidden_size' (int): # of features in the LSTM's hidden state.
             - 'num_layers' (int): # of recurrent layers in the LSTM.
@@ -33,7 +56,7 @@ class IntentClassifier(nn.Module):
         super().__init__()
         self.config = config
         self.embedding = nn.Embedding.from_pretrained(
-          '/data/embedding_matrix.pt', freeze=True)
+            load_embedding_matrix(config['embedding_path']), freeze=True)
 
         self.bi_lstm = nn.LSTM(config['input_size'], 
                                config['hidden_size'],
@@ -68,7 +91,7 @@ class IntentClassifier(nn.Module):
                 elif 'linear' in name:
                     init.xavier_normal_(param)
 
-    def forward(self, x, h0=None, c0=None):
+    def forward(self, x, h0=None, c0=None, lengths=None):
         """
         Forward pass of the model. Processes the input through the embedding 
         layer, bidirectional LSTM, and a series of linear layers to 
@@ -79,23 +102,43 @@ class IntentClassifier(nn.Module):
                 Defaults to None, which initializes it as zeros.
             c0 (torch.Tensor, optional): Initial cell state for the LSTM. 
                 Defaults to None, which initializes it as zeros.
+            lengths (torch.Tensor, optional): Number of valid tokens of each
+                right-padded sequence in `x`. When given, the LSTM runs on a
+                packed sequence and the last valid token of every sequence
+                is classified, so padding does not change the prediction.
         Returns:
             torch.Tensor: Output tensor of shape (batch_size, num_labels) 
             containing the class scores for each input sequence in the batch.
         """
-        if h0 is None:
-            h0 = torch.zeros(self.config['num_layers'] * 2, x.size(0), 
-                             self.config['hidden_size'])
-        if c0 is None:
-            c0 = torch.zeros(self.config['num_layers'] * 2, x.size(0), 
-                             self.config['hidden_size'])
+        # Without an explicit initial state the LSTM starts from zeros on
+        # the device of `x`, so no state tensors are allocated here.
+        hx = None
+        if h0 is not None or c0 is not None:
+            shape = (self.config['num_layers'] * 2, x.size(0),
+                     self.config['hidden_size'])
+            if h0 is None:
+                h0 = torch.zeros(shape, device=x.device)
+            if c0 is None:
+                c0 = torch.zeros(shape, device=x.device)
+            hx = (h0, c0)
 
         x = self.embedding(x)
 
-        x, _ = self.bi_lstm(x, (h0, c0))
+        # Only the output at the last (valid) token is classified, so it is
+        # selected before the activation and dropout are applied.
+        if lengths is None:
+            x, _ = self.bi_lstm(x, hx)
+            x = x[:, -1, :]
+        else:
+            lengths = lengths.cpu()
+            packed = pack_padded_sequence(x, lengths, batch_first=True,
+                                          enforce_sorted=False)
+            packed, _ = self.bi_lstm(packed, hx)
+            x = packed.data[last_step_indices(packed, lengths)]
+
         x = self.act1(self.dropout_bilstm(x))
 
-        x = self.linear1(x[:, -1, :])
+        x = self.linear1(x)
         x = self.norm1(x)
         x = self.act_lin1(self.dropout_linear1(x))
 
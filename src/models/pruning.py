@@ -0,0 +1,293 @@
+"""
+This module prunes the embedding table of the IntentClassifier down to the
+tokens that queries actually use and optionally stores the remaining rows
+in a compact form.
+
+The pretrained embedding matrix has one row per token of `vocab.json`,
+while the training set and the logged `user_queries` only ever hit a part
+of them. Rows of tokens never observed are dropped and looked up as
+'<UNK>' instead. The token ids of the vocabulary stay the same: the pruned
+embedding maps them to its compact rows itself, so the vocabulary files,
+the memory-mapped vocabulary index, the prediction cache and the other
+models served next to a pruned one (hot reloads, shadow models) keep
+sharing one id space.
+
+The kept rows are stored in fp32, in fp16, or product-quantized: every row
+is split into sub-vectors, and every sub-vector is replaced by the index of
+its nearest centroid in a codebook of at most 256 centroids learned with
+k-means, i.e. by one byte. Product quantization only pays off when many
+more than 256 rows are kept, and with 2-dimensional sub-vectors it still
+changes a share of the predictions, so its parity should be checked on
+held-out queries.
+
+The module includes:
+- `PrunedEmbedding`: Frozen embedding over the kept rows of a vocabulary.
+- `product_quantize`: Learns the codebooks and codes of a matrix.
+- `prune_classifier`: Returns a copy of a classifier with a pruned
+  embedding.
+- `observed_token_ids`: Counts the token ids of preprocessed texts.
+- An entry point that prunes a Bento model, saves the result as a new
+  Bento model and reports its size, load time and parity.
+
+A pruned model is served like any other model, e.g. by setting `model_tag`
+to 'classifier_pruned:latest', and can first be compared against the
+served model as its shadow (`shadow.model_tag`). It cannot be fine-tuned
+by `src/models/training.py`; retrain the full model and prune it again.
+
+Usage:
+    python -m src.models.pruning --model-tag classifier:latest \
+        --texts data/train.jsonl --user-queries --storage fp16
+"""
+
+import argparse
+import collections
+import copy
+import itertools
+import json
+import time
+from pathlib import Path
+from typing import Iterable, Sequence, Tuple
+import torch
+from torch import nn
+import torch.nn.functional as F
+
+STORAGES = ('fp32', 'fp16', 'pq')
+
+
+def product_quantize(matrix: torch.Tensor, subvectors: int,
+                     centroids: int = 256, iterations: int = 25,
+                     seed: int = 0) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Product-quantizes the rows of a matrix with k-means per sub-space.
+    Args:
+        matrix (torch.Tensor): Matrix of shape (rows, dim).
+        subvectors (int): Number of sub-vectors per row. Must divide `dim`.
+        centroids (int): Centroids per codebook, at most 256.
+        iterations (int): k-means iterations per codebook.
+        seed (int): Seed of the initial centroids.
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: The fp32 codebooks of shape
+                  (subvectors, centroids, dim // subvectors) and the uint8
+                  codes of shape (rows, subvectors).
+    """
+    rows, dim = matrix.shape
+    if dim % subvectors or not 0 < centroids <= 256:
+        raise ValueError(f"Cannot split {dim} columns into {subvectors} "
+                         f"sub-vectors with {centroids} centroids")
+    centroids = min(centroids, rows)
+    generator = torch.Generator().manual_seed(seed)
+    parts = matrix.float().reshape(rows, subvectors, dim // subvectors)
+    codebooks, codes = [], []
+    for part in parts.unbind(dim=1):
+        codebook = part[torch.randperm(rows, generator=generator)
+                        [:centroids]].clone()
+        for _ in range(iterations):
+            assignment = torch.cdist(part, codebook).argmin(dim=1)
+            sums = torch.zeros_like(codebook).index_add_(0, assignment, part)
+            counts = torch.bincount(assignment, minlength=centroids)
+            # Centroids without rows keep their position.
+            filled = counts > 0
+            codebook[filled] = sums[filled] / counts[filled, None]
+        codebooks.append(codebook)
+        codes.append(torch.cdist(part, codebook).argmin(dim=1))
+    return (torch.stack(codebooks),
+            torch.stack(codes, dim=1).to(torch.uint8))
+
+
+class PrunedEmbedding(nn.Module):
+    """
+    Frozen embedding that only stores the rows of the kept token ids. The
+    other ids of the vocabulary are looked up as the '<UNK>' row. Looked-up
+    vectors are returned in fp32.
+
+    Args:
+        weight (torch.Tensor): The full embedding matrix, one row per id.
+        kept_ids (Sequence[int]): Token ids whose rows are kept. Must
+                                  include `unk_id`.
+        unk_id (int): Id of the '<UNK>' token.
+        storage (str): 'fp32', 'fp16' or 'pq' for product quantization.
+        subvectors (int): Sub-vectors per row for 'pq'.
+    """
+    def __init__(self, weight: torch.Tensor, kept_ids: Sequence[int],
+                 unk_id: int, storage: str = 'fp32', subvectors: int = 25):
+        super().__init__()
+        if storage not in STORAGES:
+            raise ValueError(f"Unknown storage '{storage}', expected one of "
+                             f"{STORAGES}")
+        kept_ids = sorted(set(kept_ids))
+        if unk_id not in kept_ids:
+            raise ValueError("The kept ids must include the '<UNK>' id.")
+        remap = torch.full((weight.size(0),), kept_ids.index(unk_id),
+                           dtype=torch.int32)
+        remap[kept_ids] = torch.arange(len(kept_ids), dtype=torch.int32)
+        self.register_buffer('remap', remap)
+        self.storage = storage
+
+        rows = weight.detach()[kept_ids].float()
+        if storage == 'pq':
+            codebooks, codes = product_quantize(rows, subvectors)
+            self.register_buffer('codebooks', codebooks)
+            self.register_buffer('codes', codes)
+        else:
+            self.register_buffer(
+                'weight', rows.half() if storage == 'fp16' else rows)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        rows = self.remap[x].long()
+        if self.storage != 'pq':
+            return F.embedding(rows, self.weight).float()
+        codes = self.codes[rows].long()
+        subspaces = torch.arange(self.codebooks.size(0), device=x.device)
+        return self.codebooks[subspaces, codes].flatten(-2)
+
+
+def prune_classifier(model: nn.Module, kept_ids: Sequence[int], unk_id: int,
+                     storage: str = 'fp32',
+                     subvectors: int = 25) -> nn.Module:
+    """
+    Replaces the embedding of a copy of a classifier with a pruned one. The
+    given model is left unchanged.
+    Args:
+        model (nn.Module): The IntentClassifier.
+        kept_ids (Sequence[int]): Token ids whose rows are kept.
+        unk_id (int): Id of the '<UNK>' token.
+        storage (str): Storage of the kept rows, see `PrunedEmbedding`.
+        subvectors (int): Sub-vectors per row for 'pq'.
+    Returns:
+        nn.Module: The pruned copy in evaluation mode, on the CPU.
+    """
+    pruned = copy.deepcopy(model).cpu().eval()
+    pruned.embedding = PrunedEmbedding(pruned.embedding.weight, kept_ids,
+                                       unk_id, storage, subvectors)
+    return pruned
+
+
+def observed_token_ids(sequences: Iterable[Sequence[int]]
+                       ) -> collections.Counter:
+    """
+    Counts how often every token id occurs in token-id sequences.
+    """
+    counts = collections.Counter()
+    for seq in sequences:
+        counts.update(seq)
+    return counts
+
+
+def _load_seconds(model_tag: str, repeat: int = 5) -> float:
+    import bentoml
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        bentoml.pytorch.load_model(model_tag, device_id='cpu')
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+if __name__ == '__main__':
+    import bentoml
+    from src.data_preprocessing.preprocessing_pool import PreprocessingPool
+    from src.models.batching import batched_logits
+    from src.models.calibration import read_samples
+    from src.models.quantization import model_size_bytes
+    from src.utils.score_offline import BUCKET_BOUNDARIES, read_rows
+
+    parser = argparse.ArgumentParser(
+        description='Prune the embedding of a Bento model to the observed '
+                    'tokens.')
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--name', default='classifier_pruned',
+                        help='Name of the pruned Bento model')
+    parser.add_argument('--texts', type=Path, nargs='*', default=[],
+                        help='CSV, JSONL or Parquet files of training '
+                             'texts whose tokens are kept')
+    parser.add_argument('--user-queries', action='store_true',
+                        help='Also keep the tokens of the logged '
+                             'user_queries')
+    parser.add_argument('--min-count', type=int, default=1,
+                        help='Occurrences a token needs to be kept')
+    parser.add_argument('--storage', choices=STORAGES, default='fp32')
+    parser.add_argument('--subvectors', type=int, default=25,
+                        help="Sub-vectors per row for 'pq'; more are more "
+                             "accurate and larger")
+    parser.add_argument('--eval-samples', type=Path, default=None,
+                        help="JSONL of {'text', 'intent'} rows, ideally "
+                             "held out from --texts, for the parity report")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--mode', choices=('nltk', 'fast'), default='nltk')
+    parser.add_argument('--fast-tables', type=Path,
+                        default=Path('data/fast_preprocessing.json'))
+    parser.add_argument('--vocab-index', type=Path,
+                        default=Path('data/vocab_index'))
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    args = parser.parse_args()
+
+    texts = itertools.chain.from_iterable(
+        (text for _, text in read_rows(path)) for path in args.texts)
+    if args.user_queries:
+        from src.db.models import fetch_user_queries
+        from src.db.session import get_supabase_client
+
+        texts = itertools.chain(texts, (
+            row['query_text']
+            for row in fetch_user_queries(get_supabase_client())))
+
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    samples = list(read_samples(args.eval_samples)) if args.eval_samples \
+        else []
+    counts = collections.Counter()
+    eval_sequences, eval_labels = [], []
+    with PreprocessingPool(args.workers, args.mode, args.fast_tables,
+                           args.vocab_index, args.vocab) as pool:
+        for _, (sequences, _, _) in pool.map(texts):
+            counts.update(observed_token_ids(sequences))
+        for chunk_start, (_, (sequences, valid, _)) in zip(
+                range(0, len(samples), 256),
+                pool.map((text for text, _ in samples), 256)):
+            eval_sequences.extend(sequences)
+            eval_labels.extend(samples[chunk_start + i][1] for i in valid)
+
+    if not counts:
+        raise SystemExit("No texts to collect the observed tokens from.")
+    kept_ids = {vocab['<PAD>'], vocab['<UNK>']}
+    kept_ids.update(i for i, count in counts.items()
+                    if count >= args.min_count)
+    source = bentoml.pytorch.get(args.model_tag)
+    model = bentoml.pytorch.load_model(source, device_id='cpu').eval()
+    pruned = prune_classifier(model, kept_ids, vocab['<UNK>'], args.storage,
+                              args.subvectors)
+
+    report = {
+        'source_model': str(source.tag),
+        'storage': args.storage,
+        'vocab_size': len(vocab),
+        'kept_tokens': len(kept_ids),
+        'size_bytes': model_size_bytes(pruned),
+        'source_size_bytes': model_size_bytes(model),
+    }
+    if eval_sequences:
+        with torch.no_grad():
+            predictions = {
+                name: batched_logits(
+                    lambda x, lengths, m=m: m(x, lengths=lengths),
+                    eval_sequences, vocab['<PAD>'],
+                    BUCKET_BOUNDARIES).argmax(dim=1)
+                for name, m in (('source', model), ('pruned', pruned))}
+        labels = torch.tensor(eval_labels)
+        report['eval_samples'] = len(eval_labels)
+        report['agreement'] = (predictions['source']
+                               == predictions['pruned']).float().mean().item()
+        for name, predicted in predictions.items():
+            report[f'accuracy_{name}'] = \
+                (predicted == labels).float().mean().item()
+
+    bento_model = bentoml.pytorch.save_model(
+        args.name, model=pruned,
+        labels={'source_model': str(source.tag), 'embedding': args.storage},
+        metadata={k: v for k, v in report.items()
+                  if k not in ('source_model', 'storage')})
+    report['model_tag'] = str(bento_model.tag)
+    report['load_seconds'] = _load_seconds(str(bento_model.tag))
+    report['source_load_seconds'] = _load_seconds(str(source.tag))
+    print(json.dumps(report, indent=2))
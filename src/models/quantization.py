@@ -0,0 +1,64 @@
+"""
+This module builds the int8 variant of the IntentClassifier for CPU
+serving, where memory per replica and latency are the binding limits.
+
+The LSTM and the Linear layers are dynamically quantized: their weights are
+stored in int8 and activations are quantized on the fly, so no calibration
+data is needed. The frozen embedding table can additionally be stored in
+fp16, since it is only looked up and never multiplied in int8.
+
+The module includes:
+- `HalfEmbedding`: Frozen embedding stored in fp16 that returns fp32.
+- `quantize_classifier`: Returns the quantized copy of a classifier.
+- `model_size_bytes`: Serialized size of a model's state dict.
+"""
+
+import copy
+import io
+import torch
+from torch import nn
+import torch.nn.functional as F
+
+
+class HalfEmbedding(nn.Module):
+    """
+    Frozen embedding whose table is stored in fp16. Looked-up vectors are
+    cast back to fp32 for the layers that follow.
+
+    Args:
+        embedding (nn.Embedding): The fp32 embedding to convert.
+    """
+    def __init__(self, embedding: nn.Embedding):
+        super().__init__()
+        self.register_buffer('weight', embedding.weight.detach().half())
+        self.padding_idx = embedding.padding_idx
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return F.embedding(x, self.weight, self.padding_idx).float()
+
+
+def quantize_classifier(model: nn.Module,
+                        fp16_embedding: bool = False) -> nn.Module:
+    """
+    Dynamically quantizes the LSTM and Linear layers of a classifier to
+    int8. The given model is left unchanged.
+    Args:
+        model (nn.Module): The fp32 IntentClassifier.
+        fp16_embedding (bool): Whether to also store the embedding in fp16.
+    Returns:
+        nn.Module: The quantized copy in evaluation mode, on the CPU.
+    """
+    quantized = copy.deepcopy(model).cpu().eval()
+    if fp16_embedding:
+        quantized.embedding = HalfEmbedding(quantized.embedding)
+    return torch.ao.quantization.quantize_dynamic(
+        quantized, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+
+def model_size_bytes(model: nn.Module) -> int:
+    """
+    Returns the size of the model's serialized state dict in bytes.
+    """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
@@ -0,0 +1,68 @@
+"""
+This module lets all worker processes of a node share one read-only copy
+of the IntentClassifier weights.
+
+Tensors loaded with `torch.load(..., mmap=True)` or `numpy.load(...,
+mmap_mode='r')` are backed by the page cache of their file instead of
+private memory, so every process that maps the same file shares the pages.
+The weights are never written to, so the pages are never copied.
+
+The module includes:
+- `load_embedding_matrix`: Memory-maps the pretrained embedding matrix
+  from a `.pt` or `.npy` file.
+- `share_model_weights`: Replaces the weights of a loaded model with
+  memory-mapped copies stored in a file shared by all workers.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Union
+import numpy as np
+import torch
+from torch import nn
+
+
+def load_embedding_matrix(path: Union[str, Path]) -> torch.Tensor:
+    """
+    Memory-maps the pretrained embedding matrix.
+    Args:
+        path (Union[str, Path]): A tensor saved with `torch.save` (.pt) or a
+                                 NumPy array (.npy).
+    Returns:
+        torch.Tensor: The read-only, file-backed matrix.
+    """
+    path = Path(path)
+    if path.suffix == '.npy':
+        return torch.from_numpy(np.load(path, mmap_mode='r'))
+    return torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+
+
+def share_model_weights(model: nn.Module, directory: Union[str, Path],
+                        name: str) -> nn.Module:
+    """
+    Moves the parameters and buffers of a CPU model into a file under
+    `directory` and memory-maps them back. The first worker writes the file,
+    all later workers of the node only map it.
+    Args:
+        model (nn.Module): The model, on the CPU.
+        directory (Union[str, Path]): Directory of the shared weight files.
+        name (str): Unique name of the weights, e.g. the model tag.
+    Returns:
+        nn.Module: The same model, with file-backed weights.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name.replace(':', '-')}.pt"
+    if not path.exists():
+        # Workers may start at the same time, so the file is written under a
+        # temporary name and atomically renamed.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            torch.save(model.state_dict(), f)
+        os.replace(tmp_path, path)
+
+    state_dict = torch.load(path, map_location='cpu', mmap=True,
+                            weights_only=True)
+    model.load_state_dict(state_dict, assign=True)
+    return model
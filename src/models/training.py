@@ -0,0 +1,349 @@
+"""
+This module fine-tunes the IntentClassifier on the feedback table, starting
+from the weights of the current Bento model instead of training from
+scratch, and saves the result as a new Bento model.
+
+Feedback rows are streamed in the order the database inserted them, from
+a watermark: the server-assigned 'inserted_at' and the id of the last row
+a retrain used, kept in a state file. The ids are generated by the service
+when the feedback is submitted, and the write buffer may insert a row
+long after that, e.g. after a database outage, so they would let late rows
+slip behind the watermark; the insertion order does not. Only rows
+inserted more than `settle_minutes` ago are read, so that inserts still
+being committed cannot appear behind the watermark either. The label
+of a row is the predicted intent of a query marked correct and the
+corrected intent of the others.
+
+The texts are preprocessed by the `PreprocessingPool` with the service's
+`numericalize` and vocabulary, so training sees exactly the token ids
+served in production. Examples are grouped into length buckets, so a batch
+is only padded to the longest sequence of its bucket, and a `DataLoader`
+with worker processes pads the batches while the model trains. Since only
+new feedback is trained on, for a few epochs at a low learning rate with
+the embedding frozen, a retrain takes minutes on a CPU. Earlier examples
+can be mixed in with `--replay` to limit forgetting.
+
+A share of the new examples is held out. The new model is only saved if
+its accuracy on them is not below the current model's, unless
+`--allow-regression` is given.
+
+The module includes:
+- `FeedbackExamples`: Token ids and labels of the training examples.
+- `BucketBatchSampler`: Shuffled batches of examples of similar length.
+- `fetch_new_feedback`: Streams the labeled feedback after a watermark.
+- `fine_tune`: Trains a model for some epochs.
+- `accuracy`: Evaluates a model on examples.
+- An entry point that retrains and saves the model.
+
+Usage:
+    python -m src.models.training --model-tag classifier:latest \
+        --epochs 3 --workers 4
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Dataset, Sampler
+from src.models.batching import bucket_by_length, pad_batch
+from src.models.calibration import feedback_label, read_samples
+
+# The bucket boundaries of the service, see `batching.bucket_boundaries`.
+BUCKET_BOUNDARIES = [16, 32, 64]
+
+
+class FeedbackExamples(Dataset):
+    """
+    Token-id sequences and their label indices.
+
+    Args:
+        sequences (List[List[int]]): Token ids of every example.
+        labels (List[int]): Label index of every example.
+    """
+    def __init__(self, sequences: List[List[int]], labels: List[int]):
+        self.sequences = sequences
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.sequences)
+
+    def __getitem__(self, index: int) -> Tuple[List[int], int]:
+        return self.sequences[index], self.labels[index]
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Yields batches of indices whose sequences fall into the same length
+    bucket. Examples are shuffled within their bucket and the batches are
+    shuffled across buckets, anew every epoch.
+
+    Args:
+        sequences (Sequence[Sequence[int]]): Token ids of every example.
+        batch_size (int): Examples per batch at most.
+        boundaries (Sequence[int]): Upper length bounds of the buckets.
+        shuffle (bool): Whether to shuffle. Without it, the batches follow
+                        the bucket order.
+        seed (int): Seed of the shuffling.
+    """
+    def __init__(self, sequences: Sequence[Sequence[int]], batch_size: int,
+                 boundaries: Sequence[int] = BUCKET_BOUNDARIES,
+                 shuffle: bool = True, seed: int = 0):
+        self.buckets = bucket_by_length(sequences, boundaries)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.random = random.Random(seed)
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = []
+        for bucket in self.buckets:
+            if self.shuffle:
+                bucket = self.random.sample(bucket, len(bucket))
+            batches += [bucket[i:i + self.batch_size]
+                        for i in range(0, len(bucket), self.batch_size)]
+        if self.shuffle:
+            self.random.shuffle(batches)
+        return iter(batches)
+
+    def __len__(self) -> int:
+        return sum(-(-len(bucket) // self.batch_size)
+                   for bucket in self.buckets)
+
+
+class PadCollate:
+    """
+    Pads a batch of examples into the token ids, lengths and labels.
+    A class rather than a closure, so DataLoader workers can unpickle it.
+    """
+    def __init__(self, pad_idx: int):
+        self.pad_idx = pad_idx
+
+    def __call__(self, batch: List[Tuple[List[int], int]]
+                 ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        sequences, labels = zip(*batch)
+        padded, lengths = pad_batch(sequences, self.pad_idx)
+        return padded, lengths, torch.tensor(labels, dtype=torch.long)
+
+
+def fetch_new_feedback(watermark: Optional[Sequence], settle_minutes: float,
+                       page_size: int = 1000
+                       ) -> Iterator[Tuple[Tuple[str, int], str, int]]:
+    """
+    Streams the labeled feedback rows inserted after a watermark.
+    Args:
+        watermark (Sequence, optional): The 'inserted_at' and the id of the
+                  last row used. None reads the whole table.
+        settle_minutes (float): Rows inserted less than this ago are left
+                                for the next retrain.
+        page_size (int): Rows per request.
+    Returns:
+        Iterator[Tuple[Tuple[str, int], str, int]]: The 'inserted_at' and
+                  id, the query text and the label index of every row
+                  whose intent is known, in insertion order.
+    """
+    from src.db.models import FEEDBACK_WITH_QUERY_COLUMNS
+    from src.db.models import fetch_rows_inserted_after
+    from src.db.session import get_supabase_client
+
+    inserted_before = (datetime.now(timezone.utc)
+                       - timedelta(minutes=settle_minutes)).isoformat()
+    for row in fetch_rows_inserted_after(
+            get_supabase_client(), 'feedback', FEEDBACK_WITH_QUERY_COLUMNS,
+            tuple(watermark) if watermark else None, inserted_before,
+            page_size):
+        label = feedback_label(row)
+        if label is not None:
+            yield ((row['inserted_at'], row['id']),
+                   row['user_queries']['query_text'], label)
+
+
+def accuracy(model: nn.Module, loader: DataLoader) -> float:
+    """
+    Returns the share of examples whose label the model predicts.
+    """
+    model.eval()
+    correct = total = 0
+    with torch.no_grad():
+        for padded, lengths, labels in loader:
+            predictions = model(padded, lengths=lengths).argmax(dim=1)
+            correct += int((predictions == labels).sum())
+            total += len(labels)
+    return correct / total if total else 0.0
+
+
+def fine_tune(model: nn.Module, loader: DataLoader, epochs: int,
+              learning_rate: float = 1e-4, weight_decay: float = 1e-3,
+              label_smoothing: float = 0.1) -> List[float]:
+    """
+    Trains a model on the batches of a loader, with the optimizer and loss
+    of the original training.
+    Args:
+        model (nn.Module): The model, trained in place.
+        loader (DataLoader): Batches of token ids, lengths and labels.
+        epochs (int): Passes over the loader.
+        learning_rate (float): Learning rate of AdamW.
+        weight_decay (float): Weight decay of AdamW.
+        label_smoothing (float): Label smoothing of the cross-entropy.
+    Returns:
+        List[float]: The mean loss of every epoch.
+    """
+    optimizer = torch.optim.AdamW(
+        [p for p in model.parameters() if p.requires_grad],
+        lr=learning_rate, weight_decay=weight_decay)
+    loss_fn = nn.CrossEntropyLoss(label_smoothing=label_smoothing)
+    losses = []
+    for epoch in range(epochs):
+        model.train()
+        total, batches, start = 0.0, 0, time.perf_counter()
+        for padded, lengths, labels in loader:
+            optimizer.zero_grad()
+            loss = loss_fn(model(padded, lengths=lengths), labels)
+            loss.backward()
+            optimizer.step()
+            total += loss.item()
+            batches += 1
+        losses.append(total / max(batches, 1))
+        print(f"Epoch {epoch + 1}/{epochs}: loss {losses[-1]:.4f} "
+              f"({time.perf_counter() - start:.1f}s)")
+    return losses
+
+
+def _read_state(path: Path) -> dict:
+    if not path.exists():
+        return {'watermark': None}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    import bentoml
+    import bentoml.pytorch
+    from src.data_preprocessing.preprocessing_pool import PreprocessingPool
+    from src.utils.save_model_to_bento import load_model_and_save_to_bento
+
+    parser = argparse.ArgumentParser(
+        description='Fine-tune the classifier on new feedback.')
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--state', type=Path,
+                        default=Path('data/retraining_state.json'),
+                        help='Watermark of the last retrain')
+    parser.add_argument('--full', action='store_true',
+                        help='Ignore the watermark and read all feedback')
+    parser.add_argument('--settle-minutes', type=float, default=5.0,
+                        help='Minutes an insert is given to commit')
+    parser.add_argument('--samples', type=Path, default=None,
+                        help="JSONL of {'text', 'intent'} rows to train on "
+                             "instead of the feedback table")
+    parser.add_argument('--replay', type=Path, default=None,
+                        help="JSONL of earlier {'text', 'intent'} rows to "
+                             "mix in")
+    parser.add_argument('--min-samples', type=int, default=100)
+    parser.add_argument('--validation-fraction', type=float, default=0.1)
+    parser.add_argument('--allow-regression', action='store_true')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--learning-rate', type=float, default=1e-4)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Preprocessing worker processes')
+    parser.add_argument('--loader-workers', type=int, default=2,
+                        help='DataLoader worker processes')
+    parser.add_argument('--mode', choices=('nltk', 'fast'), default='nltk')
+    parser.add_argument('--fast-tables', type=Path,
+                        default=Path('data/fast_preprocessing.json'))
+    parser.add_argument('--vocab-index', type=Path,
+                        default=Path('data/vocab_index'))
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--output-dir', type=Path, default=Path('models'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    state = _read_state(args.state)
+    watermark = None if args.full else state['watermark']
+    if args.samples is not None:
+        new_rows = [(None, text, label)
+                    for text, label in read_samples(args.samples)]
+    else:
+        new_rows = list(fetch_new_feedback(watermark, args.settle_minutes))
+    if len(new_rows) < args.min_samples:
+        raise SystemExit(f"{len(new_rows)} new labeled feedback rows, "
+                         f"fewer than --min-samples {args.min_samples}.")
+    replay = list(read_samples(args.replay)) if args.replay else []
+
+    start = time.perf_counter()
+    texts = [text for _, text, _ in new_rows] + [text for text, _ in replay]
+    labels = ([label for _, _, label in new_rows]
+              + [label for _, label in replay])
+    sequences, kept = [], []
+    with PreprocessingPool(args.workers, args.mode, args.fast_tables,
+                           args.vocab_index, args.vocab) as pool:
+        for chunk_start, (_, (chunk_sequences, valid, _)) in zip(
+                range(0, len(texts), 256), pool.map(texts, 256)):
+            sequences += chunk_sequences
+            kept += [chunk_start + offset for offset in valid]
+    print(f"Preprocessed {len(texts)} texts "
+          f"({time.perf_counter() - start:.1f}s)")
+
+    # Only new feedback is held out, to compare the models on fresh data.
+    new_positions = [i for i, index in enumerate(kept)
+                     if index < len(new_rows)]
+    held_out = set(random.Random(args.seed).sample(
+        new_positions, int(len(new_positions) * args.validation_fraction)))
+    train = FeedbackExamples(
+        [seq for i, seq in enumerate(sequences) if i not in held_out],
+        [labels[index] for i, index in enumerate(kept) if i not in held_out])
+    validation = FeedbackExamples(
+        [sequences[i] for i in sorted(held_out)],
+        [labels[kept[i]] for i in sorted(held_out)])
+
+    with open(args.vocab, 'r', encoding='utf-8') as f:
+        collate = PadCollate(json.load(f)['<PAD>'])
+    loader_options = {'collate_fn': collate,
+                      'num_workers': args.loader_workers,
+                      'persistent_workers': args.loader_workers > 0}
+    train_loader = DataLoader(train, batch_sampler=BucketBatchSampler(
+        train.sequences, args.batch_size, seed=args.seed), **loader_options)
+    validation_loader = DataLoader(validation, batch_sampler=(
+        BucketBatchSampler(validation.sequences, 256, shuffle=False)),
+        **loader_options)
+
+    torch.manual_seed(args.seed)
+    source = bentoml.pytorch.get(args.model_tag)
+    model = bentoml.pytorch.load_model(source, device_id='cpu')
+    base_accuracy = accuracy(model, validation_loader)
+    start = time.perf_counter()
+    losses = fine_tune(model, train_loader, args.epochs, args.learning_rate)
+    train_seconds = time.perf_counter() - start
+    tuned_accuracy = accuracy(model, validation_loader)
+    print(f"Trained on {len(train)} examples in {train_seconds:.1f}s, "
+          f"held-out accuracy {base_accuracy:.4f} -> {tuned_accuracy:.4f} "
+          f"on {len(validation)} examples")
+    if tuned_accuracy < base_accuracy and not args.allow_regression:
+        raise SystemExit("The fine-tuned model is less accurate than "
+                         f"{source.tag}; not saving it.")
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    model_file = args.output_dir / f'class_model_{int(time.time())}.pth'
+    torch.save(model.state_dict(), model_file)
+    # Rows are fetched in insertion order, so the last one is the newest.
+    new_watermark = next((list(key) for key, _, _ in reversed(new_rows)
+                          if key is not None), watermark)
+    metadata = {'samples': len(train), 'epochs': args.epochs,
+                'losses': losses, 'base_accuracy': base_accuracy,
+                'accuracy': tuned_accuracy}
+    if new_watermark is not None:
+        metadata['watermark'] = new_watermark
+    tag = load_model_and_save_to_bento(
+        model_file,
+        labels={'source_model': str(source.tag), 'trained_on': 'feedback'},
+        metadata=metadata)
+
+    if args.samples is None:
+        args.state.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.state, 'w', encoding='utf-8') as f:
+            json.dump({'watermark': new_watermark, 'model_tag': str(tag),
+                       'trained_at': datetime.now(timezone.utc).isoformat(),
+                       'samples': len(train)}, f, indent=2)
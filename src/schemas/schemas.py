@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field, field_validator
-from typing import Optional
+from pydantic import BaseModel, Field, RootModel, field_validator
+from typing import List, Optional
+from src.utils.label_mapping import intent_ids
 
 
 class FeedbackModel(BaseModel):
@@ -12,10 +13,26 @@ class FeedbackModel(BaseModel):
         if info.data['is_correct'] is False and not v:
             raise ValueError('corrected_intent is required \
                               when is_correct is False')
+        if v is not None and v not in intent_ids:
+            raise ValueError(f"Unknown corrected_intent '{v}'")
         return v
+
+
+class FeedbackBatchModel(RootModel[List[FeedbackModel]]):
+    root: List[FeedbackModel] = Field(..., min_length=1)
       
 
+class IntentScoreModel(BaseModel):
+    intent: str
+    score: float
+
+
 class InferenceResponseModel(BaseModel):
     predicted_intent: str
     confidence_score: float
-    query_id: int
\ No newline at end of file
+    query_id: int
+    top_k: Optional[List[IntentScoreModel]] = None
+
+class BatchInferenceResponseModel(InferenceResponseModel):
+    index: int
+    id: Optional[str] = None
@@ -0,0 +1,85 @@
+"""
+This module exports the eager classifier from the BentoML model store to
+TorchScript and saves it as a separate Bento model for CPU serving.
+
+Before saving, the logits of the traced model are compared with those of
+the eager model on random sequences of every length bucket, and the export
+is aborted if they differ by more than the given tolerance. The serving
+runtime is then selected with `runtime: torchscript` in
+`src/api/service_config.yaml`.
+
+The module includes:
+- A function to trace, check and save the TorchScript model.
+- An entry point for executing the export.
+
+Dependencies:
+- PyTorch is used for tracing the model.
+- BentoML is used for loading the eager and saving the traced model.
+
+Usage:
+    python -m src.utils.export_model_to_bento --model-tag classifier:latest
+"""
+
+import argparse
+import json
+from pathlib import Path
+import bentoml
+from src.models.export import max_abs_diff, random_sequences
+from src.models.export import trace_classifier
+
+BUCKET_BOUNDARIES = [16, 32, 64]
+
+
+def export_torchscript_to_bento(model_tag: str, name: str, vocab_path: Path,
+                                tolerance: float = 1e-4,
+                                num_checks: int = 512) -> bentoml.Model:
+    """
+    Traces the eager Bento model and saves it as a TorchScript Bento model.
+    Args:
+        model_tag (str): Tag of the eager Bento model.
+        name (str): Name of the TorchScript Bento model.
+        vocab_path (Path): Path of the vocabulary.
+        tolerance (float): Maximum allowed absolute difference of logits.
+        num_checks (int): Number of random sequences used for the check.
+    Returns:
+        bentoml.Model: The saved TorchScript model.
+    Raises:
+        RuntimeError: If the traced model does not match the eager model.
+    """
+    with open(vocab_path, 'r', encoding='utf-8') as f:
+        vocab = json.load(f)
+    pad_idx = vocab['<PAD>']
+
+    source = bentoml.pytorch.get(model_tag)
+    model = bentoml.pytorch.load_model(source, device_id='cpu').eval()
+    traced = trace_classifier(model, pad_idx)
+
+    sequences = random_sequences(len(vocab), num_checks,
+                                 BUCKET_BOUNDARIES[-1] * 2)
+    diff = max_abs_diff(lambda x, lengths: model(x, lengths=lengths),
+                        traced, sequences, pad_idx, BUCKET_BOUNDARIES)
+    print(f'Max |logit diff| eager vs TorchScript = {diff:.2e}')
+    if diff > tolerance:
+        raise RuntimeError(
+            f"TorchScript model differs from {source.tag} by {diff:.2e}, "
+            f"more than the tolerance of {tolerance:.2e}")
+
+    bento_model = bentoml.torchscript.save_model(
+        name, traced,
+        labels={'source_model': str(source.tag)},
+        metadata={'max_abs_diff': diff})
+    print(f'Bento model tag = {bento_model.tag}')
+    return bento_model
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Export the classifier to TorchScript.')
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--name', default='classifier_torchscript')
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    export_torchscript_to_bento(args.model_tag, args.name, args.vocab,
+                                args.tolerance)
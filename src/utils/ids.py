@@ -0,0 +1,33 @@
+import secrets
+import time
+
+# 2024-01-01T00:00:00Z in milliseconds since the Unix epoch.
+ID_EPOCH_MS = 1704067200000
+RANDOM_BITS = 22
+
+
+def generate_id() -> int:
+    """
+    Generates a time-ordered, client-side ID for database rows.
+
+    Like a ULID, the ID is a millisecond timestamp followed by random bits,
+    so rows can be referenced before they are written to the database. It
+    is packed into 63 bits to fit the BIGINT `id` columns.
+
+    Returns:
+        int: A positive 63-bit ID that increases with the creation time.
+    """
+    elapsed_ms = int(time.time() * 1000) - ID_EPOCH_MS
+    return (elapsed_ms << RANDOM_BITS) | secrets.randbits(RANDOM_BITS)
+
+
+def id_at(timestamp: float) -> int:
+    """
+    Returns the smallest ID generated at a point in time, e.g. to select
+    the rows created before it.
+    Args:
+        timestamp (float): Seconds since the Unix epoch.
+    Returns:
+        int: The ID.
+    """
+    return (int(timestamp * 1000) - ID_EPOCH_MS) << RANDOM_BITS
@@ -76,4 +76,7 @@ label_mapping = {
     74: 'why_verify_identity',
     75: 'wrong_amount_of_cash_received',
     76: 'wrong_exchange_rate_for_cash_withdrawal'
-}
\ No newline at end of file
+}
+
+# Reverse index from intent to label index, for O(1) validation.
+intent_ids = {intent: index for index, intent in label_mapping.items()}
@@ -0,0 +1,86 @@
+"""
+This module provides an in-process sampling profiler for deep dives into
+slow requests in production.
+
+While a profile runs, a background thread samples the stacks of all other
+threads at a fixed interval, so the request path itself is not slowed down
+by tracing. The samples are written in the collapsed-stack format read by
+flamegraph.pl, speedscope and py-spy's tooling, one line per distinct stack
+with its sample count.
+
+The module includes:
+- `sample_stacks`: Samples the stacks of all threads for a duration.
+- `profile_to_file`: Samples and writes the collapsed stacks to a file.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+_profile_lock = threading.Lock()
+
+
+def sample_stacks(duration: float, interval: float = 0.005) -> Counter:
+    """
+    Samples the stacks of all threads except the calling one.
+    Args:
+        duration (float): Seconds to sample for.
+        interval (float): Seconds between two samples.
+    Returns:
+        Counter: Number of samples of every collapsed stack, written as
+                 'thread;outer_function (file:line);...;inner_function'.
+    """
+    own_id = threading.get_ident()
+    samples: Counter = Counter()
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} "
+                             f"({Path(code.co_filename).name}:"
+                             f"{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            samples[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return samples
+
+
+def profile_to_file(output_dir: Path, duration: float,
+                    interval: float = 0.005) -> Path:
+    """
+    Samples all threads and writes the collapsed stacks to a new file.
+    Only one profile runs per process at a time.
+    Args:
+        output_dir (Path): Directory of the profile files.
+        duration (float): Seconds to sample for.
+        interval (float): Seconds between two samples.
+    Returns:
+        Path: The written file.
+    Raises:
+        RuntimeError: If a profile is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        samples = sample_stacks(duration, interval)
+    finally:
+        _profile_lock.release()
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    path = output_dir / f'profile-{timestamp}-{os.getpid()}.txt'
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+    return path
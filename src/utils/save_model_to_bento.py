@@ -10,6 +10,8 @@ The module includes:
 - Device selection logic to determine whether to use CUDA, MPS, or CPU.
 - Loading of model configurations from a YAML file.
 - A function to load the PyTorch model from a specified file and save it.
+- A function to save a dynamically quantized (int8) variant of a saved
+  model under a separate tag (see `src/models/quantization.py`).
 - An entry point for executing model loading & saving process.
 
 Dependencies:
@@ -18,25 +20,36 @@ Dependencies:
 - YAML is used for configuration management.
 """
 
+import argparse
 from pathlib import Path
+from typing import Optional
 import torch
 import bentoml
 import yaml
 from src.models.intent_classifier import IntentClassifier
-from utils.get_device import get_device
+from src.models.quantization import model_size_bytes, quantize_classifier
+from src.utils.get_device import get_device
 
 DEVICE = get_device()
 print(f"Using device: {DEVICE}")
 
-with open('../models/model_config.yaml', 'r', encoding='utf-8') as f:
+with open(Path(__file__).parents[1] / 'models' / 'model_config.yaml', 'r',
+          encoding='utf-8') as f:
     config = yaml.safe_load(f)
 
 
-def load_model_and_save_to_bento(model_file: Path) -> None:
+def load_model_and_save_to_bento(model_file: Path,
+                                 labels: Optional[dict] = None,
+                                 metadata: Optional[dict] = None
+                                 ) -> bentoml.Tag:
     """
       Load a trained PyTorch model from a file and save it to BentoML.
       Args:
           model_file (Path): Path to the trained PyTorch model.
+          labels (dict, optional): Labels of the Bento model.
+          metadata (dict, optional): Metadata of the Bento model.
+      Returns:
+          bentoml.Tag: The tag of the saved Bento model.
       Raises:
         FileNotFoundError: If the model file is not found at the specified 
                            path.
@@ -55,12 +68,60 @@ def load_model_and_save_to_bento(model_file: Path) -> None:
       
     try:
         bento_model = bentoml.pytorch.save_model('classifier',
-                                                 model=lstm_model)
+                                                 model=lstm_model,
+                                                 labels=labels,
+                                                 metadata=metadata)
         print(f'Bento model tag = {bento_model.tag}')
     except Exception as e:
         raise RuntimeError(f"Failed to save Bento model: {e}")
+    return bento_model.tag
     
       
+def quantize_and_save_to_bento(model_tag: str, name: str = 'classifier_int8',
+                               fp16_embedding: bool = False) -> None:
+    """
+      Quantize a model from the BentoML store to int8 and save it to BentoML
+      under a separate name.
+      Args:
+          model_tag (str): Tag of the fp32 Bento model.
+          name (str): Name of the quantized Bento model.
+          fp16_embedding (bool): Whether to also store the embedding in fp16.
+      Raises:
+        RuntimeError: If there is an issue quantizing the model or saving it
+                      to BentoML.
+      """
+    try:
+        source = bentoml.pytorch.get(model_tag)
+        lstm_model = bentoml.pytorch.load_model(source, device_id='cpu')
+        quantized = quantize_classifier(lstm_model, fp16_embedding)
+    except Exception as e:
+        raise RuntimeError(f"Failed to quantize model {model_tag}: {e}")
+
+    try:
+        bento_model = bentoml.pytorch.save_model(
+            name, model=quantized,
+            labels={'source_model': str(source.tag),
+                    'embedding': 'fp16' if fp16_embedding else 'fp32'},
+            metadata={'size_bytes': model_size_bytes(quantized),
+                      'source_size_bytes': model_size_bytes(lstm_model)})
+        print(f'Bento model tag = {bento_model.tag}')
+    except Exception as e:
+        raise RuntimeError(f"Failed to save Bento model: {e}")
+
+
 if __name__ == '__main__':
     MODEL_PATH = '/model/class_model.pth'
-    load_model_and_save_to_bento(Path(MODEL_PATH))
\ No newline at end of file
+    parser = argparse.ArgumentParser(
+        description='Save the classifier or its int8 variant to BentoML.')
+    parser.add_argument('--model-file', type=Path, default=Path(MODEL_PATH))
+    parser.add_argument('--quantize', metavar='MODEL_TAG', default=None,
+                        help='Save the int8 variant of this Bento model '
+                             'instead of loading --model-file')
+    parser.add_argument('--fp16-embedding', action='store_true')
+    args = parser.parse_args()
+
+    if args.quantize:
+        quantize_and_save_to_bento(args.quantize,
+                                   fp16_embedding=args.fp16_embedding)
+    else:
+        load_model_and_save_to_bento(args.model_file)
\ No newline at end of file
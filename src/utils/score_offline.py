@@ -0,0 +1,329 @@
+"""
+This module scores files of queries with the IntentClassifier offline,
+without the BentoML service, e.g. to reprocess the `user_queries` history
+or to evaluate a new model.
+
+Input rows are read from CSV, JSONL or Parquet as a stream, preprocessed in
+chunks by the multi-process `PreprocessingPool` (the same preprocessing as
+the service) and scored on the CPU in length-bucketed batches, truncated
+to `--max-tokens` token ids like in the service. Every row is
+written to the output as soon as its chunk is scored, with the predicted
+intent, its confidence score and the top-k intents, or with the error that
+prevented scoring it. The scores are calibrated with the temperature of
+`src/models/calibration.py` when a calibration file is given. Only a
+bounded number of chunks is held in memory at any time, so memory stays
+constant regardless of the input size.
+
+After every chunk, the output is flushed and a checkpoint next to it
+records how many input rows and output bytes are done. With `--resume`, an
+interrupted run truncates the output to the last checkpoint and continues
+from the row after it.
+
+The module includes:
+- `read_rows`: Streams the (id, text) rows of a CSV, JSONL or Parquet file.
+- `load_scoring_model`: Loads the model of a runtime on the CPU.
+- `score_file`: Scores an input file into an output file.
+- An entry point for executing the scoring.
+
+Dependencies:
+- PyTorch and BentoML are used for loading and running the model.
+- pyarrow is required for Parquet input only.
+
+Usage:
+    python -m src.utils.score_offline --input user_queries.csv \
+        --output predictions.jsonl --top-k 3 --workers 8
+"""
+
+import argparse
+import collections
+import csv
+import itertools
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, Optional, Tuple
+from src.data_preprocessing.preprocessing_pool import ID_KEYS, TEXT_KEYS
+from src.data_preprocessing.preprocessing_pool import PreprocessingPool
+
+# The preprocessing workers are spawned and re-import this module when it
+# runs as the entry point, so PyTorch and BentoML are imported where they
+# are used, keeping them out of the workers' memory.
+if TYPE_CHECKING:
+    import torch
+
+BUCKET_BOUNDARIES = [16, 32, 64]
+
+Row = Tuple[Optional[str], object]
+
+
+def _pick(row: dict, column: Optional[str], keys: Tuple[str, ...]):
+    if column is not None:
+        return row.get(column)
+    return next((row[k] for k in keys if k in row), None)
+
+
+def read_rows(path: Path, text_column: Optional[str] = None,
+              id_column: Optional[str] = None) -> Iterator[Row]:
+    """
+    Streams the rows of an input file.
+    Args:
+        path (Path): A '.csv', '.jsonl' or '.parquet' file. JSONL rows may
+                     also be plain JSON strings.
+        text_column (str, optional): Column of the text. Defaults to the
+                     first of 'text', 'query_text' and 'body' in the row.
+        id_column (str, optional): Column of the row id. Defaults to the
+                     first of 'id' and 'request_id' in the row.
+    Returns:
+        Iterator[Row]: The id (None without one) and the text of every row.
+                     The text is None if the row cannot be parsed.
+    """
+    suffix = path.suffix.lower()
+    if suffix == '.parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError(
+                "Reading Parquet files requires pyarrow.") from e
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=1024):
+            for row in batch.to_pylist():
+                row_id = _pick(row, id_column, ID_KEYS)
+                yield (None if row_id is None else str(row_id),
+                       _pick(row, text_column, TEXT_KEYS))
+        return
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if suffix == '.csv':
+            rows = csv.DictReader(f)
+        elif suffix in ('.jsonl', '.json'):
+            rows = (_parse_json(line) for line in f if line.strip())
+        else:
+            raise ValueError(f"Unsupported input format: {path}")
+        for row in rows:
+            if not isinstance(row, dict):
+                yield None, row
+                continue
+            row_id = _pick(row, id_column, ID_KEYS)
+            yield (None if row_id in (None, '') else str(row_id),
+                   _pick(row, text_column, TEXT_KEYS))
+
+
+def _parse_json(line: str) -> object:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return None
+
+
+def load_scoring_model(model_tag: str, runtime: str = 'eager'
+                       ) -> Callable[['torch.Tensor', 'torch.Tensor'],
+                                     'torch.Tensor']:
+    """
+    Loads the model from the BentoML model store on the CPU.
+    Args:
+        model_tag (str): Tag of the Bento model.
+        runtime (str): 'eager' or 'quantized' for models saved with
+                       `bentoml.pytorch`, 'torchscript' for the TorchScript
+                       export.
+    Returns:
+        Callable[[torch.Tensor, torch.Tensor], torch.Tensor]: The forward
+                       pass, taking the padded token ids and the lengths.
+    """
+    import bentoml
+    import bentoml.pytorch
+
+    if runtime == 'torchscript':
+        model = bentoml.torchscript.load_model(model_tag, device_id='cpu')
+        model.eval()
+        return model
+    model = bentoml.pytorch.load_model(model_tag, device_id='cpu')
+    model.eval()
+    return lambda x, lengths: model(x, lengths=lengths)
+
+
+class _Writer:
+    """
+    Writes result rows as JSONL or CSV, depending on the file suffix.
+    """
+    def __init__(self, f, path: Path, top_k: int, write_header: bool):
+        self.f = f
+        self.csv = None
+        if path.suffix.lower() == '.csv':
+            fields = ['index', 'id', 'predicted_intent', 'confidence_score']
+            for rank in range(1, top_k + 1):
+                fields += [f'intent_{rank}', f'score_{rank}']
+            self.csv = csv.DictWriter(f, fields + ['error'])
+            if write_header:
+                self.csv.writeheader()
+
+    def write(self, row: dict) -> None:
+        if self.csv is None:
+            self.f.write(json.dumps(row) + '\n')
+            return
+        flat = {k: v for k, v in row.items() if k != 'top_k'}
+        for rank, (intent, score) in enumerate(row.get('top_k', []), 1):
+            flat[f'intent_{rank}'] = intent
+            flat[f'score_{rank}'] = score
+        self.csv.writerow(flat)
+
+
+def checkpoint_path(output: Path) -> Path:
+    """
+    Returns the path of the checkpoint of an output file.
+    """
+    return output.with_name(output.name + '.checkpoint.json')
+
+
+def _write_checkpoint(path: Path, state: dict) -> None:
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def score_file(input_path: Path, output_path: Path, model_tag: str,
+               runtime: str = 'eager', top_k: int = 3, workers: int = 1,
+               chunk_size: int = 256, mode: str = 'nltk',
+               fast_tables: Optional[Path] = None,
+               vocab_index: Optional[Path] = Path('data/vocab_index'),
+               vocab_path: Path = Path('data/vocab.json'),
+               text_column: Optional[str] = None,
+               id_column: Optional[str] = None,
+               resume: bool = False,
+               calibration: Optional[Path] = None,
+               max_tokens: Optional[int] = 64) -> int:
+    """
+    Scores every row of an input file into an output file.
+    Args:
+        input_path (Path): The CSV, JSONL or Parquet input, see `read_rows`.
+        output_path (Path): The '.jsonl' or '.csv' output.
+        model_tag (str): Tag of the Bento model.
+        runtime (str): Runtime of the model, see `load_scoring_model`.
+        top_k (int): Number of intents written per row.
+        workers (int): Preprocessing worker processes.
+        chunk_size (int): Rows per preprocessing chunk and model batch.
+        mode (str): Preprocessing mode, 'nltk' or 'fast'.
+        fast_tables (Path, optional): Tables of the fast preprocessing path.
+        vocab_index (Path, optional): Memory-mapped vocabulary index.
+        vocab_path (Path): The JSON vocabulary, read for the '<PAD>' index.
+        text_column (str, optional): Column of the text, see `read_rows`.
+        id_column (str, optional): Column of the row id, see `read_rows`.
+        resume (bool): Whether to continue from the checkpoint of an
+                       interrupted run.
+        calibration (Path, optional): Calibration file with the temperature
+                       of the confidence scores.
+        max_tokens (int, optional): Token ids kept per row, see
+                       `truncate_sequences`. None keeps all.
+    Returns:
+        int: Number of rows scored by this call.
+    """
+    import torch
+    from src.models.batching import batched_logits, truncate_sequences
+    from src.models.calibration import load_temperature, top_k_predictions
+
+    temperature = load_temperature(calibration)
+
+    with open(vocab_path, 'r', encoding='utf-8') as f:
+        pad_idx = json.load(f)['<PAD>']
+    forward = load_scoring_model(model_tag, runtime)
+
+    checkpoint = checkpoint_path(output_path)
+    state = {'input': str(input_path), 'rows': 0, 'output_bytes': 0}
+    if resume and checkpoint.exists():
+        with open(checkpoint, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state['input'] != str(input_path):
+            raise ValueError(f"{checkpoint} belongs to {state['input']}, "
+                             f"not to {input_path}")
+    elif resume:
+        print(f"No checkpoint at {checkpoint}, starting from the first row")
+
+    rows = itertools.islice(read_rows(input_path, text_column, id_column),
+                            state['rows'], None)
+    # Ids of the rows read by the pool but not yet written, bounded by the
+    # chunks in flight.
+    pending_ids = collections.deque()
+
+    def texts() -> Iterator[object]:
+        for row_id, text in rows:
+            pending_ids.append(row_id)
+            yield text
+
+    mode_flag = 'r+' if state['output_bytes'] else 'w'
+    with open(output_path, mode_flag, encoding='utf-8', newline='') as f, \
+            PreprocessingPool(workers, mode, fast_tables, vocab_index,
+                              vocab_path) as pool:
+        f.truncate(state['output_bytes'])
+        f.seek(state['output_bytes'])
+        writer = _Writer(f, output_path, top_k,
+                         write_header=not state['output_bytes'])
+        scored = 0
+        for chunk, (sequences, valid, errors) in pool.map(texts(),
+                                                         chunk_size):
+            ids = [pending_ids.popleft() for _ in chunk]
+            predictions = {}
+            if sequences:
+                with torch.no_grad():
+                    logits = batched_logits(
+                        forward, truncate_sequences(sequences, max_tokens),
+                        pad_idx, BUCKET_BOUNDARIES)
+                predictions = dict(zip(valid, top_k_predictions(
+                    logits, top_k, temperature)))
+            for offset, row_id in enumerate(ids):
+                row = {'index': state['rows'] + offset, 'id': row_id}
+                if offset in predictions:
+                    best = predictions[offset]
+                    row.update(predicted_intent=best[0][0],
+                               confidence_score=best[0][1], top_k=best)
+                else:
+                    row['error'] = errors[offset]
+                writer.write(row)
+
+            f.flush()
+            os.fsync(f.fileno())
+            state['rows'] += len(chunk)
+            state['output_bytes'] = f.tell()
+            _write_checkpoint(checkpoint, state)
+            scored += len(chunk)
+
+    checkpoint.unlink(missing_ok=True)
+    return scored
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Score a CSV, JSONL or Parquet file of queries offline.')
+    parser.add_argument('--input', type=Path, required=True)
+    parser.add_argument('--output', type=Path, required=True,
+                        help="A '.jsonl' or '.csv' file")
+    parser.add_argument('--model-tag', default='classifier:latest')
+    parser.add_argument('--runtime', default='eager',
+                        choices=('eager', 'torchscript', 'quantized'))
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--workers', type=int,
+                        default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--mode', choices=('nltk', 'fast'), default='nltk')
+    parser.add_argument('--fast-tables', type=Path,
+                        default=Path('data/fast_preprocessing.json'))
+    parser.add_argument('--vocab-index', type=Path,
+                        default=Path('data/vocab_index'))
+    parser.add_argument('--vocab', type=Path, default=Path('data/vocab.json'))
+    parser.add_argument('--text-column', default=None)
+    parser.add_argument('--id-column', default=None)
+    parser.add_argument('--calibration', type=Path, default=None,
+                        help='Calibration file written by '
+                             'src.models.calibration')
+    parser.add_argument('--max-tokens', type=int, default=64,
+                        help="Token ids kept per row, as the service's "
+                             "preprocessing.max_tokens")
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its '
+                             'checkpoint')
+    args = parser.parse_args()
+
+    count = score_file(args.input, args.output, args.model_tag, args.runtime,
+                       args.top_k, args.workers, args.chunk_size, args.mode,
+                       args.fast_tables, args.vocab_index, args.vocab,
+                       args.text_column, args.id_column, args.resume,
+                       args.calibration, args.max_tokens)
+    print(f"Scored {count} rows into {args.output}")
@@ -0,0 +1,149 @@
+"""
+Parity tests of the fast preprocessing path in `fast_text_processing.py`
+against the NLTK pipeline, `lemmatizer(clean_text(text))`.
+
+The fast path tokenizes like `word_tokenize`, so the tokens must be the
+same for every query. Its lemmas come from a table with one lemma per
+token, resolved with the token's most frequent tag in the corpus the
+table is built from, while the NLTK path tags every query in context.
+Lemmas may therefore only differ for tokens that NLTK lemmatizes
+differently in different queries of the corpus.
+
+The tests need the NLTK resources vendored by `download_nltk_data.py` and
+are skipped without them. The tables the service loads are gated by the
+same comparison on the full corpus when `build_fast_tables.py` builds
+them, see `parity_report`.
+"""
+
+from collections import Counter, defaultdict
+
+import pytest
+
+from src.data_preprocessing import text_processing
+from src.data_preprocessing.fast_text_processing import FastPreprocessor
+
+CORPUS = [
+    "I lost my card yesterday",
+    "My card was lost on holiday, what should I do?",
+    "How do I top up my account with a bank transfer?",
+    "Why was I charged twice for the same payment?",
+    "There are two charges on my statement I don't recognise.",
+    "The ATM didn't give me my cash but my account was debited",
+    "I can't find where to change my PIN.",
+    "cannot activate the new card!!",
+    "When will my transfer arrive? It's been 3 days...",
+    "Is there a fee for exchanging currencies?",
+    "The exchange rate applied to my payment was wrong",
+    "I'm trying to verify my identity but the app keeps failing",
+    "Please cancel the transaction I made this morning.",
+    "What are the limits for top-ups and withdrawals?",
+    "My refund still hasn't shown up",
+    "Where can I get a disposable virtual card?",
+    "The money I was sent is missing from my balance",
+    "I'd like to close my account",
+    "Card payment declined at the shop. Why?",
+    "How long does it take for a top up by card to go through?",
+    "{{Name}} wants to know why the direct debit was rejected",
+    "My contactless payments are not working",
+    "Someone used my card without my permission",
+    "\"Pending\" transactions are shown for days",
+    "The card I ordered hasn't arrived -- when will it be delivered?",
+]
+
+# The same queries in other casings. Both paths lowercase every token
+# before stopwords are removed and lemmas are looked up, so the casing of
+# a query must not change its tokens.
+CASINGS = [
+    ("I LOST MY CARD YESTERDAY", "I lost my card yesterday"),
+    ("Why Was I Charged Twice For The Same Payment?",
+     "Why was I charged twice for the same payment?"),
+    ("WHERE CAN I GET A DISPOSABLE VIRTUAL CARD?",
+     "Where can I get a disposable virtual card?"),
+    ("my CONTACTLESS payments are NOT working",
+     "My contactless payments are not working"),
+    ("PLEASE CANCEL THE TRANSACTION I MADE THIS MORNING.",
+     "Please cancel the transaction I made this morning."),
+]
+
+# The corpus the lemma table is built from.
+TABLE_CORPUS = CORPUS + [variant for variant, _ in CASINGS]
+
+
+def nltk_tokens(text: str) -> list:
+    cleaned = text_processing.clean_text(text)
+    return text_processing.lemmatizer(cleaned) if cleaned else []
+
+
+@pytest.fixture(scope='module', autouse=True)
+def nltk_resources():
+    try:
+        text_processing.check_nltk_resources()
+    except LookupError as e:
+        pytest.skip(str(e))
+
+
+@pytest.fixture(scope='module')
+def fast() -> FastPreprocessor:
+    from src.data_preprocessing.build_fast_tables import build_tables
+
+    # Only the lemmas of the corpus tokens are compared, so the table is
+    # built from the corpus alone, without the vocabulary.
+    tables = build_tables({}, TABLE_CORPUS)
+    return FastPreprocessor(tables['stop_words'], tables['abbreviations'],
+                            tables['lemmas'])
+
+
+@pytest.fixture(scope='module')
+def context_dependent() -> set:
+    """
+    The tokens that NLTK lemmatizes differently in different queries of
+    the corpus.
+    """
+    lemmas = defaultdict(set)
+    for text in TABLE_CORPUS:
+        tokens = text_processing.clean_text(text).split()
+        for token, lemma in zip(tokens, nltk_tokens(text)):
+            lemmas[token].add(lemma)
+    return {token for token, found in lemmas.items() if len(found) > 1}
+
+
+@pytest.mark.parametrize('text', CORPUS)
+def test_same_tokens_as_nltk(fast, text):
+    tokens = [token for token in fast.tokenize(text)
+              if token not in fast.stop_words]
+
+    assert tokens == text_processing.clean_text(text).split()
+
+
+@pytest.mark.parametrize('text', CORPUS)
+def test_same_lemmas_as_nltk(fast, context_dependent, text):
+    tokens = text_processing.clean_text(text).split()
+    expected, actual = nltk_tokens(text), fast.process(text)
+
+    assert len(actual) == len(expected)
+    different = {token for token, e, a in zip(tokens, expected, actual)
+                 if e != a}
+    assert different <= context_dependent
+
+
+def test_context_dependent_lemmas_use_the_most_frequent_tag(
+        fast, context_dependent):
+    lemmatizer = text_processing.get_wordnet_lemmatizer()
+    tags = defaultdict(Counter)
+    for text in TABLE_CORPUS:
+        cleaned = text_processing.clean_text(text)
+        tagged = text_processing.get_tagger().tag(cleaned.split())
+        for token, tag in tagged:
+            tags[token][text_processing.nltk_to_wordnet_pos(tag)] += 1
+
+    for token in context_dependent:
+        tag = tags[token].most_common(1)[0][0]
+        expected = (lemmatizer.lemmatize(token) if tag is None
+                    else lemmatizer.lemmatize(token, pos=tag))
+        assert fast.process(token) == [expected]
+
+
+@pytest.mark.parametrize('variant, text', CASINGS)
+def test_casing(fast, variant, text):
+    assert fast.process(variant) == fast.process(text)
+    assert nltk_tokens(variant) == nltk_tokens(text)
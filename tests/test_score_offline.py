@@ -0,0 +1,130 @@
+"""
+Tests of the offline scoring in `src/utils/score_offline.py`.
+
+The model is replaced with a deterministic forward pass and the rows are
+preprocessed by the fast path with small tables, so the tests need neither
+a model in the BentoML store nor the NLTK data.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+import torch
+
+from src.utils import score_offline
+from src.utils.label_mapping import label_mapping
+
+QUERIES = [
+    "I lost my card yesterday",
+    "How do I top up with a bank transfer?",
+    "",
+    "Why was I charged a fee for my cash withdrawal?",
+    "My transfer has not arrived yet",
+    "Can I change my PIN at an ATM?",
+    "The exchange rate on my payment was wrong",
+]
+
+
+TABLES = {
+    'stop_words': ['i', 'my', 'do', 'how', 'with', 'a', 'was', 'for', 'the',
+                   'has', 'not', 'yet', 'can', 'at', 'an', 'on', 'why'],
+    'abbreviations': [],
+    'lemmas': {'lost': 'lose', 'charged': 'charge', 'arrived': 'arrive'},
+    'parity': {'identical_token_ids': 1.0},
+}
+
+
+def fake_forward(x: torch.Tensor, lengths: torch.Tensor) -> torch.Tensor:
+    # Logits that depend on the token ids only, as the real model's.
+    weights = torch.arange(len(label_mapping), dtype=torch.float32)
+    return (x.sum(dim=1, keepdim=True).float() * weights) \
+        .remainder(7.0)
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    monkeypatch.setattr(score_offline, 'load_scoring_model',
+                        lambda model_tag, runtime='eager': fake_forward)
+
+
+@pytest.fixture
+def fast_tables(tmp_path) -> Path:
+    path = tmp_path / 'fast_preprocessing.json'
+    path.write_text(json.dumps(TABLES), encoding='utf-8')
+    return path
+
+
+def write_input(path: Path, queries) -> Path:
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, query in enumerate(queries):
+            f.write(json.dumps({'id': f'q{i}', 'text': query}) + '\n')
+    return path
+
+
+def read_output(path: Path) -> list:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def score(input_path: Path, output_path: Path, fast_tables: Path,
+          **kwargs) -> int:
+    return score_offline.score_file(
+        input_path, output_path, 'classifier', chunk_size=3, mode='fast',
+        fast_tables=fast_tables, vocab_index=None, **kwargs)
+
+
+def test_empty_input(tmp_path, fast_tables):
+    input_path = write_input(tmp_path / 'empty.jsonl', [])
+    output_path = tmp_path / 'out.jsonl'
+
+    assert score(input_path, output_path, fast_tables) == 0
+    assert read_output(output_path) == []
+    assert not score_offline.checkpoint_path(output_path).exists()
+
+
+def test_scores_every_row(tmp_path, fast_tables):
+    input_path = write_input(tmp_path / 'in.jsonl', QUERIES)
+    output_path = tmp_path / 'out.jsonl'
+
+    assert score(input_path, output_path, fast_tables) == len(QUERIES)
+    rows = read_output(output_path)
+    assert [row['index'] for row in rows] == list(range(len(QUERIES)))
+    assert [row['id'] for row in rows] == [f'q{i}' for i in
+                                           range(len(QUERIES))]
+    assert 'error' in rows[2]
+    assert all(len(row['top_k']) == 3 for i, row in enumerate(rows)
+               if i != 2)
+    assert not score_offline.checkpoint_path(output_path).exists()
+
+
+def test_resume_continues_after_the_checkpoint(tmp_path, fast_tables):
+    input_path = write_input(tmp_path / 'in.jsonl', QUERIES)
+    expected_path = tmp_path / 'expected.jsonl'
+    score(input_path, expected_path, fast_tables)
+    expected = expected_path.read_bytes()
+
+    # An interrupted run: the first chunk is checkpointed, and part of the
+    # second chunk was written after the checkpoint.
+    output_path = tmp_path / 'out.jsonl'
+    first_chunk = b''.join(expected.splitlines(keepends=True)[:3])
+    output_path.write_bytes(first_chunk + b'{"index": 3, "id": "q3", ')
+    score_offline.checkpoint_path(output_path).write_text(json.dumps(
+        {'input': str(input_path), 'rows': 3,
+         'output_bytes': len(first_chunk)}))
+
+    scored = score(input_path, output_path, fast_tables, resume=True)
+    assert scored == len(QUERIES) - 3
+    assert output_path.read_bytes() == expected
+    assert not score_offline.checkpoint_path(output_path).exists()
+
+
+def test_resume_rejects_the_checkpoint_of_another_input(tmp_path, fast_tables):
+    input_path = write_input(tmp_path / 'in.jsonl', QUERIES)
+    output_path = tmp_path / 'out.jsonl'
+    score_offline.checkpoint_path(output_path).write_text(json.dumps(
+        {'input': str(tmp_path / 'other.jsonl'), 'rows': 3,
+         'output_bytes': 0}))
+
+    with pytest.raises(ValueError):
+        score(input_path, output_path, fast_tables, resume=True)
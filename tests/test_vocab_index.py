@@ -0,0 +1,72 @@
+"""
+Tests of the memory-mapped vocabulary index in
+`src/data_preprocessing/vocab_index.py`.
+"""
+
+import numpy as np
+import pytest
+
+from src.data_preprocessing.text_processing import numericalize_batch
+from src.data_preprocessing.vocab_index import build_vocab_index
+from src.data_preprocessing.vocab_index import load_vocab_index
+
+VOCAB = {'<UNK>': 0, '<PAD>': 1, 'card': 2, 'lose': 3, 'café': 4,
+         'transfer': 5, 'top': 6}
+
+QUERIES = [
+    ['card'],
+    ['lose', 'card', 'unknown'],
+    ['café', 'crème', 'top'],
+    # Longer than the widest token, and with it as a prefix.
+    ['transferred', 'transfer', 'x' * 64],
+    ['<PAD>', '<UNK>', ''],
+]
+
+
+def dict_ids(tokens):
+    return [VOCAB.get(token, VOCAB['<UNK>']) for token in tokens]
+
+
+@pytest.fixture
+def index(tmp_path):
+    build_vocab_index(VOCAB, tmp_path / 'vocab_index')
+    return load_vocab_index(tmp_path / 'vocab_index')
+
+
+def test_numericalize_batch_with_non_ascii_tokens(index):
+    padded, lengths = index.numericalize_batch(
+        [['card', 'lose'], ['café', 'crème']])
+
+    assert padded.tolist() == [[2, 3], [4, 0]]
+    assert lengths.tolist() == [2, 2]
+    assert numericalize_batch(index, [['card'], ['naïve', 'café']]) \
+        == [[2], [0, 4]]
+
+
+@pytest.mark.parametrize('tokens', QUERIES)
+def test_lookup_matches_the_dict(index, tokens):
+    assert index.lookup(tokens).tolist() == dict_ids(tokens)
+    assert [index.get(token, index.unk_id) for token in tokens] \
+        == dict_ids(tokens)
+
+
+def test_numericalize_batch_matches_the_dict(index):
+    padded, lengths = index.numericalize_batch(QUERIES)
+
+    assert lengths.tolist() == [len(tokens) for tokens in QUERIES]
+    for row, tokens in zip(padded.tolist(), QUERIES):
+        expected = dict_ids(tokens)
+        assert row == expected + [VOCAB['<PAD>']] * (len(row)
+                                                     - len(expected))
+    assert numericalize_batch(index, QUERIES[:4]) \
+        == numericalize_batch(VOCAB, QUERIES[:4])
+
+
+def test_numericalize_batch_reuses_the_buffer(index):
+    buffer = np.full((8, 8), -1, dtype=np.int64)
+    padded, _ = index.numericalize_batch(QUERIES[:2], out=buffer)
+
+    assert np.shares_memory(padded, buffer)
+    assert padded.tolist() == [[2, 1, 1], [3, 2, 0]]
+    with pytest.raises(ValueError):
+        index.numericalize_batch(QUERIES, out=np.empty((2, 8), np.int64))
@@ -0,0 +1,65 @@
+"""
+Tests of the ownership of the buffer files of the write buffer in
+`src/db/write_buffer.py`.
+"""
+
+import pytest
+
+from src.db.write_buffer import WriteBuffer
+
+
+class FailingWriter:
+    """
+    A writer for a database that is down, so the rows stay buffered.
+    """
+    def __call__(self, rows):
+        raise ConnectionError('database is down')
+
+
+def make_buffer(path, written=None):
+    writers = {table: (FailingWriter() if written is None
+                       else written.setdefault(table, []).extend)
+               for table in ('user_queries', 'feedback')}
+    return WriteBuffer(path, writers, retry_interval=0.0)
+
+
+def test_a_file_is_used_by_one_buffer(tmp_path):
+    buffer = make_buffer(tmp_path / 'buffer.1.sqlite3')
+
+    with pytest.raises(RuntimeError):
+        make_buffer(tmp_path / 'buffer.1.sqlite3')
+    buffer.close()
+    make_buffer(tmp_path / 'buffer.1.sqlite3').close()
+
+
+def test_adopt_moves_the_rows_of_a_closed_buffer(tmp_path):
+    exited = make_buffer(tmp_path / 'buffer.1.sqlite3')
+    exited.put_many('user_queries', [{'id': 1}, {'id': 2}])
+    exited.put('feedback', {'query_id': 1})
+    exited.close(timeout=0.0)
+
+    written = {}
+    buffer = make_buffer(tmp_path / 'buffer.2.sqlite3', written)
+    buffer.put('user_queries', {'id': 3})
+    assert buffer.adopt(tmp_path / 'buffer.1.sqlite3') == 3
+    assert buffer.depth() == 4
+    assert list(tmp_path.glob('buffer.1.*')) == []
+
+    assert buffer.flush()
+    assert written == {'user_queries': [{'id': 3}, {'id': 1}, {'id': 2}],
+                       'feedback': [{'query_id': 1}]}
+    assert buffer.depth() == 0
+    buffer.close()
+
+
+def test_adopt_leaves_the_file_of_an_open_buffer(tmp_path):
+    other = make_buffer(tmp_path / 'buffer.1.sqlite3')
+    other.put('user_queries', {'id': 1})
+    buffer = make_buffer(tmp_path / 'buffer.2.sqlite3')
+
+    assert buffer.adopt(tmp_path / 'buffer.1.sqlite3') == 0
+    assert buffer.adopt(tmp_path / 'buffer.2.sqlite3') == 0
+    assert buffer.adopt(tmp_path / 'missing.sqlite3') == 0
+    assert other.depth() == 1 and buffer.depth() == 0
+    other.close(timeout=0.0)
+    buffer.close(timeout=0.0)